@@ -2,32 +2,9 @@
 
 import sys
 import numpy as np
-import matplotlib.pyplot as plt
 
 from PySpectralRadar import *
-
-#-------------------------------------------------------------------------------
-
-def generateFigureEightPositions(size,alinesPer8,rpt=1,outputText=False):
-    '''
-    Generates 1D list of positon pairs for use with SpectralRadar 3.X
-    createFreeformScanPattern, which takes units of mm, therefore size argument
-    is also in mm. By default, the figure-8 has dim 1 mm x 0.5 mm.
-    '''
-    if rpt > 0:
-        t = np.linspace(0,2*np.pi,alinesPer8,dtype=np.float32)
-        x = size*np.cos(t)
-        y = (size/2)*np.sin(2*t)
-        pos = np.empty(int(2*alinesPer8), dtype=np.float32)
-        plt.show()
-        pos[0::2] = x
-        pos[1::2] = y
-        posRepeated = np.tile(pos,rpt)
-        if outputText:
-            np.savetxt('scanPatternPos.txt',posRepeated)
-        return posRepeated.astype(np.float32)
-
-#-------------------------------------------------------------------------------
+from scanPatterns import figureEightPositions
 
 print('\n----------------------------------')
 print('PySpectralRadar Complex Data Demo')
@@ -66,7 +43,8 @@ size = 0.1
 ascans = 200
 repeats = 1
 
-fig8pos = generateFigureEightPositions(size,ascans,rpt=repeats,outputText=True)
+fig8pos = figureEightPositions(size,ascans,repeats=repeats).positions
+np.savetxt('scanPatternPos.txt',fig8pos)
 print('\n----------------------------------')
 print('Figure-8 Positions array:')
 print(fig8pos)
@@ -144,6 +122,7 @@ print('----------------------------------\n')
 
 clearScanPattern(scanPattern)
 clearRawData(rawDataHandle)
+clearComplexData(complexDataHandle)
 closeProcessing(proc)
 closeProbe(probe)
 closeDevice(dev)
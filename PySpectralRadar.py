@@ -6,536 +6,585 @@ Python wrapper for Thorlabs SpectralRadar SDK
 Version 0.0.3
 """
 import ctypes as C
+import os
 from enum import IntEnum
 import numpy as np
 from numpy.ctypeslib import ndpointer
 
 
+# Wrapper typedefs ------------------------------------------------------------
 
+class BOOL(C.c_int):
+    pass
 
-#Imports SpectralRadar libraries. Thorlabs software must be installed on machine
-try:
+FALSE = BOOL(0)
+TRUE = BOOL(1)
 
-    SpectralRadar = C.CDLL('C:\\Program Files\\Thorlabs\\SpectralRadar\\DLL\\SpectralRadar.dll')
+class ComplexFloat(C.Structure):
+    _fields_=(("real",C.c_float),("imag",C.c_float))
 
-    # Wrapper typedefs ------------------------------------------------------------
+# Pointer typedefs ------------------------------------------------------------
 
-    class BOOL(C.c_int):
-        pass
+class RawDataStruct(C.Structure):
+    pass
 
-    FALSE = BOOL(0)
-    TRUE = BOOL(1)
+RawDataHandle = C.POINTER(RawDataStruct)
 
-    class ComplexFloat(C.Structure):
-        _fields_=(("real",C.c_float),("imag",C.c_float))
+class DataStruct(C.Structure):
+    pass
 
-    # Pointer typedefs ------------------------------------------------------------
+DataHandle = C.POINTER(DataStruct)
 
-    class RawDataStruct(C.Structure):
-        pass
+class ComplexDataStruct(C.Structure):
+    pass
 
-    RawDataHandle = C.POINTER(RawDataStruct)
+ComplexDataHandle = C.POINTER(ComplexDataStruct)
 
-    class DataStruct(C.Structure):
-        pass
+class OCTFileStruct(C.Structure):
+    pass
 
-    DataHandle = C.POINTER(DataStruct)
+OCTFileHandle = C.POINTER(OCTFileStruct)
 
-    class ComplexDataStruct(C.Structure):
-        pass
+class BufferStruct(C.Structure):
+    pass
 
-    ComplexDataHandle = C.POINTER(ComplexDataStruct)
+BufferHandle = C.POINTER(BufferStruct)
 
-    class OCTFileStruct(C.Structure):
-        pass
+class ImageFieldStruct(C.Structure):
+    pass
 
-    OCTFileHandle = C.POINTER(OCTFileStruct)
+ImageFieldHandle = C.POINTER(ImageFieldStruct)
 
-    class BufferStruct(C.Structure):
-        pass
+class DeviceStruct(C.Structure):
+    pass
 
-    BufferHandle = C.POINTER(BufferStruct)
+OCTDeviceHandle = C.POINTER(DeviceStruct)
 
-    class ImageFieldStruct(C.Structure):
-        pass
+class ScanPatternStruct(C.Structure):
+    pass
 
-    ImageFieldHandle = C.POINTER(ImageFieldStruct)
+ScanPatternHandle = C.POINTER(ScanPatternStruct)
 
-    class DeviceStruct(C.Structure):
-        pass
+class ProcessingStruct(C.Structure):
+    pass
 
-    OCTDeviceHandle = C.POINTER(DeviceStruct)
+ProcessingHandle = C.POINTER(ProcessingStruct)
 
-    class ScanPatternStruct(C.Structure):
-        pass
+class ProbeStruct(C.Structure):
+    pass
 
-    ScanPatternHandle = C.POINTER(ScanPatternStruct)
+ProbeHandle = C.POINTER(ProbeStruct)
 
-    class ProcessingStruct(C.Structure):
-        pass
+class ColoredDataStruct(C.Structure):
+    pass
 
-    ProcessingHandle = C.POINTER(ProcessingStruct)
+ColoredDataHandle = C.POINTER(ColoredDataStruct)
 
-    class ProbeStruct(C.Structure):
-        pass
+# Enum typedefs ---------------------------------------------------------------
 
-    ProbeHandle = C.POINTER(ProbeStruct)
-
-    class BufferStruct(C.Structure):
-        pass
-
-    BufferHandle = C.POINTER(BufferStruct)
-
-    class ColoredDataStruct(C.Structure):
-        pass
+class CEnum(IntEnum):
+    """
+    A ctypes-compatible IntEnum superclass. Thanks Chris Krycho
+    www.chriskrycho.com/2015/ctypes-structures-and-dll-exports
+    """
+    @classmethod
+    def from_param(cls, obj):
+        return int(obj)
+
+class DevicePropertyFloat(CEnum):
+
+    Device_FullWellCapacity = 0
+    Device_zSpacing = 1
+    Device_zRange = 2
+    Device_SignalAmplitudeMin_dB = 3
+    Device_SignalAmplitudeLow_dB = 4
+    Device_SignalAmplitudeHigh_dB = 5
+    Device_SignalAmplitudeMax_dB = 6
+    Device_BinToElectronScaling = 7
+    Device_Temperature = 8
+    Device_SLD_OnTime_sec = 9
+    Device_CenterWavelength_nm = 10
+    Device_SpectralWidth_nm = 11
+    Device_MaxTriggerFrequency_Hz = 12
+
+class AcquisitionType(CEnum):
+
+    Acquisition_AsyncContinuous = 0
+    Acquisition_AsyncFinite = 1
+    Acquisition_Sync = 2
+
+class ProcessingFlag(CEnum):
+
+    Processing_UseOffsetErrors = 0
+    Processing_RemoveDCSpectrum = 1
+    Processing_RemoveAdvancedDCSpectrum = 2
+    Processing_UseApodization = 3
+    Processing_UseScanForApodization = 4
+    Processing_UseUndersamplingFilter = 5
+    Processing_UseDispersionCompensation = 6
+    Processing_UseDechirp = 7
+    Processing_UseExtendedAdjust = 8
+    Processing_FullRangeOutput = 9
+    Processing_FilterDC = 10
+    Processing_UseAutocorrCompensation = 11
+    Processing_UseDEFR = 12
+    Processing_OnlyWindowing = 13
+    Processing_RemoveFixedPattern = 14
+
+
+class ProbeParameterInt(CEnum):
+    Probe_ApodizationCycles = 0
+    Probe_Oversampling = 1
+    Probe_Oversampling_SlowAxis = 2
+    Probe_SpeckleReduction = 3
+
+
+class ProcessingParameterInt(CEnum):
+    Processing_SpectrumAveraging = 0
+    Processing_AScanAveraging = 1
+    Processing_BScanAveraging = 2
+    Processing_ZeroPadding = 3
+    Processing_NumberOfThreads = 4
+    Processing_FourierAveraging = 5
+
+class ScanPatternAcquisitionOrder(CEnum):
+    ScanPattern_AcqOrderFrameByFrame = 0
+    ScanPattern_AcqOrderAll = 1
+
+class ScanPatternApodizationType(CEnum):
+    ScanPattern_ApoOneForAll = 0
+    ScanPattern_ApoEachBScan = 1
+
+class DataPropertyInt(CEnum):
+
+    Data_Dimensions = 0
+    Data_Size1 = 1
+    Data_Size2 = 2
+    Data_Size3 = 3
+    Data_NumberOfElements = 4
+    Data_SizeInBytes = 5
+    Data_BytesPerElement = 6
+
+class RawDataPropertyInt(CEnum):
+
+    RawData_Size1 = 0
+    RawData_Size2 = 1
+    RawData_Size3 = 2
+    RawData_NumberOfElements = 3
+    RawData_SizeInBytes = 4
+    RawData_BytesPerElement = 5
+    RawData_LostFrames = 6
+
+class Data1DExportFormat(CEnum):
+
+    Data1DExport_RAW = 0
+    Data1DExport_TXT = 1
+    Data1DExport_CSV = 2
+    Data1DExport_TableTXT = 3
+    Data1DExport_Fits = 4
+
+class Data2DExportFormat(CEnum):
+
+    Data2DExport_SRM = 0
+    Data2DExport_RAW = 1
+    Data2DExport_TXT = 2
+    Data2DExport_CSV = 3
+    Data2DExport_TableTXT = 4
+    Data2DExport_Fits = 5
+
+class Data3DExportFormat(CEnum):
+
+    Data3DExport_SRM = 0
+    Data3DExport_RAW = 1
+    Data3DExport_TXT = 2
+    Data3DExport_CSV = 3
+    Data3DExport_VFF = 4
+    Data3DExport_VTK = 5
+    Data3DExport_Fits = 6
+    Data3DExport_TIFF = 7
+
+class ComplexDataExportFormat(CEnum):
 
-    ColoredDataHandle = C.POINTER(ColoredDataStruct)
+    ComplexDataExport_RAW = 0
 
-    # Enum typedefs ---------------------------------------------------------------
+class RawDataExportFormat(CEnum):
 
-    class CEnum(IntEnum):
-        """
-        A ctypes-compatible IntEnum superclass. Thanks Chris Krycho
-        www.chriskrycho.com/2015/ctypes-structures-and-dll-exports
-        """
-        @classmethod
-        def from_param(cls, obj):
-            return int(obj)
-
-    class DevicePropertyFloat(CEnum):
-
-        Device_FullWellCapacity = 0
-        Device_zSpacing = 1
-        Device_zRange = 2
-        Device_SignalAmplitudeMin_dB = 3
-        Device_SignalAmplitudeLow_dB = 4
-        Device_SignalAmplitudeHigh_dB = 5
-        Device_SignalAmplitudeMax_dB = 6
-        Device_BinToElectronScaling = 7
-        Device_Temperature = 8
-        Device_SLD_OnTime_sec = 9
-        Device_CenterWavelength_nm = 10
-        Device_SpectralWidth_nm = 11
-        Device_MaxTriggerFrequency_Hz = 12
-
-    class AcquisitionType(CEnum):
-
-        Acquisition_AsyncContinuous = 0
-        Acquisition_AsyncFinite = 1
-        Acquisition_Sync = 2
-
-    class ProcessingFlag(CEnum):
-
-        Processing_UseOffsetErrors = 0
-        Processing_RemoveDCSpectrum = 1
-        Processing_RemoveAdvancedDCSpectrum = 2
-        Processing_UseApodization = 3
-        Processing_UseScanForApodization = 4
-        Processing_UseUndersamplingFilter = 5
-        Processing_UseDispersionCompensation = 6
-        Processing_UseDechirp = 7
-        Processing_UseExtendedAdjust = 8
-        Processing_FullRangeOutput = 9
-        Processing_FilterDC = 10
-        Processing_UseAutocorrCompensation = 11
-        Processing_UseDEFR = 12
-        Processing_OnlyWindowing = 13
-        Processing_RemoveFixedPattern = 14
-
-
-    class ProbeParameterInt(IntEnum):
-        Probe_ApodizationCycles = 0
-        Probe_Oversampling = 1
-        Probe_Oversampling_SlowAxis = 2
-        Probe_SpeckleReduction = 3
-
-
-    class ProcessingParameterInt(CEnum):
-        Processing_SpectrumAveraging = 0
-        Processing_AScanAveraging = 1
-        Processing_BScanAveraging = 2
-        Processing_ZeroPadding = 3
-        Processing_NumberOfThreads = 4
-        Processing_FourierAveraging = 5
-
-    class ScanPatternAcquisitionOrder(CEnum):
-        ScanPattern_AcqOrderFrameByFrame = 0
-        ScanPattern_AcqOrderAll = 1
-
-    class ScanPatternApodizationType(CEnum):
-        ScanPattern_ApoOneForAll = 0
-        ScanPattern_ApoEachBScan = 1
-
-    class AcquisitionType(CEnum):
-        Acquisition_AsyncContinuous = 0
-        Acquisition_AsyncFinite = 1
-        Acquisition_Sync = 2
-
-
-    class RawDataPropertyInt(IntEnum):
-        RawData_Size1 = 0
-        RawData_Size2 = 1
-        RawData_Size3 = 2
-        RawData_NumberOfElements = 3
-        RawData_SizeInBytes = 4
-        RawData_BytesPerElement = 5
-        RawData_LostFrames = 6
-
-
-    class DataPropertyInt(CEnum):
-
-        Data_Dimensions = 0
-        Data_Size1 = 1
-        Data_Size2 = 2
-        Data_Size3 = 3
-        Data_NumberOfElements = 4
-        Data_SizeInBytes = 5
-        Data_BytesPerElement = 6
-
-    class RawDataPropertyInt(CEnum):
-
-        RawData_Size1 = 0
-        RawData_Size2 = 1
-        RawData_Size3 = 2
-        RawData_NumberOfElements = 3
-        RawData_SizeInBytes = 4
-        RawData_BytesPerElement = 5
-        RawData_LostFrames = 6
-
-    class Data1DExportFormat(CEnum):
-
-        Data1DExport_RAW = 0
-        Data1DExport_TXT = 1
-        Data1DExport_CSV = 2
-        Data1DExport_TableTXT = 3
-        Data1DExport_Fits = 4
-
-    class Data2DExportFormat(CEnum):
-
-        Data2DExport_SRM = 0
-        Data2DExport_RAW = 1
-        Data2DExport_TXT = 2
-        Data2DExport_CSV = 3
-        Data2DExport_TableTXT = 4
-        Data2DExport_Fits = 5
+    RawDataExport_RAW = 0
+    RawDataExport_SRR = 1
 
-    class Data3DExportFormat(CEnum):
-
-        Data3DExport_SRM = 0
-        Data3DExport_RAW = 1
-        Data3DExport_TXT = 2
-        Data3DExport_CSV = 3
-        Data3DExport_VFF = 4
-        Data3DExport_VTK = 5
-        Data3DExport_Fits = 6
-        Data3DExport_TIFF = 7
-
-    class ComplexDataExportFormat(CEnum):
+class Direction(CEnum):
+
+    Direction_1 = 0
+    Direction_2 = 1
+    Direction_3 = 2
+
+class Device_TriggerType(CEnum):
 
-        ComplexDataExport_RAW = 0
+    Trigger_FreeRunning = 0
+    Trigger_TrigBoard_ExternalStart = 1
+    Trigger_External_AScan = 2
 
-    class RawDataExportFormat(CEnum):
+class Device_CameraPreset(CEnum):
 
-        RawDataExport_RAW = 0
-        RawDataExport_SRR = 1
+    Device_CameraPreset_Default = 0
+    Device_CameraPreset_1 = 1
+    Device_CameraPreset_2 = 2
+    Device_CameraPreset_3 = 3
+    Device_CameraPreset_4 = 4
 
-    class Direction(CEnum):
+# Foreign function signatures -------------------------------------------------
 
-        Direction_1 = 0
-        Direction_2 = 1
-        Direction_3 = 2
+"""
+Declarative table of the DLL functions used by the wrappers below, in the
+form 'functionName': ([argtypes], restype). A function is looked up in the
+DLL and given its signature the first time it is called, so importing this
+module never touches the DLL.
+"""
 
-    class Device_TriggerType(CEnum):
+_SIGNATURES = {
+    'initDevice': ([], OCTDeviceHandle),
+    'getError': ([C.c_char_p, C.c_int], C.c_int),
+    'initProbe': ([OCTDeviceHandle, C.c_char_p], ProbeHandle),
+    'createProcessingForDevice': ([OCTDeviceHandle], ProcessingHandle),
+    'setDevicePreset': ([OCTDeviceHandle, C.c_int, ProbeHandle, ProcessingHandle, C.c_int], C.c_int),
+    'setComplexDataOutput': ([ProcessingHandle, ComplexDataHandle], C.c_int),
+    'executeProcessing': ([ProcessingHandle, RawDataHandle], C.c_int),
+    'createNoScanPattern': ([ProbeHandle, C.c_int, C.c_int], ScanPatternHandle),
+    'createBScanPattern': ([ProbeHandle, C.c_double, C.c_int, BOOL], ScanPatternHandle),
+    'createFreeformScanPattern': ([ProbeHandle, ndpointer(dtype=np.float32, ndim=1, flags='C_CONTIGUOUS'), C.c_int, C.c_int, BOOL], ScanPatternHandle),
+    'rotateScanPattern': ([ScanPatternHandle, C.c_double], C.c_int),
+    'createVolumePattern': ([ProbeHandle, C.c_double, C.c_int, C.c_double, C.c_int, ScanPatternApodizationType, ScanPatternAcquisitionOrder], ScanPatternHandle),
+    'getWavelengthAtPixel': ([OCTDeviceHandle, C.c_int], C.c_double),
+    'getDevicePropertyFloat': ([OCTDeviceHandle, DevicePropertyFloat], C.c_float),
+    'getScanPatternLUT': ([ScanPatternHandle, ndpointer(dtype=np.float64, ndim=1, flags='C_CONTIGUOUS'), ndpointer(dtype=np.float64, ndim=1, flags='C_CONTIGUOUS')], C.c_int),
+    'createData': ([], DataHandle),
+    'createRawData': ([], RawDataHandle),
+    'createComplexData': ([], ComplexDataHandle),
+    'getRawData': ([OCTDeviceHandle, RawDataHandle], C.c_int),
+    'appendRawData': ([RawDataHandle, RawDataHandle, Direction], C.c_int),
+    'getRawDataEx': ([OCTDeviceHandle, RawDataHandle, C.c_int], RawDataHandle),
+    'getComplexDataPropertyInt': ([ComplexDataHandle, DataPropertyInt], C.c_int),
+    'getDataPropertyInt': ([DataHandle, DataPropertyInt], C.c_int),
+    'getRawDataPropertyInt': ([RawDataHandle, RawDataPropertyInt], C.c_int),
+    'startMeasurement': ([OCTDeviceHandle, ScanPatternHandle, AcquisitionType], C.c_int),
+    'stopMeasurement': ([OCTDeviceHandle], C.c_int),
+    'closeDevice': ([OCTDeviceHandle], C.c_int),
+    'clearProcessing': ([ProcessingHandle], C.c_int),
+    'clearData': ([DataHandle], C.c_int),
+    'clearRawData': ([RawDataHandle], C.c_int),
+    'clearComplexData': ([ComplexDataHandle], C.c_int),
+    'setProcessingFlag': ([ProcessingHandle, ProcessingFlag, BOOL], C.c_int),
+    'setProbeParameterInt': ([ProbeHandle, ProbeParameterInt, C.c_int], C.c_int),
+    'setProcessingParameterInt': ([ProcessingHandle, ProcessingParameterInt, C.c_int], C.c_int),
+    'setProcessedDataOutput': ([ProcessingHandle, DataHandle], None),
+    'expectedAcquisitionTime_s': ([ScanPatternHandle, OCTDeviceHandle], C.c_double),
+    'determineSurface': ([DataHandle, DataHandle], None),
+    'setTriggerMode': ([OCTDeviceHandle, Device_TriggerType], C.c_int),
+    'createMemoryBuffer': ([], BufferHandle),
+    'appendToBuffer': ([BufferHandle, DataHandle, ColoredDataHandle], C.c_int),
+    'clearBuffer': ([BufferHandle], C.c_int),
+    'exportRawData': ([RawDataHandle, RawDataExportFormat, C.c_wchar_p], C.c_int),
+    'exportComplexData': ([ComplexDataHandle, ComplexDataExportFormat, C.c_wchar_p], C.c_int),
+    'clearScanPattern': ([ScanPatternHandle], C.c_int),
+    'closeProbe': ([ProbeHandle], C.c_int),
+    'copyComplexDataContent': ([ComplexDataHandle, ndpointer(dtype=np.complex64, ndim=3, flags='C_CONTIGUOUS')], C.c_int),
+    'copyRawDataContent': ([RawDataHandle, ndpointer(dtype=np.uint16, ndim=3, flags='C_CONTIGUOUS')], C.c_int),
+    'exportData1D': ([DataHandle, Data1DExportFormat, C.c_wchar_p], C.c_int),
+    'copyDataContent': ([DataHandle, ndpointer(dtype=np.float32, ndim=3, flags='C_CONTIGUOUS')], None),
+}
+
+# Backend ---------------------------------------------------------------------
 
-        Trigger_FreeRunning = 0
-        Trigger_TrigBoard_ExternalStart = 1
-        Trigger_External_AScan = 2
+"""
+Every wrapper function calls into the module-level SpectralRadar object. By
+default this is a SpectralRadarLibrary, which loads the Thorlabs DLL on first
+use from, in order of preference, the path given to it, the SPECTRALRADAR_DLL
+environment variable, or SPECTRALRADAR_DLL_PATH. setBackend replaces it with
+any object exposing the same functions, e.g.
+simulatedDevice.SimulatedSpectralRadar.
+"""
 
-    class Device_CameraPreset(CEnum):
+SPECTRALRADAR_DLL_PATH = 'C:\\Program Files\\Thorlabs\\SpectralRadar\\DLL\\SpectralRadar.dll'
 
-        Device_CameraPreset_Default = 0
-        Device_CameraPreset_1 = 1
-        Device_CameraPreset_2 = 2
-        Device_CameraPreset_3 = 3
-        Device_CameraPreset_4 = 4
+class SpectralRadarLibrary(object):
+    """
+    Lazily loaded SpectralRadar DLL. Attribute access returns the foreign
+    function with its signature from _SIGNATURES applied; bound functions
+    are cached on the instance so later calls skip this lookup.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._dll = None
 
-    #Wrapper functions ------------------------------------------------------------
+    def load(self):
+        """
+        Loads the DLL if that has not happened yet and returns it.
+        """
+        if self._dll is None:
+            path = self.path or os.environ.get('SPECTRALRADAR_DLL', SPECTRALRADAR_DLL_PATH)
+            try:
+                self._dll = C.CDLL(path)
+            except OSError as error:
+                raise OSError('PySpectralRadar: SpectralRadar DLL load failed (%s): %s' % (path, error))
+        return self._dll
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        function = getattr(self.load(), name)
+        signature = _SIGNATURES.get(name)
+        if signature is not None:
+            function.argtypes, function.restype = signature
+        setattr(self, name, function)
+        return function
+
+def loadLibrary(path=None):
+    """
+    Loads the SpectralRadar DLL now rather than on the first call, optionally
+    from another path, and makes it the backend.
+    """
+    library = SpectralRadarLibrary(path)
+    library.load()
+    setBackend(library)
+    return library
 
+def setBackend(backend):
     """
-    These are of the following format:
-        SpectralRadar.sameFunctionNameAsInAPI.argtypes = [~argument type(s) if applicable~]
-        SpectralRadar.sameFunctionNameAsInAPI.restype = [~return type if applicable~]
-        def sameFunctionNameAsInAPI(~Same argument names as API~):
-            return SpectralRadar.sameFunctionNameAsInAPI(~Same argument names as API~)
+    Routes all wrapper functions to backend, which is either a
+    SpectralRadarLibrary or an object implementing the same functions.
+    Returns the previous backend.
     """
+    global SpectralRadar
+    previous = SpectralRadar
+    SpectralRadar = backend
+    return previous
 
-    SpectralRadar.initDevice.restype = OCTDeviceHandle
-    def initDevice():
-        return SpectralRadar.initDevice()
+def getBackend():
+    return SpectralRadar
 
-    SpectralRadar.initProbe.argtypes = [OCTDeviceHandle, C.c_char_p]
-    SpectralRadar.initProbe.restype = ProbeHandle
-    def initProbe(Dev,ProbeFile):
-        ProbeFile = C.c_char_p(ProbeFile.encode('utf-8'))
-        return SpectralRadar.initProbe(Dev,ProbeFile)
+SpectralRadar = SpectralRadarLibrary()
 
-    SpectralRadar.createProcessingForDevice.restype = ProcessingHandle
-    SpectralRadar.createProcessingForDevice.argtypes = [OCTDeviceHandle]
+#Wrapper functions ------------------------------------------------------------
 
-    SpectralRadar.setDevicePreset.argtypes = [OCTDeviceHandle, C.c_int, ProbeHandle, ProcessingHandle, C.c_int]
+"""
+These are of the following format, with the signature declared in _SIGNATURES:
+    def sameFunctionNameAsInAPI(~Same argument names as API~):
+        return SpectralRadar.sameFunctionNameAsInAPI(~Same argument names as API~)
+"""
 
-    def setDevicePreset(Dev, Category, Probe, Proc, Preset):
-        return SpectralRadar.setDevicePreset(Dev, Category, Probe, Proc, Preset)
+def initDevice():
+    return SpectralRadar.initDevice()
 
+def getError(StringSize=1024):
+    """
+    :return: (ErrorCode, Message) of the last error reported by the SDK,
+        ErrorCode 0 if there was none
+    """
+    Message = C.create_string_buffer(StringSize)
+    ErrorCode = SpectralRadar.getError(Message, StringSize)
+    return ErrorCode, Message.value.decode('utf-8', 'replace')
 
-    def createProcessingForDevice(Dev):
-        return SpectralRadar.createProcessingForDevice(Dev)
+def initProbe(Dev,ProbeFile):
+    ProbeFile = C.c_char_p(ProbeFile.encode('utf-8'))
+    return SpectralRadar.initProbe(Dev,ProbeFile)
 
-    # SpectralRadar.setProcessingOutput.argtypes = [ProcessingHandle,DataHandle]
-    # def setProcessingOutput(Proc,Spectrum):
-    #     return SpectralRadar.setProcessingOutput(Proc,Spectrum)
 
-    SpectralRadar.setComplexDataOutput.argtypes = [ProcessingHandle,ComplexDataHandle]
 
-    def setComplexDataOutput(Proc,Complex):
-        return SpectralRadar.setComplexDataOutput(Proc,Complex)
+def setDevicePreset(Dev, Category, Probe, Proc, Preset):
+    return SpectralRadar.setDevicePreset(Dev, Category, Probe, Proc, Preset)
 
-    SpectralRadar.executeProcessing.argtypes = [ProcessingHandle,RawDataHandle]
-    def executeProcessing(Proc,RawData):
-        return SpectralRadar.executeProcessing(Proc,RawData)
 
-    SpectralRadar.createNoScanPattern.restype = ScanPatternHandle
-    SpectralRadar.createNoScanPattern.argtypes = [ProbeHandle,C.c_int,C.c_int]
-    def createNoScanPattern(Probe,Scans,NumberOfScans):
-        return SpectralRadar.createNoScanPattern(Probe,Scans,NumberOfScans)
+def createProcessingForDevice(Dev):
+    return SpectralRadar.createProcessingForDevice(Dev)
 
-    SpectralRadar.createBScanPattern.argtypes = [ProbeHandle,C.c_double,C.c_int,BOOL]
-    SpectralRadar.createBScanPattern.restype = ScanPatternHandle
-    def createBScanPattern(Probe,Range,AScans,apodization):
-        return SpectralRadar.createBScanPattern(Probe,Range,AScans,apodization)
+# SpectralRadar.setProcessingOutput.argtypes = [ProcessingHandle,DataHandle]
+# def setProcessingOutput(Proc,Spectrum):
+#     return SpectralRadar.setProcessingOutput(Proc,Spectrum)
 
-    SpectralRadar.createFreeformScanPattern.argtypes = [ProbeHandle,ndpointer(dtype=np.float32,ndim=1,flags='C_CONTIGUOUS'),C.c_int,C.c_int,BOOL]
-    SpectralRadar.createFreeformScanPattern.restype = ScanPatternHandle
-    def createFreeformScanPattern(Probe,positions,size_x,size_y,apodization):
-        """
-        Positions must be a numpy.float32 array of dimension 1, and must have
-        length equal to 2 * size_x * size_y. Size_x is the number of points in the
-        pattern repeated size_y times, but the positions array is taken as-is.
-        """
-        if positions.size == 2*size_x*size_y:
-            return SpectralRadar.createFreeformScanPattern(Probe,positions,size_x,size_y,apodization)
-        else:
-            print('PySpectralRadar: WARNING! Scan pattern not created!')
 
-    SpectralRadar.rotateScanPattern.argtypes = [ScanPatternHandle,C.c_double]
-    def rotateScanPattern(Pattern,Angle):
-        """
-        Changes coordinates of scanPatternHandle by angle in radians.
-        """
-        return SpectralRadar.rotateScanPattern(Pattern,Angle)
+def setComplexDataOutput(Proc,Complex):
+    return SpectralRadar.setComplexDataOutput(Proc,Complex)
 
-    SpectralRadar.createVolumePattern.restype = ScanPatternHandle
-    SpectralRadar.createVolumePattern.argtypes = [ProbeHandle,C.c_double,C.c_int,C.c_double,C.c_int]
-    def createVolumePattern(Probe,RangeX,SizeX,RangeY,SizeY):
-        return SpectralRadar.createVolumePattern(Probe,RangeX,SizeX,RangeY,SizeY)
+def executeProcessing(Proc,RawData):
+    return SpectralRadar.executeProcessing(Proc,RawData)
 
-    SpectralRadar.getWavelengthAtPixel.restype = C.c_double
-    SpectralRadar.getWavelengthAtPixel.argtypes = [OCTDeviceHandle,C.c_int]
-    def getWavelengthAtPixel(Dev,Pixel):
-        return SpectralRadar.getWavelengthAtPixel(Dev,Pixel)
+def createNoScanPattern(Probe,Scans,NumberOfScans):
+    return SpectralRadar.createNoScanPattern(Probe,Scans,NumberOfScans)
 
-    SpectralRadar.getDevicePropertyFloat.restype = C.c_float
-    SpectralRadar.getDevicePropertyFloat.argtypes = [OCTDeviceHandle,DevicePropertyFloat]
-    def getDevicePropertyFloat(Dev,Selection):
-        return SpectralRadar.getDevicePropertyFloat(Dev,Selection)
+def createBScanPattern(Probe,Range,AScans,apodization):
+    return SpectralRadar.createBScanPattern(Probe,Range,AScans,apodization)
 
-    SpectralRadar.getScanPatternLUT.argtypes = [ScanPatternHandle,ndpointer(dtype=np.float64,ndim=1,flags='C_CONTIGUOUS'),ndpointer(dtype=np.float64,ndim=1,flags='C_CONTIGUOUS')]
-    def getScanPatternLUT(Pattern,PosX,PosY):
-        """
-        Replaces PosX and PosY arrays with X and Y coordinates of scan pattern from
-        scanner LUT.
-        """
-        SpectralRadar.getScanPatternLUT(Pattern,PosX,PosY)
+def createFreeformScanPattern(Probe,positions,size_x,size_y,apodization):
+    """
+    Positions must be a numpy.float32 array of dimension 1, and must have
+    length equal to 2 * size_x * size_y. Size_x is the number of points in the
+    pattern repeated size_y times, but the positions array is taken as-is.
+    """
+    if positions.size == 2*size_x*size_y:
+        return SpectralRadar.createFreeformScanPattern(Probe,positions,size_x,size_y,apodization)
+    else:
+        print('PySpectralRadar: WARNING! Scan pattern not created!')
 
-    SpectralRadar.createData.restype = DataHandle
-    def createData():
-        return SpectralRadar.createData()
+def rotateScanPattern(Pattern,Angle):
+    """
+    Changes coordinates of scanPatternHandle by angle in radians.
+    """
+    return SpectralRadar.rotateScanPattern(Pattern,Angle)
 
-    SpectralRadar.createRawData.restype = RawDataHandle
-    def createRawData():
-        return SpectralRadar.createRawData()
+def createVolumePattern(Probe,RangeX,SizeX,RangeY,SizeY,
+                        ApoType=ScanPatternApodizationType.ScanPattern_ApoOneForAll,
+                        AcqOrder=ScanPatternAcquisitionOrder.ScanPattern_AcqOrderFrameByFrame):
+    return SpectralRadar.createVolumePattern(Probe,RangeX,SizeX,RangeY,SizeY,ApoType,AcqOrder)
 
-    SpectralRadar.createComplexData.restype = ComplexDataHandle
-    def createComplexData():
-        return SpectralRadar.createComplexData()
+def getWavelengthAtPixel(Dev,Pixel):
+    return SpectralRadar.getWavelengthAtPixel(Dev,Pixel)
 
-    SpectralRadar.getRawData.argtypes = [OCTDeviceHandle,RawDataHandle]
-    def getRawData(Dev,RawData):
-        return SpectralRadar.getRawData(Dev,RawData)
+def getDevicePropertyFloat(Dev,Selection):
+    return SpectralRadar.getDevicePropertyFloat(Dev,Selection)
 
-    SpectralRadar.appendRawData.argtypes = [RawDataHandle,RawDataHandle,Direction]
-    def appendRawData(Data,DataToAppend,Direction):
-        return SpectralRadar.appendRawData(Data,DataToAppend,Direction)
+def getScanPatternLUT(Pattern,PosX,PosY):
+    """
+    Replaces PosX and PosY arrays with X and Y coordinates of scan pattern from
+    scanner LUT.
+    """
+    SpectralRadar.getScanPatternLUT(Pattern,PosX,PosY)
 
-    SpectralRadar.getRawDataEx.restype = RawDataHandle
-    SpectralRadar.getRawDataEx.argtypes = [OCTDeviceHandle,RawDataHandle,C.c_int]
-    def getRawDataEx(Dev,RawData,CameraIdx):
-        return SpectralRadar.getRawDataEx(Dev,RawData,CameraIdx)
+def createData():
+    return SpectralRadar.createData()
 
-    SpectralRadar.getComplexDataPropertyInt.argtypes = [ComplexDataHandle,DataPropertyInt]
-    def getComplexDataPropertyInt(Data,Selection):
-        return SpectralRadar.getComplexDataPropertyInt(Data,Selection)
+def createRawData():
+    return SpectralRadar.createRawData()
 
-    SpectralRadar.getDataPropertyInt.argtypes = [DataHandle,DataPropertyInt]
-    SpectralRadar.getDataPropertyInt.restype = C.c_int
-    def getDataPropertyInt(Data,Selection):
-        return SpectralRadar.getDataPropertyInt(Data,Selection)
+def createComplexData():
+    return SpectralRadar.createComplexData()
 
-    SpectralRadar.getRawDataPropertyInt.argtypes = [RawDataHandle,RawDataPropertyInt]
-    SpectralRadar.getRawDataPropertyInt.restype = C.c_int
-    def getRawDataPropertyInt(RawData,Selection):
-        return SpectralRadar.getRawDataPropertyInt(RawData,Selection)
+def getRawData(Dev,RawData):
+    return SpectralRadar.getRawData(Dev,RawData)
 
-    SpectralRadar.startMeasurement.argtypes = [OCTDeviceHandle,ScanPatternHandle,AcquisitionType]
-    def startMeasurement(Dev,Pattern,Type): #Note: named lowercase 'type' in C, which is reserved in Python
-        return SpectralRadar.startMeasurement(Dev,Pattern,Type)
+def appendRawData(Data,DataToAppend,Direction):
+    return SpectralRadar.appendRawData(Data,DataToAppend,Direction)
 
-    SpectralRadar.stopMeasurement.argtypes = [OCTDeviceHandle]
-    def stopMeasurement(Dev):
-        return SpectralRadar.stopMeasurement(Dev)
+def getRawDataEx(Dev,RawData,CameraIdx):
+    return SpectralRadar.getRawDataEx(Dev,RawData,CameraIdx)
 
-    SpectralRadar.closeDevice.argtypes = [OCTDeviceHandle]
-    def closeDevice(Dev):
-        return SpectralRadar.closeDevice(Dev)
+def getComplexDataPropertyInt(Data,Selection):
+    return SpectralRadar.getComplexDataPropertyInt(Data,Selection)
 
-    SpectralRadar.clearProcessing.argtypes = [ProcessingHandle]
-    def clearProcessing(Proc):
-        return SpectralRadar.clearProcessing(Proc)
+def getDataPropertyInt(Data,Selection):
+    return SpectralRadar.getDataPropertyInt(Data,Selection)
 
-    SpectralRadar.clearData.argtypes = [DataHandle]
-    def clearData(Data):
-        return SpectralRadar.clearData(Data)
+def getRawDataPropertyInt(RawData,Selection):
+    return SpectralRadar.getRawDataPropertyInt(RawData,Selection)
 
-    SpectralRadar.clearRawData.argtypes = [RawDataHandle]
-    def clearRawData(RawData):
-        return SpectralRadar.clearRawData(RawData)
+def startMeasurement(Dev,Pattern,Type): #Note: named lowercase 'type' in C, which is reserved in Python
+    return SpectralRadar.startMeasurement(Dev,Pattern,Type)
 
-    SpectralRadar.clearComplexData.argtypes = [ComplexDataHandle]
-    def clearComplexData(ComplexData):
-        return SpectralRadar.clearComplexData(ComplexData)
+def stopMeasurement(Dev):
+    return SpectralRadar.stopMeasurement(Dev)
 
-    SpectralRadar.setProcessingFlag.argtypes = [ProcessingHandle,ProcessingFlag,BOOL]
-    def setProcessingFlag(Proc,Flag,Value):
-        return SpectralRadar.setProcessingFlag(Proc,Flag,Value)
+def closeDevice(Dev):
+    return SpectralRadar.closeDevice(Dev)
 
-    SpectralRadar.setProbeParameterInt.argtypes = [ProbeHandle,ProbeParameterInt,C.c_int]
-    def setProbeParameterInt(Probe,Selection,Value):
-        return SpectralRadar.setProbeParameterInt(Probe,Selection,Value)
+def clearProcessing(Proc):
+    return SpectralRadar.clearProcessing(Proc)
 
+def clearData(Data):
+    return SpectralRadar.clearData(Data)
 
-    SpectralRadar.setProcessingParameterInt.argtypes = [ProcessingHandle, ProcessingParameterInt, C.c_int]
-    def setProcessingParameterInt(Proc, Selection, Value):
-        SpectralRadar.setProcessingParameterInt(Proc, Selection, Value)
+def clearRawData(RawData):
+    return SpectralRadar.clearRawData(RawData)
 
+def clearComplexData(ComplexData):
+    return SpectralRadar.clearComplexData(ComplexData)
 
-    SpectralRadar.setProcessedDataOutput.argtypes = [ProcessingHandle, DataHandle]
-    SpectralRadar.setProcessedDataOutput.restype = None
-    def setProcessedDataOutput(Proc, Scan):
-        SpectralRadar.setProcessedDataOutput(Proc, Scan)
+def setProcessingFlag(Proc,Flag,Value):
+    return SpectralRadar.setProcessingFlag(Proc,Flag,Value)
 
-    SpectralRadar.expectedAcquisitionTime_s.argtypes = [ScanPatternHandle, OCTDeviceHandle]
-    SpectralRadar.expectedAcquisitionTime_s.restype = C.c_double
-    def expectedAcquisitionTime_s(ScanPattern, Dev):
-        return SpectralRadar.expectedAcquisitionTime_s(ScanPattern, Dev)
+def setProbeParameterInt(Probe,Selection,Value):
+    return SpectralRadar.setProbeParameterInt(Probe,Selection,Value)
 
 
-    SpectralRadar.determineSurface.argtypes = [DataHandle, DataHandle]
-    SpectralRadar.determineSurface.restype = None
-    def determineSurface(Volume, Surface):
-        SpectralRadar.determineSurface(Volume, Surface)
+def setProcessingParameterInt(Proc, Selection, Value):
+    SpectralRadar.setProcessingParameterInt(Proc, Selection, Value)
 
 
-    SpectralRadar.setTriggerMode.argtypes = [OCTDeviceHandle,Device_TriggerType]
-    def setTriggerMode(Dev,TriggerMode):
-        return SpectralRadar.setTriggerMode(Dev,TriggerMode)
+def setProcessedDataOutput(Proc, Scan):
+    SpectralRadar.setProcessedDataOutput(Proc, Scan)
 
+def expectedAcquisitionTime_s(ScanPattern, Dev):
+    return SpectralRadar.expectedAcquisitionTime_s(ScanPattern, Dev)
 
-    SpectralRadar.createMemoryBuffer.restype = BufferHandle
-    def createMemoryBuffer():
-        return SpectralRadar.createMemoryBuffer()
 
-    SpectralRadar.appendToBuffer.argtypes = [BufferHandle,DataHandle,ColoredDataHandle]
-    def appendToBuffer(Buffer,Data,ColoredData):
-        return SpectralRadar.appendToBuffer(Buffer,Data,ColoredData)
+def determineSurface(Volume, Surface):
+    SpectralRadar.determineSurface(Volume, Surface)
 
-    SpectralRadar.clearBuffer.argtypes = [BufferHandle]
-    def clearBuffer(Buffer):
-        return SpectralRadar.clearBuffer(Buffer)
 
-    SpectralRadar.exportRawData.argtypes = [RawDataHandle,RawDataExportFormat,C.c_wchar_p]
-    def exportRawData(Raw,Format,Path):
-        return SpectralRadar.exportRawData(Raw,Format,Path)
+def setTriggerMode(Dev,TriggerMode):
+    return SpectralRadar.setTriggerMode(Dev,TriggerMode)
 
-    SpectralRadar.exportComplexData.argtypes = [ComplexDataHandle,ComplexDataExportFormat,C.c_wchar_p]
-    def exportComplexData(ComplexData,Format,Path):
-        return SpectralRadar.exportComplexData(ComplexData,Format,Path)
 
-    SpectralRadar.exportData.argtypes = [DataHandle,Data1DExportFormat,C.c_wchar_p]
-    def exportData(Data,Format,Path):
-        return SpectralRadar.exportData1D(Data,Format,Path)
+def createMemoryBuffer():
+    return SpectralRadar.createMemoryBuffer()
 
-    SpectralRadar.clearScanPattern.argtypes = [ScanPatternHandle]
-    def clearScanPattern(Pattern):
-        return SpectralRadar.clearScanPattern(Pattern)
+def appendToBuffer(Buffer,Data,ColoredData):
+    return SpectralRadar.appendToBuffer(Buffer,Data,ColoredData)
 
-    SpectralRadar.clearProcessing.argtypes = [ProcessingHandle]
-    def clearProcessing(Proc):
-        return SpectralRadar.clearProcessing(Proc)
+def clearBuffer(Buffer):
+    return SpectralRadar.clearBuffer(Buffer)
 
-    SpectralRadar.closeDevice.argtypes = [OCTDeviceHandle]
-    def closeDevice(Dev):
-        return SpectralRadar.closeDevice(Dev)
+def exportRawData(Raw,Format,Path):
+    return SpectralRadar.exportRawData(Raw,Format,Path)
 
-    SpectralRadar.closeProbe.argtypes = [ProbeHandle]
-    def closeProbe(Probe):
-        return SpectralRadar.closeProbe(Probe)
+def exportComplexData(ComplexData,Format,Path):
+    return SpectralRadar.exportComplexData(ComplexData,Format,Path)
 
-    SpectralRadar.copyComplexDataContent.argtypes = [ComplexDataHandle,ndpointer(dtype=np.complex64,ndim=3,flags='C_CONTIGUOUS')]    
-    def copyComplexDataContent(ComplexDataSource,DataContent):
-        """
-        Copies complex processed data out of the ComplexDataSource and into the
-        numpy object DataContent, which uses PySpectralRadar ctypes structure
-        ComplexFloat to hold two 16 bit floats in fields 'real' and 'imag'
-        Note: usurps copyComplexDataContent in the wrapper namespace. If you would
-        like to move the data to a raw pointer rather than a numpy array, take care
-        to call the original function.
-        """
-        return SpectralRadar.copyComplexDataContent(ComplexDataSource,DataContent)
+def exportData(Data,Format,Path):
+    return SpectralRadar.exportData1D(Data,Format,Path)
 
-    SpectralRadar.copyRawDataContent.argtypes = [RawDataHandle,ndpointer(dtype=np.uint16,ndim=3,flags='C_CONTIGUOUS')]
-    def copyRawDataContent(RawDataSource,DataContent):
-        """
-        Copies raw data out of the RawDataSource and into the numpy
-        object DataContent. DataContent MUST match the dimensions of the
-        RawDataSource (use getRawDataPropertyInt and be of type numpy.uint16)
-        Note: usurps copyRawDataContent in the wrapper namespace. If you would
-        like to move the data to a raw pointer rather than a numpy array, take care
-        to call the original function.
-        """
-        SpectralRadar.copyRawDataContent(RawDataSource,DataContent)
+def clearScanPattern(Pattern):
+    return SpectralRadar.clearScanPattern(Pattern)
 
-    def getRawDataShape(rawDataHandle):
-        """
-        :param rawDataHandle: SpectralRadar raw data handle object
-        :return: 3D shape of raw data
-        """
-        prop = RawDataPropertyInt
-        rawSize1 = getRawDataPropertyInt(rawDataHandle,prop.RawData_Size1)
-        rawSize2 = getRawDataPropertyInt(rawDataHandle,prop.RawData_Size2)
-        rawSize3 = getRawDataPropertyInt(rawDataHandle,prop.RawData_Size3)
+def closeProbe(Probe):
+    return SpectralRadar.closeProbe(Probe)
+
+def copyComplexDataContent(ComplexDataSource,DataContent):
+    """
+    Copies complex processed data out of the ComplexDataSource and into the
+    numpy object DataContent, which uses PySpectralRadar ctypes structure
+    ComplexFloat to hold two 16 bit floats in fields 'real' and 'imag'
+    Note: usurps copyComplexDataContent in the wrapper namespace. If you would
+    like to move the data to a raw pointer rather than a numpy array, take care
+    to call the original function.
+    """
+    return SpectralRadar.copyComplexDataContent(ComplexDataSource,DataContent)
+
+def copyDataContent(DataSource,DataContent):
+    """
+    Copies processed data out of the DataSource and into the numpy object
+    DataContent, which MUST be a numpy.float32 array matching the dimensions
+    of the DataSource (use getDataPropertyInt).
+    """
+    SpectralRadar.copyDataContent(DataSource,DataContent)
 
-        return np.array([rawSize1,rawSize2,rawSize3])
+def copyRawDataContent(RawDataSource,DataContent):
+    """
+    Copies raw data out of the RawDataSource and into the numpy
+    object DataContent. DataContent MUST match the dimensions of the
+    RawDataSource (use getRawDataPropertyInt and be of type numpy.uint16)
+    Note: usurps copyRawDataContent in the wrapper namespace. If you would
+    like to move the data to a raw pointer rather than a numpy array, take care
+    to call the original function.
+    """
+    SpectralRadar.copyRawDataContent(RawDataSource,DataContent)
 
-except OSError:
+def getRawDataShape(rawDataHandle):
+    """
+    :param rawDataHandle: SpectralRadar raw data handle object
+    :return: 3D shape of raw data
+    """
+    prop = RawDataPropertyInt
+    rawSize1 = getRawDataPropertyInt(rawDataHandle,prop.RawData_Size1)
+    rawSize2 = getRawDataPropertyInt(rawDataHandle,prop.RawData_Size2)
+    rawSize3 = getRawDataPropertyInt(rawDataHandle,prop.RawData_Size3)
 
-    print('PySpectralRadar: SpectralRadar DLL load failed.')
+    return np.array([rawSize1,rawSize2,rawSize3])
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Continuous acquisition on a background thread.
+
+AcquisitionStream calls getRawData in a dedicated thread (the DLL call
+releases the GIL) and copies each frame into a FrameRing slot, which is put
+on a bounded queue. Any number of consumer threads can take frames off the
+queue, process or store them, and release them:
+
+    with AcquisitionStream(Dev, Pattern) as stream:
+        for frame in stream:
+            process(frame.data)
+            frame.release()
+"""
+import queue
+import threading
+import time
+
+import PySpectralRadar as SR
+from dataLayout import LayoutCache
+from frameRing import FrameRing
+
+_END = None
+
+
+class Frame(object):
+    """
+    One acquired raw frame. data is a FrameRing slot and is only valid until
+    release is called.
+    """
+    __slots__ = ('index', 'data', 'lostFrames', 'timestamp', '_ring')
+
+    def __init__(self, index, data, lostFrames, timestamp, ring):
+        self.index = index
+        self.data = data
+        self.lostFrames = lostFrames
+        self.timestamp = timestamp
+        self._ring = ring
+
+    def release(self):
+        if self._ring is not None:
+            self._ring.release(self.data)
+            self._ring = None
+            self.data = None
+
+
+class AcquisitionStream(object):
+    """
+    Producer thread running startMeasurement / getRawData /
+    copyRawDataContent until stop is called.
+
+    Backpressure: by default the producer waits for a free FrameRing slot,
+    so frames that cannot be buffered are lost on the device side and show
+    up in lostFrames (RawData_LostFrames). With dropWhenFull the producer
+    keeps reading from the device and drops frames itself instead; those
+    are counted in droppedFrames.
+    """
+
+    def __init__(self, Dev, Pattern, slots=8, dropWhenFull=False,
+                 Type=SR.AcquisitionType.Acquisition_AsyncContinuous, layouts=None, monitor=None):
+        """
+        :param Dev: OCTDeviceHandle
+        :param Pattern: ScanPatternHandle to acquire continuously
+        :param slots: frames buffered between producer and consumers
+        :param dropWhenFull: drop frames instead of waiting when every slot is
+            in use
+        :param layouts: LayoutCache shared with other streams on the same
+            pattern, so restarting does not query the frame shape again
+        :param monitor: throughputMonitor.ThroughputMonitor updated with every
+            frame read from the device
+        """
+        self.Dev = Dev
+        self.Pattern = Pattern
+        self.Type = Type
+        self.slots = slots
+        self.dropWhenFull = dropWhenFull
+        self.layouts = layouts if layouts is not None else LayoutCache()
+        self.monitor = monitor
+        self.ring = None
+        self.framesAcquired = 0
+        self.lostFrames = 0
+        self.droppedFrames = 0
+        self._queue = queue.Queue(maxsize=slots + 1)
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self._error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __iter__(self):
+        while True:
+            frame = self.get()
+            if frame is None:
+                return
+            yield frame
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError('PySpectralRadar: AcquisitionStream already started')
+        self._thread = threading.Thread(target=self._run, name='AcquisitionStream', daemon=True)
+        self._thread.start()
+
+    def _acquireSlot(self):
+        if self.dropWhenFull:
+            return self.ring.acquire(block=False)
+        while not self._stopEvent.is_set():
+            slot = self.ring.acquire(timeout=0.1)
+            if slot is not None:
+                return slot
+        return None
+
+    def _run(self):
+        RawData = SR.createRawData()
+        try:
+            SR.startMeasurement(self.Dev, self.Pattern, self.Type)
+            index = 0
+            while not self._stopEvent.is_set():
+                SR.getRawData(self.Dev, RawData)
+                timestamp = time.perf_counter()
+                lost = SR.getRawDataPropertyInt(RawData, SR.RawDataPropertyInt.RawData_LostFrames)
+                self.lostFrames += lost
+                index += lost
+                if self.monitor is not None:
+                    self.monitor.update(lost, timestamp)
+                if self.ring is None:
+                    layout = self.layouts.raw(self.Pattern, RawData)
+                    self.ring = FrameRing(layout.shape, layout.dtype, self.slots)
+                slot = self._acquireSlot()
+                if slot is None:
+                    if not self._stopEvent.is_set():
+                        self.droppedFrames += 1
+                    index += 1
+                    continue
+                SR.copyRawDataContent(RawData, slot)
+                self._queue.put(Frame(index, slot, lost, timestamp, self.ring))
+                self.framesAcquired += 1
+                index += 1
+        except Exception as error:
+            self._error = error
+        finally:
+            try:
+                SR.stopMeasurement(self.Dev)
+            finally:
+                SR.clearRawData(RawData)
+                self._queue.put(_END)
+
+    def get(self, timeout=None):
+        """
+        :return: the next Frame, or None once the stream has stopped and every
+            queued frame has been taken
+        :raises queue.Empty: if timeout expires first
+        """
+        frame = self._queue.get(timeout=timeout)
+        if frame is _END:
+            # Let the other consumers see the end of the stream as well
+            self._queue.put(_END)
+            if self._error is not None:
+                raise self._error
+        return frame
+
+    def stop(self, timeout=None):
+        """
+        Stops the producer, which calls stopMeasurement. Frames still queued
+        can be taken with get afterwards.
+        """
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
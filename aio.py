@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio front-end for the blocking acquisition and processing calls.
+
+Each call runs on a single-thread executor belonging to its device, so the
+event loop stays responsive during getRawData / executeProcessing, and calls
+for one device are still executed one at a time and in order:
+
+    RawData = createRawData()
+    await aio.startMeasurement(Dev, Pattern, AcquisitionType.Acquisition_AsyncContinuous)
+    await aio.getRawData(Dev, RawData)
+    await aio.stopMeasurement(Dev)
+
+AsyncSession does the same for an OCTSession and streams frames:
+
+    session = AsyncSession(OCTSession())
+    async for frame in session.frames(Pattern):
+        process(frame.data)
+        frame.release()
+
+Leaving or cancelling the loop stops the measurement. Because stopMeasurement
+goes through the same executor, it only runs once a getRawData still in
+flight has returned.
+"""
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import PySpectralRadar as SR
+from acquisitionStream import Frame
+from dataLayout import handleKey
+from frameRing import FrameRing
+
+_executors = {}
+_executorsLock = threading.Lock()
+
+
+def deviceExecutor(Dev):
+    """
+    :return: the single-thread executor the calls for Dev run on, created on
+        first use
+    """
+    key = handleKey(Dev)
+    with _executorsLock:
+        executor = _executors.get(key)
+        if executor is None:
+            executor = _executors[key] = ThreadPoolExecutor(1, thread_name_prefix='SpectralRadar')
+        return executor
+
+
+def closeDeviceExecutor(Dev):
+    """
+    Shuts down the executor of Dev after its pending calls, e.g. before
+    closeDevice.
+    """
+    with _executorsLock:
+        executor = _executors.pop(handleKey(Dev), None)
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+async def call(Dev, function, *args):
+    """
+    Runs function(*args) on the executor of Dev and waits for the result.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(deviceExecutor(Dev), functools.partial(function, *args))
+
+
+async def startMeasurement(Dev, Pattern, Type):
+    return await call(Dev, SR.startMeasurement, Dev, Pattern, Type)
+
+
+async def getRawData(Dev, RawData):
+    return await call(Dev, SR.getRawData, Dev, RawData)
+
+
+async def stopMeasurement(Dev):
+    return await call(Dev, SR.stopMeasurement, Dev)
+
+
+async def executeProcessing(Dev, Proc, RawData):
+    """
+    executeProcessing on the executor of the device Proc belongs to.
+    """
+    return await call(Dev, SR.executeProcessing, Proc, RawData)
+
+
+async def copyRawDataContent(Dev, RawDataSource, DataContent):
+    """
+    copyRawDataContent ordered after the getRawData calls of Dev.
+    """
+    return await call(Dev, SR.copyRawDataContent, RawDataSource, DataContent)
+
+
+class AsyncSession(object):
+    """
+    Awaitable access to an OCTSession. All calls run in order on one thread
+    owned by this object, so a reconnect, which replaces the device handle,
+    stays serialized with the acquisitions.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='OCTSession')
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Runs function(*args, **kwargs) on the session thread.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    async def open(self):
+        await self.run(self.session.open)
+
+    async def close(self):
+        await self.run(self.session.close)
+        self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def acquire_volume(self, RangeX, SizeX, RangeY, SizeY, out=None):
+        """
+        See OCTSession.acquire_volume.
+        """
+        return await self.run(self.session.acquire_volume, RangeX, SizeX, RangeY, SizeY, out)
+
+    async def acquire_surface(self, RangeX, SizeX, RangeY, SizeY, **detectOptions):
+        """
+        See OCTSession.acquire_surface.
+        """
+        return await self.run(self.session.acquire_surface, RangeX, SizeX, RangeY, SizeY, **detectOptions)
+
+    def _nextFrame(self, RawData):
+        SR.getRawData(self.session.Dev, RawData)
+        timestamp = time.perf_counter()
+        return timestamp, SR.getRawDataPropertyInt(RawData, SR.RawDataPropertyInt.RawData_LostFrames)
+
+    def _stop(self, RawData, started):
+        try:
+            if started:
+                SR.stopMeasurement(self.session.Dev)
+        finally:
+            self.session.pool.release('raw', RawData)
+
+    async def frames(self, Pattern, Type=SR.AcquisitionType.Acquisition_AsyncContinuous, slots=4):
+        """
+        Async iterator over the raw frames of Pattern, as acquisitionStream
+        Frames in a FrameRing of slots frames. Every frame must be released;
+        while all slots are held the next frame waits.
+
+        The measurement is started on first iteration and stopped when the
+        loop ends, breaks, raises or is cancelled. After a break the event
+        loop closes the generator shortly afterwards; await its aclose() to
+        wait for stopMeasurement explicitly.
+        """
+        session = self.session
+        await self.open()
+        RawData = await self.run(session.pool.acquire, 'raw')
+        started = False
+        ring = None
+        try:
+            await self.run(SR.startMeasurement, session.Dev, Pattern, Type)
+            started = True
+            index = 0
+            while True:
+                timestamp, lost = await self.run(self._nextFrame, RawData)
+                if ring is None:
+                    layout = await self.run(session.layouts.raw, Pattern, RawData)
+                    ring = FrameRing(layout.shape, layout.dtype, slots)
+                slot = ring.acquire(block=False)
+                while slot is None:
+                    # Bounded wait, so a cancelled wait does not hold a thread
+                    slot = await asyncio.get_running_loop().run_in_executor(None, ring.acquire, True, 0.1)
+                await self.run(SR.copyRawDataContent, RawData, slot)
+                index += lost
+                yield Frame(index, slot, lost, timestamp, ring)
+                index += 1
+        finally:
+            # Shielded so cancellation cannot skip stopMeasurement
+            await asyncio.shield(self.run(self._stop, RawData, started))
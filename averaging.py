@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming frame averaging and B-scan compounding on the host side, instead
+of Probe_Oversampling / Processing_AScanAveraging in the SDK.
+
+FrameAverager folds magnitude (linear or dB) or complex frames into a
+running sum as they arrive, so the repeats never need to be stored:
+
+    averager = FrameAverager((AScans, Depth), depth=8, maxDepth=32, register=True)
+    for frame in frames:
+        averager.add(scanOrderView(frame)[0])
+        show(averager.mean())
+
+Frames are indexed with depth along the last axis (scan order, see
+softwareProcessing.scanOrderView). All buffers are allocated up front; the
+averaging depth can be changed at run time up to maxDepth.
+"""
+import numpy as np
+
+
+class FrameAverager(object):
+    """
+    Running sum, mean and median-of-N of equally shaped frames, optionally
+    registered along depth before they are added.
+
+    With depth=None every frame added since the last reset is averaged and
+    only the sum is kept. With a depth, the last depth frames are averaged:
+    they are kept in a ring of maxDepth frames and the oldest is subtracted
+    from the sum as a new one arrives. median needs the ring.
+    """
+
+    def __init__(self, frameShape, depth=None, maxDepth=None, complex=False, register=False, maxShift=16):
+        """
+        :param frameShape: shape of one frame, depth last, e.g. (AScans, Depth)
+        :param depth: frames in the moving window, None for a cumulative
+            average
+        :param maxDepth: largest window setDepth will accept, depth if None
+        :param complex: frames are complex, accumulated as complex64
+        :param register: estimate the axial shift of each frame against the
+            current mean and remove it before adding the frame
+        :param maxShift: largest axial shift in pixels searched
+        """
+        self.frameShape = tuple(frameShape)
+        self.dtype = np.dtype(np.complex64 if complex else np.float32)
+        self.register = register
+        self.maxShift = maxShift
+        if maxDepth is None:
+            maxDepth = depth
+        self.maxDepth = maxDepth
+        self._sum = np.zeros(self.frameShape, dtype=self.dtype)
+        # Frames contributing to each depth row, which differs at the edges
+        # once frames are shifted
+        self._counts = np.zeros(self.frameShape[-1], dtype=np.int64)
+        self._profile = np.zeros(self.frameShape[-1], dtype=np.float64)
+        self._scratch = np.empty(self.frameShape, dtype=self.dtype)
+        if maxDepth:
+            self._ring = np.zeros((maxDepth,) + self.frameShape, dtype=self.dtype)
+            self._ringShifts = np.zeros(maxDepth, dtype=np.int64)
+        else:
+            self._ring = None
+        self.depth = None
+        self.reset()
+        self.setDepth(depth)
+
+    def reset(self):
+        """
+        Forgets all frames.
+        """
+        self._sum[:] = 0
+        self._counts[:] = 0
+        self._profile[:] = 0
+        self._head = 0
+        self._fill = 0
+        self.framesAdded = 0
+        self.lastShift = 0
+
+    @property
+    def count(self):
+        """
+        Number of frames currently averaged.
+        """
+        return self._fill if self.depth else self.framesAdded
+
+    def setDepth(self, depth):
+        """
+        Changes the moving window to depth frames, dropping the oldest frames
+        if it shrinks. Leaving a cumulative average starts the window empty.
+        None switches to a cumulative average from now on.
+        """
+        if depth is not None:
+            if self._ring is None or depth > self.maxDepth or depth < 1:
+                raise ValueError('PySpectralRadar: averaging depth must be between 1 and maxDepth (%s)'
+                                 % self.maxDepth)
+            if self.depth is None:
+                # Cumulative frames are only in the sum, the window could
+                # never subtract them again
+                self.reset()
+            while self._fill > depth:
+                self._dropOldest()
+        self.depth = depth
+
+    def _rows(self, shift):
+        """
+        Destination and source depth slices of a frame shifted by shift.
+        """
+        n = self.frameShape[-1]
+        if shift >= 0:
+            return slice(shift, n), slice(0, n - shift)
+        return slice(0, n + shift), slice(-shift, n)
+
+    def _estimateShift(self, frame):
+        magnitude = np.abs(frame) if self.dtype.kind == 'c' else frame
+        profile = magnitude.reshape(-1, self.frameShape[-1]).mean(axis=0, dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            reference = np.where(self._counts > 0, self._profile/self._counts, 0)
+        profile = profile - profile.mean()
+        reference = reference - reference.mean()
+        n = 2*self.frameShape[-1]
+        # correlation[s] = sum_z reference[z] profile[z - s]
+        correlation = np.fft.irfft(np.fft.rfft(reference, n)*np.conj(np.fft.rfft(profile, n)), n)
+        lags = np.arange(-self.maxShift, self.maxShift + 1)
+        return int(lags[np.argmax(correlation[lags])])
+
+    def _shifted(self, frame, shift, out):
+        destination, source = self._rows(shift)
+        if shift:
+            out[..., :destination.start] = 0
+            out[..., destination.stop:] = 0
+        out[..., destination] = frame[..., source]
+        return out
+
+    def _dropOldest(self):
+        slot = (self._head - self._fill) % self.maxDepth
+        self._accumulate(self._ring[slot], self._ringShifts[slot], -1)
+        self._fill -= 1
+
+    def _accumulate(self, shifted, shift, sign):
+        destination, _ = self._rows(shift)
+        if sign > 0:
+            self._sum += shifted
+        else:
+            self._sum -= shifted
+        self._counts[destination] += sign
+        magnitude = np.abs(shifted) if self.dtype.kind == 'c' else shifted
+        self._profile += sign*magnitude.reshape(-1, self.frameShape[-1]).mean(axis=0, dtype=np.float64)
+
+    def add(self, frame):
+        """
+        Adds one frame, depth last.
+
+        :return: the axial shift in pixels that was removed, 0 without
+            registration
+        """
+        frame = np.asarray(frame)
+        if frame.shape != self.frameShape:
+            raise ValueError('PySpectralRadar: frame shape %s does not match %s' % (frame.shape, self.frameShape))
+        shift = self._estimateShift(frame) if self.register and self.count else 0
+        if self.depth:
+            if self._fill == self.depth:
+                self._dropOldest()
+            slot = self._head % self.maxDepth
+            shifted = self._shifted(frame, shift, self._ring[slot])
+            self._ringShifts[slot] = shift
+            self._head = (self._head + 1) % self.maxDepth
+            self._fill += 1
+        else:
+            shifted = self._shifted(frame, shift, self._scratch)
+        self._accumulate(shifted, shift, 1)
+        self.framesAdded += 1
+        self.lastShift = shift
+        return shift
+
+    def sum(self):
+        """
+        Running sum. The array is updated in place by add.
+        """
+        return self._sum
+
+    def mean(self, out=None):
+        """
+        :param out: array of frameShape to write into
+        :return: mean of the frames currently averaged, per depth row over the
+            frames that cover it after registration
+        """
+        if out is None:
+            out = np.empty(self.frameShape, dtype=self.dtype)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            np.divide(self._sum, np.maximum(self._counts, 1).astype(np.float32), out=out)
+        return out
+
+    def median(self, out=None):
+        """
+        Median of the frames in the moving window. Complex frames use the
+        median of their magnitude. Rows shifted out of a frame by the
+        registration count as 0.
+
+        :param out: float32 array of frameShape to write into
+        """
+        if not self.depth:
+            raise RuntimeError('PySpectralRadar: median needs a moving window, set depth')
+        if self._fill == 0:
+            raise RuntimeError('PySpectralRadar: no frames to average')
+        slots = (self._head - self._fill + np.arange(self._fill)) % self.maxDepth
+        if np.all(np.diff(slots) == 1):
+            window = self._ring[slots[0]:slots[-1] + 1]
+        else:
+            window = self._ring[slots]
+        if self.dtype.kind == 'c':
+            window = np.abs(window)
+        if out is None:
+            out = np.empty(self.frameShape, dtype=np.float32)
+        np.median(window, axis=0, out=out)
+        return out
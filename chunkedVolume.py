@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+Out-of-core volumes stored as B-scan chunks on disk.
+
+A ChunkedVolume is a directory holding one .npy file per chunk of
+chunkBScans consecutive B-scans and a volume.json manifest. The volume is in
+scan order (BScans, AScans, Depth) like scanOrderView returns it, so a dense
+1024 x 1024 x 2048 complex volume never has to exist in memory at once:
+
+    raw = ChunkedVolume.create('scan', (BScans, AScans, Pixels), numpy.uint16, chunkBScans=8)
+    for bScan in range(BScans):
+        getRawData(Dev, RawData)
+        raw.copyRawData(RawData, bScan)
+
+    processing = SoftwareProcessing.fromDevice(Dev, Pixels)
+    dB = raw.process(processing, 'scan_dB', output='dB', workers=4)
+    enface = dB.project('max')
+    surface = dB.detectSurface(zSpacing_mm)
+
+Slicing reads only the chunks it touches. map and the operations built on it
+stream chunk by chunk, on threads or on worker processes which open the
+chunk files themselves, so memory use is bounded by the chunks in flight.
+"""
+import functools
+import itertools
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+
+import PySpectralRadar as SR
+from softwareProcessing import scanOrderView
+from surfaceDetection import detectSurface, medianFilter
+
+_MANIFEST = 'volume.json'
+# SoftwareProcessing work buffers are per engine, so every thread gets a clone
+_local = threading.local()
+
+
+def _chunkPath(path, index):
+    return os.path.join(path, 'chunk%05d.npy' % index)
+
+
+def _mapChunk(path, index, function, target):
+    """
+    Applies function to one chunk; the result is written to the same chunk
+    of the target volume, or returned if target is None. Runs in the worker.
+    """
+    source = np.load(_chunkPath(path, index), mmap_mode='r')
+    result = function(source)
+    if target is None:
+        return result
+    output = np.load(_chunkPath(target, index), mmap_mode='r+')
+    np.copyto(output, result, casting='same_kind')
+    output.flush()
+
+
+def _threadEngine(processing):
+    engines = getattr(_local, 'engines', None)
+    if engines is None:
+        engines = _local.engines = {}
+    entry = engines.get(id(processing))
+    if entry is None or entry[0] is not processing:
+        entry = engines[id(processing)] = (processing, processing.clone())
+    return entry[1]
+
+
+def _processChunk(chunk, processing, output):
+    processing = _threadEngine(processing)
+    raw = scanOrderView(np.ascontiguousarray(chunk))
+    if output == 'complex':
+        return scanOrderView(processing.processComplex(raw))
+    return scanOrderView(processing.processData(raw))
+
+
+def _spectrumSumChunk(chunk):
+    return chunk.sum(axis=1, dtype=np.float64)
+
+
+def _dBChunk(chunk):
+    magnitude = np.abs(chunk).astype(np.float32)
+    np.maximum(magnitude, np.finfo(np.float32).tiny, out=magnitude)
+    np.log10(magnitude, out=magnitude)
+    magnitude *= 20
+    return magnitude
+
+
+def _projectChunk(chunk, mode, start, stop):
+    slab = chunk[..., start:stop]
+    if np.iscomplexobj(slab):
+        slab = np.abs(slab)
+    if mode == 'max':
+        return slab.max(axis=-1).astype(np.float32)
+    return slab.mean(axis=-1, dtype=np.float64).astype(np.float32)
+
+
+def _surfaceChunk(chunk, zSpacing_mm, options):
+    return detectSurface(np.asarray(chunk), zSpacing_mm, **options)
+
+
+class ChunkedVolume(object):
+    """
+    Volume (BScans, AScans, Depth) stored as memory-mapped B-scan chunks.
+    """
+
+    def __init__(self, path, mode='r'):
+        """
+        Opens an existing volume; use create for a new one.
+
+        :param mode: 'r' or 'r+' for the chunk mappings
+        """
+        self.path = path
+        self.mode = mode
+        with open(os.path.join(path, _MANIFEST)) as manifestFile:
+            manifest = json.load(manifestFile)
+        self.shape = tuple(manifest['shape'])
+        self.dtype = np.dtype(manifest['dtype'])
+        self.chunkBScans = manifest['chunkBScans']
+        self.metadata = manifest.get('metadata', {})
+        self.numberOfChunks = -(-self.shape[0]//self.chunkBScans)
+
+    @classmethod
+    def create(cls, path, shape, dtype, chunkBScans=16, metadata=None):
+        """
+        Creates the directory and preallocates every chunk file.
+
+        :param shape: (BScans, AScans, Depth)
+        :param chunkBScans: B-scans per chunk file
+        :param metadata: dict stored in the manifest, e.g. scan geometry
+        """
+        shape = tuple(int(size) for size in shape)
+        os.makedirs(path, exist_ok=True)
+        for index in range(-(-shape[0]//chunkBScans)):
+            bScans = min(chunkBScans, shape[0] - index*chunkBScans)
+            chunk = np.lib.format.open_memmap(_chunkPath(path, index), mode='w+', dtype=dtype,
+                                              shape=(bScans,) + shape[1:])
+            del chunk
+        manifest = {'shape': list(shape), 'dtype': np.dtype(dtype).str, 'chunkBScans': chunkBScans,
+                    'metadata': dict(metadata or {})}
+        with open(os.path.join(path, _MANIFEST), 'w') as manifestFile:
+            json.dump(manifest, manifestFile, indent=1)
+        return cls(path, mode='r+')
+
+    @classmethod
+    def fromArray(cls, path, array, chunkBScans=16, metadata=None):
+        """
+        Copies a scan-order array, e.g. a memory-mapped recording from
+        openRecording, chunk by chunk into a new volume.
+        """
+        volume = cls.create(path, array.shape, array.dtype, chunkBScans, metadata)
+        for index in range(volume.numberOfChunks):
+            start, stop = volume.chunkBounds(index)
+            chunk = volume.chunk(index)
+            chunk[:] = array[start:stop]
+            chunk.flush()
+        return volume
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape))*self.dtype.itemsize
+
+    def chunkBounds(self, index):
+        """
+        :return: (first B-scan, last B-scan + 1) of chunk index
+        """
+        start = index*self.chunkBScans
+        return start, min(start + self.chunkBScans, self.shape[0])
+
+    def chunk(self, index):
+        """
+        Memory map of one chunk (bScans, AScans, Depth), writable if the
+        volume was opened with 'r+'.
+        """
+        return np.load(_chunkPath(self.path, index), mmap_mode=self.mode)
+
+    def chunks(self):
+        """
+        Yields (first B-scan, chunk) for every chunk in order.
+        """
+        for index in range(self.numberOfChunks):
+            yield self.chunkBounds(index)[0], self.chunk(index)
+
+    # Slicing -------------------------------------------------------------------
+
+    def __getitem__(self, key):
+        """
+        Reads the selection into memory, touching only the chunks that hold
+        the selected B-scans. The B-scan index must be an integer or a slice;
+        the other axes take anything numpy accepts.
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        first, rest = key[0], key[1:]
+        if isinstance(first, slice):
+            bScans = range(*first.indices(self.shape[0]))
+        elif isinstance(first, (int, np.integer)):
+            index = int(first) + self.shape[0] if first < 0 else int(first)
+            if not 0 <= index < self.shape[0]:
+                raise IndexError('PySpectralRadar: B-scan %d is outside the volume of %d' % (first, self.shape[0]))
+            chunk = self.chunk(index//self.chunkBScans)
+            return np.array(chunk[(index % self.chunkBScans,) + rest])
+        else:
+            raise TypeError('PySpectralRadar: B-scans can only be selected by an integer or a slice')
+
+        parts = []
+        for index, group in itertools.groupby(bScans, lambda b: b//self.chunkBScans):
+            local = [b - index*self.chunkBScans for b in group]
+            stop = local[-1] + (1 if bScans.step > 0 else -1)
+            selection = slice(local[0], stop if stop >= 0 else None, bScans.step)
+            parts.append(np.array(self.chunk(index)[(selection,) + rest]))
+        if not parts:
+            return np.array(self.chunk(0)[(slice(0, 0),) + rest])
+        return np.concatenate(parts)
+
+    # Writing -------------------------------------------------------------------
+
+    def _bScanView(self, bScan, count):
+        index = bScan//self.chunkBScans
+        offset = bScan - index*self.chunkBScans
+        if bScan < 0 or offset + count > self.chunkBounds(index)[1] - self.chunkBounds(index)[0]:
+            raise IndexError('PySpectralRadar: B-scans %d to %d do not lie in one chunk'
+                             % (bScan, bScan + count - 1))
+        return self.chunk(index)[offset:offset + count]
+
+    def write(self, bScan, frame):
+        """
+        Stores B-scans filled by a copy*Content function, SDK shape (Depth,
+        AScans, n), starting at bScan. They must not cross a chunk boundary.
+        """
+        frame = scanOrderView(np.asarray(frame))
+        view = self._bScanView(bScan, frame.shape[0])
+        np.copyto(view, frame, casting='same_kind')
+        view.flush()
+
+    def copyRawData(self, RawData, bScan):
+        """
+        Copies the content of a RawDataHandle straight into the chunk file.
+        """
+        shape = SR.getRawDataShape(RawData)
+        view = self._bScanView(bScan, shape[2])
+        SR.copyRawDataContent(RawData, view.reshape(shape))
+        view.flush()
+
+    def copyComplexData(self, ComplexData, bScan):
+        """
+        Copies the content of a ComplexDataHandle straight into the chunk file.
+        """
+        prop = SR.DataPropertyInt
+        shape = tuple(SR.getComplexDataPropertyInt(ComplexData, size)
+                      for size in (prop.Data_Size1, prop.Data_Size2, prop.Data_Size3))
+        view = self._bScanView(bScan, shape[2])
+        SR.copyComplexDataContent(ComplexData, view.reshape(shape))
+        view.flush()
+
+    # Chunk-wise operations -----------------------------------------------------
+
+    def map(self, function, path=None, workers=1, processes=False, metadata=None):
+        """
+        Applies function to every chunk (bScans, AScans, Depth). It must
+        return one result per B-scan, (bScans, ...).
+
+        :param path: directory of a new ChunkedVolume the results are stored
+            in, chunked like this one. If None the results are gathered into
+            one array in memory, which suits projections and depth maps
+        :param workers: chunks processed concurrently
+        :param processes: use worker processes instead of threads; function
+            must then be picklable, e.g. a functools.partial of a module
+            level function
+        :return: ChunkedVolume if path is given, else numpy array
+        """
+        # The first chunk fixes the shape and type of the output
+        first = _mapChunk(self.path, 0, function, None)
+        first = np.asarray(first)
+        if first.shape[0] != self.chunkBounds(0)[1]:
+            raise ValueError('PySpectralRadar: map function must return one result per B-scan')
+        outputShape = (self.shape[0],) + first.shape[1:]
+        if path is None:
+            output = np.empty(outputShape, dtype=first.dtype)
+            target = None
+        else:
+            output = ChunkedVolume.create(path, outputShape, first.dtype, self.chunkBScans, metadata)
+            target = path
+        self._store(output, 0, first)
+
+        remaining = range(1, self.numberOfChunks)
+        if workers > 1 and len(remaining) > 1:
+            executorType = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            with executorType(workers) as executor:
+                futures = [(index, executor.submit(_mapChunk, self.path, index, function, target))
+                           for index in remaining]
+                for index, future in futures:
+                    self._store(output, index, future.result())
+        else:
+            for index in remaining:
+                self._store(output, index, _mapChunk(self.path, index, function, target))
+        return output
+
+    def _store(self, output, index, result):
+        # Workers write volume outputs themselves and return None
+        if result is None:
+            return
+        if isinstance(output, ChunkedVolume):
+            chunk = output.chunk(index)
+            np.copyto(chunk, result, casting='same_kind')
+            chunk.flush()
+        else:
+            output[slice(*self.chunkBounds(index))] = result
+
+    def process(self, processing, path, output='dB', **options):
+        """
+        Raw uint16 spectra to complex or dB B-scans with a SoftwareProcessing.
+
+        :param output: 'complex' or 'dB'
+        :param options: passed to map, e.g. workers and processes
+        """
+        if output not in ('complex', 'dB'):
+            raise ValueError("PySpectralRadar: output must be 'complex' or 'dB'")
+        if not processing.hasBackground:
+            # A mean per chunk would make the result depend on chunkBScans,
+            # use the mean of the whole volume as processing it at once does
+            processing = processing.clone()
+            processing.setBackground(self.meanSpectrum(workers=options.get('workers', 1),
+                                                       processes=options.get('processes', False)))
+        return self.map(functools.partial(_processChunk, processing=processing, output=output), path, **options)
+
+    def meanSpectrum(self, **options):
+        """
+        Mean raw spectrum over every A-scan of the volume, streamed chunk by
+        chunk.
+
+        :param options: passed to map, e.g. workers and processes
+        :return: float64 array with one value per pixel
+        """
+        sums = self.map(_spectrumSumChunk, **options)
+        return sums.sum(axis=0)/(self.shape[0]*self.shape[1])
+
+    def toDB(self, path, **options):
+        """
+        20*log10 magnitude of a complex volume.
+        """
+        return self.map(_dBChunk, path, **options)
+
+    def project(self, mode='max', startPixel=0, stopPixel=None, **options):
+        """
+        En-face projection over depth, of the magnitude for complex volumes.
+
+        :param mode: 'max' or 'mean'
+        :param startPixel: first depth pixel of the slab
+        :param stopPixel: end of the slab, the full depth if None
+        :return: float32 (BScans, AScans)
+        """
+        if mode not in ('max', 'mean'):
+            raise ValueError("PySpectralRadar: projection mode must be 'max' or 'mean'")
+        return self.map(functools.partial(_projectChunk, mode=mode, start=startPixel, stop=stopPixel),
+                        **options)
+
+    def detectSurface(self, zSpacing_mm, threshold_dB=None, thresholdAboveNoise_dB=15.0, workers=1,
+                      processes=False, **detectOptions):
+        """
+        surfaceDetection.detectSurface on a dB volume, chunk by chunk.
+
+        Without a threshold_dB the noise floor is estimated once from a
+        subsample of every chunk, so all chunks use the same threshold. The
+        medianSize filter runs on the assembled depth map, so it has no
+        seams at chunk boundaries.
+
+        :return: float32 depth map in mm (BScans, AScans)
+        """
+        medianSize = detectOptions.pop('medianSize', 0)
+        if threshold_dB is None:
+            start = detectOptions.get('startPixel', 10)
+            samples = [np.asarray(chunk[::max(1, chunk.shape[0]//4), ::13, start::7]).ravel()
+                       for _, chunk in self.chunks()]
+            threshold_dB = float(np.median(np.concatenate(samples))) + thresholdAboveNoise_dB
+        detectOptions['threshold_dB'] = threshold_dB
+        function = functools.partial(_surfaceChunk, zSpacing_mm=zSpacing_mm, options=detectOptions)
+        surface = self.map(function, workers=workers, processes=processes)
+        if medianSize > 1:
+            surface = medianFilter(surface, medianSize)
+        return surface
+
+
+def compareWithInMemory(raw, processing, **options):
+    """
+    Processes a raw volume chunk by chunk and all at once, e.g. to check
+    that the result does not depend on chunkBScans. Complex output is
+    compared, dB values of the near-zero DC bins would only show rounding.
+
+    :param raw: ChunkedVolume of uint16 spectra
+    :param options: passed to process, e.g. workers
+    :return: largest absolute difference relative to the largest magnitude
+    """
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        chunked = raw.process(processing, os.path.join(directory, 'complex'), output='complex', **options)
+        inMemory = _processChunk(raw[:], processing.clone(), 'complex')
+        return float(np.abs(chunked[:] - inMemory).max()/np.abs(inMemory).max())
+
+
+def main():
+    import tempfile
+    from simulatedDevice import useSimulatedBackend
+    from softwareProcessing import SoftwareProcessing
+
+    useSimulatedBackend(numberOfPixels=1024, realTime=False)
+    Dev = SR.initDevice()
+    Probe = SR.initProbe(Dev, 'Probe')
+    Pattern = SR.createVolumePattern(Probe, 2.0, 256, 2.0, 24)
+    RawData = SR.createRawData()
+    processing = SoftwareProcessing.fromDevice(Dev, 1024)
+    with tempfile.TemporaryDirectory() as directory:
+        acquired = ChunkedVolume.create(os.path.join(directory, 'raw'), (24, 256, 1024), np.uint16, 24)
+        SR.startMeasurement(Dev, Pattern, SR.AcquisitionType.Acquisition_AsyncFinite)
+        for bScan in range(24):
+            SR.getRawData(Dev, RawData)
+            acquired.copyRawData(RawData, bScan)
+        SR.stopMeasurement(Dev)
+        print('chunkBScans   relative difference')
+        for chunkBScans in (1, 5, 24):
+            raw = ChunkedVolume.fromArray(os.path.join(directory, 'raw%d' % chunkBScans), acquired[:], chunkBScans)
+            print('%11d %21.2e' % (chunkBScans, compareWithInMemory(raw, processing)))
+    SR.clearRawData(RawData)
+    SR.clearScanPattern(Pattern)
+    SR.closeProbe(Probe)
+    SR.closeDevice(Dev)
+
+
+if __name__ == "__main__":
+    main()
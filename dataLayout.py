@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Cached shape / dtype descriptors of SDK data objects.
+
+Querying a RawData, Data or ComplexData handle for its dimensions takes three
+to five property calls through ctypes. The layout only changes when the scan
+pattern or the processing configuration changes, so LayoutCache computes it
+once per (pattern, processing) and the acquisition loop can go straight to
+the copy call:
+
+    layouts = LayoutCache()
+    while running:
+        getRawData(Dev, RawData)
+        layout = layouts.raw(Pattern, RawData)
+        copyRawDataContent(RawData, ring.acquire())
+"""
+import ctypes as C
+from collections import namedtuple
+import numpy as np
+
+import PySpectralRadar as SR
+
+_BYTES_TO_DTYPE = {
+    'data': {4: np.float32, 8: np.float64},
+    'complex': {8: np.complex64, 16: np.complex128},
+}
+
+
+class DataLayout(namedtuple('DataLayout', ('shape', 'dtype', 'nbytes', 'size'))):
+    """
+    shape is the SDK shape (Size1, Size2, Size3) used to allocate arrays for
+    the copy*Content functions, size the number of elements.
+    """
+    __slots__ = ()
+
+    def empty(self):
+        return np.empty(self.shape, dtype=self.dtype)
+
+
+def _layout(shape, dtype):
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape))
+    return DataLayout(tuple(int(s) for s in shape), dtype, size*dtype.itemsize, size)
+
+
+def rawDataLayout(RawData):
+    """
+    Queries the layout of a RawDataHandle.
+    """
+    return _layout(SR.getRawDataShape(RawData), np.uint16)
+
+
+def _propertyLayout(getProperty, Data, kind):
+    prop = SR.DataPropertyInt
+    shape = [getProperty(Data, size) for size in (prop.Data_Size1, prop.Data_Size2, prop.Data_Size3)]
+    bytesPerElement = getProperty(Data, prop.Data_BytesPerElement)
+    return _layout(shape, _BYTES_TO_DTYPE[kind][bytesPerElement])
+
+
+def dataLayout(Data):
+    """
+    Queries the layout of a DataHandle.
+    """
+    return _propertyLayout(SR.getDataPropertyInt, Data, 'data')
+
+
+def complexDataLayout(ComplexData):
+    """
+    Queries the layout of a ComplexDataHandle.
+    """
+    return _propertyLayout(SR.getComplexDataPropertyInt, ComplexData, 'complex')
+
+
+def handleKey(handle):
+    """
+    Hashable identity of an SDK handle: the address for ctypes pointers, the
+    object itself for other backends.
+    """
+    if isinstance(handle, C._Pointer):
+        return C.cast(handle, C.c_void_p).value
+    return id(handle)
+
+
+class LayoutCache(object):
+    """
+    Layouts keyed by scan pattern and processing handle. Call invalidate when
+    a pattern is cleared or rotated, or when the processing output changes.
+    """
+
+    def __init__(self):
+        self._layouts = {}
+        self.queries = 0
+
+    def _get(self, kind, query, Handle, Pattern, Proc):
+        key = (kind, handleKey(Pattern), None if Proc is None else handleKey(Proc))
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = self._layouts[key] = query(Handle)
+            self.queries += 1
+        return layout
+
+    def raw(self, Pattern, RawData):
+        """
+        Layout of the raw frames Pattern produces.
+        """
+        return self._get('raw', rawDataLayout, RawData, Pattern, None)
+
+    def data(self, Pattern, Proc, Data):
+        """
+        Layout of the processed frames Proc produces for Pattern.
+        """
+        return self._get('data', dataLayout, Data, Pattern, Proc)
+
+    def complexData(self, Pattern, Proc, ComplexData):
+        """
+        Layout of the complex frames Proc produces for Pattern.
+        """
+        return self._get('complex', complexDataLayout, ComplexData, Pattern, Proc)
+
+    def invalidate(self, Pattern=None, Proc=None):
+        """
+        Forgets the layouts involving Pattern and / or Proc, or all layouts if
+        neither is given.
+        """
+        if Pattern is None and Proc is None:
+            self._layouts.clear()
+            return
+        patternKey = None if Pattern is None else handleKey(Pattern)
+        procKey = None if Proc is None else handleKey(Proc)
+        for key in list(self._layouts):
+            if (patternKey is not None and key[1] == patternKey) or \
+                    (procKey is not None and key[2] == procKey):
+                del self._layouts[key]
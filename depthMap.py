@@ -2,52 +2,72 @@ import numpy as np
 import cv2
 import time
 from PySpectralRadar import *  # Assuming this is the Python wrapper for the OCT imaging library
+from dataLayout import dataLayout
+from handlePool import HandlePool
+from softwareProcessing import scanOrderView
+from surfaceDetection import detectSurface
+from surfaceReconstruction import ScanGeometry, reconstructSurface
 
 PI = 3.14159265358979323846
 
 # Assuming ScanResult can be represented as a dictionary in Python
-def getSurfaceFrom3DScan(AScansPerBScan, LengthOfBScan, BScansPerVolume, WidthOfVolume):
+def getSurfaceFrom3DScan(AScansPerBScan, LengthOfBScan, BScansPerVolume, WidthOfVolume, pool=None, session=None):
+    """
+    :param pool: HandlePool to take the data handles from. A temporary pool
+        is used if None, so every handle is released even on errors.
+    :param session: open OCTSession to acquire with. If None the device is
+        opened and closed again for this one scan.
+    """
+    if session is not None:
+        try:
+            Surface = session.acquire_surface(LengthOfBScan, AScansPerBScan, WidthOfVolume, BScansPerVolume)
+            stats = session.lastAcquisition
+            return {"surface": Surface, "actualTime": stats["actualTime"], "expectedTime": stats["expectedTime"],
+                    "numOfLostBScan": stats["lostFrames"]}
+        except Exception as e:
+            print(f"ERROR: {e}")
+            return {"surface": None, "actualTime": -1.0, "expectedTime": -1.0, "numOfLostBScan": -1}
+
+    Dev = Probe = Proc = Pattern = None
+    ownPool = pool is None
+    if ownPool:
+        pool = HandlePool()
     try:
         Dev = initDevice()
         Probe = initProbe(Dev, "Probe_Standard_OCTG_LSM04.ini")
         Proc = createProcessingForDevice(Dev)
 
-        RawVolume = createRawData()
-        Volume = createData()
-        Surface = createData()
-
-        # Set device presets and parameters
-        setDevicePreset(Dev, CATEGORY_SPEED_SENSITIVITY, Probe, Proc, PRESET_HIGH_SPEED_146kHz)
-        AScanAveraging = 3
-        setProbeParameterInt(Probe, ProbeParameterInt.Probe_Oversampling, AScanAveraging)
-        setProcessingParameterInt(Proc, ProcessingParameterInt.Processing_AScanAveraging, AScanAveraging)
-
-        Pattern = createVolumePattern(Probe, LengthOfBScan, AScansPerBScan, WidthOfVolume, BScansPerVolume,
-                                      ScanPatternApodizationType.ScanPattern_ApoOneForAll,
-                                      ScanPatternAcquisitionOrder.ScanPattern_AcqOrderAll)
-
-        # Start and stop measurement
-        start = time.time()
-        startMeasurement(Dev, Pattern, AcquisitionType.Acquisition_AsyncContinuous)
-        getRawData(Dev, RawVolume)
-        setProcessedDataOutput(Proc, Volume)
-        executeProcessing(Proc, RawVolume)
-        stopMeasurement(Dev)
-        stop = time.time()
-
-        numOfLostBScan = getRawDataPropertyInt(RawVolume, RawDataPropertyInt.RawData_LostFrames)
-        actualTime = stop - start
-        expectedTime = expectedAcquisitionTime_s(Pattern, Dev)
-
-        determineSurface(Volume, Surface)
-
-        # Clean up
-        clearScanPattern(Pattern)
-        clearData(Volume)
-        clearRawData(RawVolume)
-        clearProcessing(Proc)
-        closeProbe(Probe)
-        closeDevice(Dev)
+        with pool.raw_data() as RawVolume, pool.data() as Volume:
+            # Set device presets and parameters
+            setDevicePreset(Dev, CATEGORY_SPEED_SENSITIVITY, Probe, Proc, PRESET_HIGH_SPEED_146kHz)
+            AScanAveraging = 3
+            setProbeParameterInt(Probe, ProbeParameterInt.Probe_Oversampling, AScanAveraging)
+            setProcessingParameterInt(Proc, ProcessingParameterInt.Processing_AScanAveraging, AScanAveraging)
+
+            Pattern = createVolumePattern(Probe, LengthOfBScan, AScansPerBScan, WidthOfVolume, BScansPerVolume,
+                                          ScanPatternApodizationType.ScanPattern_ApoOneForAll,
+                                          ScanPatternAcquisitionOrder.ScanPattern_AcqOrderAll)
+
+            # Start and stop measurement
+            start = time.time()
+            startMeasurement(Dev, Pattern, AcquisitionType.Acquisition_AsyncContinuous)
+            getRawData(Dev, RawVolume)
+            setProcessedDataOutput(Proc, Volume)
+            executeProcessing(Proc, RawVolume)
+            stopMeasurement(Dev)
+            stop = time.time()
+
+            numOfLostBScan = getRawDataPropertyInt(RawVolume, RawDataPropertyInt.RawData_LostFrames)
+            actualTime = stop - start
+            expectedTime = expectedAcquisitionTime_s(Pattern, Dev)
+
+            # Volume is copied out and the surface detected in NumPy, so the
+            # result is a plain depth map in mm of shape (BScans, AScans)
+            VolumeLayout = dataLayout(Volume)
+            VolumeContent = VolumeLayout.empty()
+            copyDataContent(Volume, VolumeContent)
+            zSpacing = getDevicePropertyFloat(Dev, DevicePropertyFloat.Device_zSpacing)
+            Surface = detectSurface(scanOrderView(VolumeContent), zSpacing, medianSize=3)
 
         return {"surface": Surface, "actualTime": actualTime, "expectedTime": expectedTime, "numOfLostBScan": numOfLostBScan}
 
@@ -55,6 +75,19 @@ def getSurfaceFrom3DScan(AScansPerBScan, LengthOfBScan, BScansPerVolume, WidthOf
         print(f"ERROR: {e}")
         return {"surface": None, "actualTime": -1.0, "expectedTime": -1.0, "numOfLostBScan": -1}
 
+    finally:
+        # Clean up
+        if Pattern is not None:
+            clearScanPattern(Pattern)
+        if Proc is not None:
+            clearProcessing(Proc)
+        if Probe is not None:
+            closeProbe(Probe)
+        if Dev is not None:
+            closeDevice(Dev)
+        if ownPool:
+            pool.close()
+
 def main():
     LengthOfBScan = 10.0
     WidthOfVolume = 10.0
@@ -62,6 +95,7 @@ def main():
     FullBScansPerVolume = 100
     AscanCompressionRatio = 0.5
     BscanCompressionRatio = 0.25
+    ReconstructionMethod = 'bilinear'  # 'bilinear', 'rbf', 'tv' or 'dct', see benchmarkReconstruction
 
     CompressiveAScansPerBScan = int(FullAScansPerBScan * AscanCompressionRatio)
     CompressiveBScansPerVolume = int(FullBScansPerVolume * BscanCompressionRatio)
@@ -73,12 +107,16 @@ def main():
 
     result = getSurfaceFrom3DScan(AScansPerBScan, LengthOfBScan, BScansPerVolume, WidthOfVolume)
 
-    if result["surface"]:
-        # Exporting the surface data
+    if result["surface"] is not None:
+        # Exporting the surface data, one row per B-scan, depths in mm
         surface_data_csv_path = f"{folderLocation}{fileName}.csv"
-        with open(surface_data_csv_path, 'w') as csv_file:
-            # Replace the following line with the actual method of writing the surface data to the CSV file
-            csv_file.write(str(result["surface"]))  # Placeholder for actual export logic
+        np.savetxt(surface_data_csv_path, result["surface"], delimiter=',', fmt='%.6f')
+
+        # Rebuilding the full resolution surface from the sparse scan
+        sparseGeometry = ScanGeometry(LengthOfBScan, AScansPerBScan, WidthOfVolume, BScansPerVolume)
+        denseGeometry = ScanGeometry(LengthOfBScan, FullAScansPerBScan, WidthOfVolume, FullBScansPerVolume)
+        dense = reconstructSurface(result["surface"], sparseGeometry, denseGeometry, ReconstructionMethod)
+        np.savetxt(f"{folderLocation}{fileName}_dense.csv", dense, delimiter=',', fmt='%.6f')
 
         # Writing metadata to a separate file
         metadata_csv_path = f"{folderLocation}{fileName}_meta.csv"
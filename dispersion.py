@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Numerical dispersion compensation for the software processing path.
+
+Dispersion mismatch between sample and reference arm adds a phase
+phi(k) = a2 * x^2 + a3 * x^3 to every spectrum, with x the wavenumber
+normalized to [-1, 1] over the k-linear grid and a2, a3 in radians at the
+band edge. It broadens every reflection; multiplying the k-linearized
+spectra by exp(-i phi) before the FFT removes it:
+
+    compensation = DispersionCompensation(NumberOfPixels, a2, a3)
+    processing = SoftwareProcessing(wavelengths, dispersion=compensation)
+
+tuneDispersion finds a2 and a3 by maximizing the sharpness of a subsampled
+B-scan. Each stage of the search pushes all of its candidates through one
+batched FFT.
+"""
+import numpy as np
+
+
+def normalizedK(numberOfPixels):
+    """
+    Wavenumber axis of the k-linear grid, normalized to [-1, 1].
+    """
+    return np.linspace(-1.0, 1.0, numberOfPixels)
+
+
+def dispersionPhase(numberOfPixels, a2, a3):
+    """
+    :return: complex64 compensation vector exp(-i (a2 x^2 + a3 x^3))
+    """
+    x = normalizedK(numberOfPixels)
+    return np.exp(-1j*(a2*x*x + a3*x*x*x)).astype(np.complex64)
+
+
+class DispersionCompensation(object):
+    """
+    Second and third order dispersion compensation with the complex phase
+    vector computed once per coefficient set.
+    """
+
+    def __init__(self, numberOfPixels, a2=0.0, a3=0.0):
+        self.numberOfPixels = numberOfPixels
+        self.setCoefficients(a2, a3)
+
+    def setCoefficients(self, a2, a3):
+        """
+        :param a2: second order phase in radians at the band edge
+        :param a3: third order phase in radians at the band edge
+        """
+        self.a2 = float(a2)
+        self.a3 = float(a3)
+        self.phase = dispersionPhase(self.numberOfPixels, self.a2, self.a3)
+
+    def apply(self, linearized, out=None):
+        """
+        :param linearized: k-linear spectra (lines, pixels), e.g. from
+            SoftwareProcessing.linearize
+        :param out: complex64 array (lines, pixels) to write into
+        :return: compensated complex spectra
+        """
+        return np.multiply(linearized, self.phase, out=out)
+
+
+def sharpness(intensity, axis=-1):
+    """
+    Image sharpness sum(I^2) / sum(I)^2 along axis; larger is sharper. Equal
+    to 1 for a single bright pixel and 1/n for a flat line.
+    """
+    total = intensity.sum(axis=axis)
+    return (intensity*intensity).sum(axis=axis)/np.maximum(total*total, np.finfo(np.float32).tiny)
+
+
+def _score(spectra, a2, a3, skipPixels):
+    """
+    Mean sharpness of the depth profiles for each candidate pair (a2[i],
+    a3[i]), all candidates in one FFT.
+    """
+    phases = np.exp(-1j*(np.multiply.outer(a2, spectra.x2) + np.multiply.outer(a3, spectra.x3)))
+    candidates = spectra.lines[np.newaxis]*phases.astype(np.complex64)[:, np.newaxis]
+    profiles = np.fft.fft(candidates, axis=-1)[..., skipPixels:spectra.lines.shape[-1]//2]
+    intensity = profiles.real*profiles.real + profiles.imag*profiles.imag
+    return sharpness(intensity).mean(axis=-1)
+
+
+class _Sample(object):
+    def __init__(self, linearized, lines):
+        step = max(linearized.shape[0]//lines, 1)
+        self.lines = np.ascontiguousarray(linearized[::step][:lines], dtype=np.float32)
+        x = normalizedK(linearized.shape[-1])
+        self.x2 = x*x
+        self.x3 = x*x*x
+
+
+def tuneDispersion(linearized, a2Range=(-100.0, 100.0), a3Range=(-100.0, 100.0), steps=41, refinements=2,
+                   lines=32, skipPixels=10):
+    """
+    Coordinate search for the coefficients giving the sharpest B-scan:
+    a2 over a2Range with a3 = 0, then a3 over a3Range at the best a2, then
+    refinements joint searches on an n x n grid, n = int(sqrt(steps)) made
+    odd (7 x 7 for the default 41 steps), reaching one previous spacing to
+    either side of the best pair and each narrowed to the previous grid
+    spacing.
+
+    :param linearized: k-linear spectra (lines, pixels) of a B-scan with
+        structure in it, e.g. SoftwareProcessing.linearize(raw)
+    :param lines: A-scans used, evenly subsampled from linearized
+    :param skipPixels: depth pixels near zero delay left out of the metric
+    :return: (a2, a3, sharpness)
+    """
+    sample = _Sample(linearized, lines)
+    a2Values = np.linspace(a2Range[0], a2Range[1], steps)
+    scores = _score(sample, a2Values, np.zeros(steps), skipPixels)
+    a2 = a2Values[np.argmax(scores)]
+    a3Values = np.linspace(a3Range[0], a3Range[1], steps)
+    scores = _score(sample, np.full(steps, a2), a3Values, skipPixels)
+    a3 = a3Values[np.argmax(scores)]
+    best = scores.max()
+
+    spacing2 = (a2Range[1] - a2Range[0])/(steps - 1)
+    spacing3 = (a3Range[1] - a3Range[0])/(steps - 1)
+    grid = int(np.sqrt(steps)) | 1
+    for _ in range(refinements):
+        offsets = np.linspace(-1, 1, grid)
+        candidates2, candidates3 = np.meshgrid(a2 + spacing2*offsets, a3 + spacing3*offsets)
+        scores = _score(sample, candidates2.ravel(), candidates3.ravel(), skipPixels)
+        index = np.argmax(scores)
+        if scores[index] >= best:
+            a2, a3, best = candidates2.ravel()[index], candidates3.ravel()[index], scores[index]
+        spacing2 *= 2.0/(grid - 1)
+        spacing3 *= 2.0/(grid - 1)
+    return float(a2), float(a3), float(best)
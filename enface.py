@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+En-face projections and volume statistics built up while a volume is being
+acquired.
+
+EnFaceAggregator takes the B-scans of a volume as they are delivered, e.g.
+frame by frame from getRawData with ScanPattern_AcqOrderFrameByFrame, and
+updates the maximum and mean intensity projections, slab projections between
+depth bounds and a histogram per B-scan. Each update only touches the
+B-scan it is given, so the en-face maps are complete as soon as the last
+B-scan has been added:
+
+    enface = EnFaceAggregator((BScans, AScans, Depth), slabs={'retina': (120, 260)})
+    BScan = createData()
+    setProcessedDataOutput(Proc, BScan)
+    content = numpy.empty((Depth, AScans, 1), dtype=numpy.float32)
+    for bScan in range(BScans):
+        getRawData(Dev, RawData)
+        executeProcessing(Proc, RawData)
+        copyDataContent(BScan, content)
+        enface.add(scanOrderView(content)[0], bScan)
+    showImage(enface.maximum)
+
+B-scans are indexed with depth last, (AScans, Depth), and hold dB values or
+magnitudes; projections are taken of the values as given. Rows of B-scans
+that have not arrived yet are NaN. NaN pixels in a B-scan propagate into
+its projections and are counted in the first histogram bin.
+"""
+import numpy as np
+
+
+class EnFaceAggregator(object):
+    """
+    Incremental maximum, mean and slab projections plus per-B-scan
+    histograms of a volume (BScans, AScans, Depth).
+    """
+
+    def __init__(self, volumeShape, slabs=None, slabMode='mean', bins=256, histogramRange=(0.0, 120.0)):
+        """
+        :param volumeShape: (BScans, AScans, Depth) of the complete volume
+        :param slabs: dict mapping a name to (startPixel, stopPixel), the
+            depth range projected for that slab
+        :param slabMode: 'mean' or 'max' projection within the slabs
+        :param bins: histogram bins per B-scan
+        :param histogramRange: (low, high) covered by the bins. Values outside
+            are counted in the first or last bin
+        """
+        if slabMode not in ('mean', 'max'):
+            raise ValueError("PySpectralRadar: slab mode must be 'mean' or 'max'")
+        self.volumeShape = tuple(volumeShape)
+        bScans, aScans, depth = self.volumeShape
+        self.slabMode = slabMode
+        self.slabBounds = dict(slabs or {})
+        for name, (start, stop) in self.slabBounds.items():
+            if not 0 <= start < stop <= depth:
+                raise ValueError('PySpectralRadar: slab %r (%d, %d) is outside the %d depth pixels'
+                                 % (name, start, stop, depth))
+        self.bins = bins
+        self.histogramRange = (float(histogramRange[0]), float(histogramRange[1]))
+        self._binScale = np.float32(bins/(self.histogramRange[1] - self.histogramRange[0]))
+
+        self.maximum = np.empty((bScans, aScans), dtype=np.float32)
+        self.mean = np.empty((bScans, aScans), dtype=np.float32)
+        self.slabs = dict((name, np.empty((bScans, aScans), dtype=np.float32)) for name in self.slabBounds)
+        self.histograms = np.zeros((bScans, bins), dtype=np.int64)
+        self.received = np.zeros(bScans, dtype=bool)
+        self._scratch = np.empty((aScans, depth), dtype=np.float32)
+        self._index = np.empty((aScans, depth), dtype=np.intp)
+        self.reset()
+
+    def reset(self):
+        """
+        Starts a new volume.
+        """
+        self.maximum[:] = np.nan
+        self.mean[:] = np.nan
+        for projection in self.slabs.values():
+            projection[:] = np.nan
+        self.histograms[:] = 0
+        self.received[:] = False
+        self._next = 0
+
+    @property
+    def count(self):
+        """
+        Number of distinct B-scans added.
+        """
+        return int(self.received.sum())
+
+    @property
+    def complete(self):
+        return bool(self.received.all())
+
+    def add(self, frame, bScan=None):
+        """
+        Adds one B-scan (AScans, Depth), or several consecutive ones
+        (n, AScans, Depth). A B-scan added again replaces the earlier one.
+
+        :param bScan: index of the (first) B-scan in the volume, the one after
+            the previously added if None
+        :return: index of the last B-scan added
+        """
+        frame = np.asarray(frame)
+        if frame.ndim == 2:
+            frame = frame[np.newaxis]
+        if frame.shape[1:] != self.volumeShape[1:]:
+            raise ValueError('PySpectralRadar: B-scan shape %s does not match %s'
+                             % (frame.shape[1:], self.volumeShape[1:]))
+        if bScan is None:
+            bScan = self._next
+        if bScan < 0 or bScan + frame.shape[0] > self.volumeShape[0]:
+            raise IndexError('PySpectralRadar: B-scans %d to %d are outside the volume of %d'
+                             % (bScan, bScan + frame.shape[0] - 1, self.volumeShape[0]))
+        for offset in range(frame.shape[0]):
+            self._addBScan(frame[offset], bScan + offset)
+        self._next = (bScan + frame.shape[0]) % self.volumeShape[0]
+        return bScan + frame.shape[0] - 1
+
+    def _addBScan(self, frame, index):
+        np.max(frame, axis=1, out=self.maximum[index])
+        np.mean(frame, axis=1, out=self.mean[index])
+        reduce = np.mean if self.slabMode == 'mean' else np.max
+        for name, (start, stop) in self.slabBounds.items():
+            reduce(frame[:, start:stop], axis=1, out=self.slabs[name][index])
+        # Bin index computed in place, np.histogram would sort or allocate
+        scratch = self._scratch
+        np.subtract(frame, self.histogramRange[0], out=scratch, casting='same_kind')
+        scratch *= self._binScale
+        # NaN survives clip and casts to an arbitrary index
+        np.nan_to_num(scratch, copy=False, nan=0.0)
+        np.clip(scratch, 0, self.bins - 1, out=scratch)
+        np.copyto(self._index, scratch, casting='unsafe')
+        self.histograms[index] = np.bincount(self._index.ravel(), minlength=self.bins)
+        self.received[index] = True
+
+    def binEdges(self):
+        return np.linspace(self.histogramRange[0], self.histogramRange[1], self.bins + 1)
+
+    def histogram(self, bScan=None):
+        """
+        :return: counts of one B-scan, or of all B-scans received if None
+        """
+        if bScan is None:
+            return self.histograms.sum(axis=0)
+        return self.histograms[bScan]
+
+    def percentile(self, q, bScan=None):
+        """
+        Percentile from the histogram, accurate to one bin, e.g. for the
+        contrast window of a preview.
+
+        :param q: percentile or sequence of percentiles in [0, 100]
+        """
+        counts = self.histogram(bScan)
+        total = counts.sum()
+        if total == 0:
+            raise RuntimeError('PySpectralRadar: no B-scans received')
+        cumulative = np.cumsum(counts)
+        target = np.asarray(q, dtype=np.float64)/100.0*total
+        index = np.minimum(np.searchsorted(cumulative, target, side='left'), self.bins - 1)
+        # Upper edge of the bin the percentile falls in
+        return self.binEdges()[index + 1]
+
+    def projections(self):
+        """
+        :return: dict of the en-face maps (BScans, AScans), 'maximum', 'mean'
+            and one entry per slab
+        """
+        result = {'maximum': self.maximum, 'mean': self.mean}
+        result.update(self.slabs)
+        return result
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Reads SpectralRadar / ThorImage exports without the SDK, e.g. on Linux
+analysis machines.
+
+Everything is memory-mapped where the file layout allows it, so opening a
+multi-GB file only parses its header and nothing is read until the array is
+sliced:
+
+    with OCTFile('scan.oct') as octFile:
+        print(octFile.names())              # e.g. ['Intensity', 'Spectral0', ...]
+        intensity = octFile['Intensity']    # (SizeY, SizeX, SizeZ) float32
+        print(octFile.metadata['Image']['SizeReal'])
+
+    complexVolume, info = openRaw('volume.raw', shape=(Size1, Size2, Size3), dtype=numpy.complex64)
+
+Arrays are returned in scan order, (BScans, AScans, Depth), the layout
+scanOrderView gives for arrays filled by the copy*Content functions.
+
+Supported: .oct containers (a ZIP archive with Header.xml), headerless RAW
+exports (Data3DExport_RAW, ComplexDataExport_RAW, RawDataExport_RAW) with
+the shape given or read from a JSON sidecar, SRM exports, and the VFF and
+legacy VTK volume exports, whose headers are self-describing.
+"""
+import json
+import os
+import struct
+import zipfile
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+
+# Data file types in Header.xml of .oct files
+_OCT_TYPES = {'Raw': np.uint16, 'Real': np.float32, 'Colored': np.uint32, 'Complex': np.complex64}
+_BYTES_PER_PIXEL = {1: np.uint8, 2: np.uint16, 4: np.float32, 8: np.complex64}
+
+_VTK_TYPES = {'unsigned_char': '>u1', 'char': '>i1', 'unsigned_short': '>u2', 'short': '>i2',
+              'unsigned_int': '>u4', 'int': '>i4', 'float': '>f4', 'double': '>f8'}
+_VFF_TYPES = {8: '>u1', 16: '>i2', 32: '>f4'}
+
+
+def _sidecarPath(path):
+    return path + '.json'
+
+
+def _memmap(path, dtype, shape, offset=0, mode='r'):
+    dtype = np.dtype(dtype)
+    size = os.path.getsize(path)
+    needed = offset + int(np.prod(shape))*dtype.itemsize
+    if needed > size:
+        raise ValueError('PySpectralRadar: %s holds %d bytes, %s %s from offset %d needs %d'
+                         % (path, size, shape, dtype, offset, needed))
+    return np.memmap(path, mode=mode, dtype=dtype, shape=tuple(shape), offset=offset)
+
+
+def _elementToDict(element):
+    """
+    Header.xml element as nested dicts: children by tag (lists when
+    repeated), attributes under '@name' and the text under '#text'.
+    """
+    result = dict(('@' + key, value) for key, value in element.attrib.items())
+    for child in element:
+        value = _elementToDict(child)
+        if child.tag in result:
+            if not isinstance(result[child.tag], list):
+                result[child.tag] = [result[child.tag]]
+            result[child.tag].append(value)
+        else:
+            result[child.tag] = value
+    text = (element.text or '').strip()
+    if not result:
+        return text
+    if text:
+        result['#text'] = text
+    return result
+
+
+class OCTFile(object):
+    """
+    A ThorImage .oct container. Data files stored uncompressed in the
+    archive are memory-mapped at their offset; compressed ones are read when
+    first accessed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        self.header = ElementTree.fromstring(self._zip.read('Header.xml'))
+        self.metadata = _elementToDict(self.header)
+        self.dataFiles = {}
+        for dataFile in self.header.iter('DataFile'):
+            entry = (dataFile.text or '').strip().replace('\\', '/')
+            attributes = dataFile.attrib
+            bytesPerPixel = int(attributes.get('BytesPerPixel', 0))
+            dtype = _OCT_TYPES.get(attributes.get('Type'))
+            if dtype is None or (bytesPerPixel and np.dtype(dtype).itemsize != bytesPerPixel):
+                dtype = _BYTES_PER_PIXEL.get(bytesPerPixel)
+            shape = tuple(int(attributes.get(size, 1)) for size in ('SizeY', 'SizeX', 'SizeZ'))
+            name = os.path.splitext(os.path.basename(entry))[0]
+            self.dataFiles[name] = {'entry': entry, 'type': attributes.get('Type'), 'dtype': dtype,
+                                    'shape': shape, 'attributes': dict(attributes)}
+        self._arrays = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def names(self):
+        """
+        Names of the data files, e.g. 'Intensity' for data/Intensity.data.
+        """
+        return list(self.dataFiles)
+
+    def __contains__(self, name):
+        return name in self.dataFiles
+
+    def __getitem__(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = self._load(self.dataFiles[name])
+        return array
+
+    def _load(self, dataFile):
+        if dataFile['dtype'] is None:
+            raise ValueError('PySpectralRadar: unknown pixel type of %s in %s' % (dataFile['entry'], self.path))
+        info = self._zip.getinfo(dataFile['entry'])
+        if info.compress_type == zipfile.ZIP_STORED:
+            # The local header repeats the name and may carry a different
+            # extra field than the central directory
+            with open(self.path, 'rb') as file:
+                file.seek(info.header_offset)
+                local = file.read(30)
+            nameLength, extraLength = struct.unpack('<HH', local[26:30])
+            offset = info.header_offset + 30 + nameLength + extraLength
+            return _memmap(self.path, dataFile['dtype'], dataFile['shape'], offset)
+        data = np.frombuffer(self._zip.read(info), dtype=dataFile['dtype'])
+        return data.reshape(dataFile['shape'])
+
+    def close(self):
+        self._arrays = {}
+        self._zip.close()
+
+
+def writeSidecar(path, shape, dtype, **metadata):
+    """
+    Records the SDK shape (Size1, Size2, Size3) and type of a RAW export
+    next to it, so openRaw needs no arguments later, e.g. right after
+    exportComplexData(ComplexData, ComplexDataExport_RAW, path).
+    """
+    sidecar = {'format': 'raw', 'dtype': np.dtype(dtype).str, 'shape': list(int(size) for size in shape[::-1]),
+               'metadata': metadata}
+    with open(_sidecarPath(path), 'w') as sidecarFile:
+        json.dump(sidecar, sidecarFile, indent=1)
+
+
+def openRaw(path, shape=None, dtype=None, offset=0, mode='r'):
+    """
+    Memory-maps a headerless RAW export, or a volumeRecorder recording.
+
+    :param shape: SDK shape (Size1, Size2, Size3) of the exported object. If
+        None it is taken from the JSON sidecar (path + '.json'), written by
+        writeSidecar or by volumeRecorder
+    :param dtype: float32 for Data, complex64 for ComplexData, uint16 for
+        RawData; from the sidecar if None
+    :return: (array in scan order, sidecar dict or {}). Recordings are cut
+        to the framesWritten of their sidecar, like openRecording does
+    """
+    sidecar = {}
+    if shape is None or dtype is None:
+        with open(_sidecarPath(path)) as sidecarFile:
+            sidecar = json.load(sidecarFile)
+    fileFormat = sidecar.get('format', 'raw')
+    if fileFormat == 'npy':
+        # volumeRecorder .npy files carry their own header
+        array = np.load(path, mmap_mode=mode)
+    elif fileFormat == 'raw':
+        memoryShape = tuple(sidecar['shape']) if shape is None else tuple(shape)[::-1]
+        dtype = np.dtype(sidecar['dtype'] if dtype is None else dtype)
+        array = _memmap(path, dtype, memoryShape, offset, mode)
+    else:
+        raise ValueError('PySpectralRadar: unknown format %r in the sidecar of %s' % (fileFormat, path))
+    if 'framesWritten' in sidecar:
+        array = array[:sidecar['framesWritten']]
+    return array, sidecar
+
+
+def openSRM(path, shape=None, dtype=np.float32):
+    """
+    Memory-maps an SRM export.
+
+    The SRM header is not documented. The payload is the last
+    Size1 * Size2 * Size3 values of the file, so the header is whatever
+    precedes it; it is returned unparsed for inspection.
+
+    :param shape: SDK shape (Size1, Size2, Size3), from the sidecar if None
+    :return: (array in scan order, dict with 'header' bytes and the sidecar)
+    """
+    sidecar = {}
+    if shape is None:
+        with open(_sidecarPath(path)) as sidecarFile:
+            sidecar = json.load(sidecarFile)
+        memoryShape = tuple(sidecar['shape'])
+        dtype = sidecar.get('dtype', dtype)
+    else:
+        memoryShape = tuple(shape)[::-1]
+    dtype = np.dtype(dtype)
+    offset = os.path.getsize(path) - int(np.prod(memoryShape))*dtype.itemsize
+    if offset < 0:
+        raise ValueError('PySpectralRadar: %s is smaller than a %s %s volume' % (path, memoryShape[::-1], dtype))
+    with open(path, 'rb') as file:
+        header = file.read(offset)
+    info = dict(sidecar)
+    info['header'] = header
+    return _memmap(path, dtype, memoryShape, offset), info
+
+
+def openVFF(path):
+    """
+    Memory-maps a VFF export. The text header ends with a form feed and
+    gives size=x y z and bits; the data that follows is big-endian with x
+    running fastest.
+
+    :return: (array (z, y, x), header dict)
+    """
+    with open(path, 'rb') as file:
+        head = file.read(1 << 16)
+    end = head.find(b'\x0c')
+    if not head.startswith(b'ncaa') or end < 0:
+        raise ValueError('PySpectralRadar: %s is not a VFF file' % path)
+    header = {}
+    for line in head[:end].decode('latin-1').splitlines()[1:]:
+        key, _, value = line.strip().rstrip(';').partition('=')
+        if key:
+            header[key.strip()] = value.strip()
+    offset = end + 1
+    if head[offset:offset + 1] == b'\n':
+        offset += 1
+    size = [int(value) for value in header['size'].split()]
+    dtype = _VFF_TYPES[int(header.get('bits', 8))]
+    return _memmap(path, dtype, tuple(size[::-1]), offset), header
+
+
+def openVTK(path):
+    """
+    Memory-maps a legacy binary VTK STRUCTURED_POINTS export (big-endian,
+    x running fastest).
+
+    :return: (array (z, y, x), header dict with dimensions, spacing and
+        origin)
+    """
+    header = {}
+    with open(path, 'rb') as file:
+        version = file.readline()
+        if not version.startswith(b'# vtk DataFile'):
+            raise ValueError('PySpectralRadar: %s is not a legacy VTK file' % path)
+        header['title'] = file.readline().decode('latin-1').strip()
+        if file.readline().strip().upper() != b'BINARY':
+            raise ValueError('PySpectralRadar: only binary VTK files can be memory-mapped')
+        while True:
+            line = file.readline()
+            if not line:
+                raise ValueError('PySpectralRadar: no scalar data in %s' % path)
+            words = line.decode('latin-1').split()
+            if not words:
+                continue
+            key = words[0].upper()
+            if key in ('DIMENSIONS', 'SPACING', 'ORIGIN', 'ASPECT_RATIO'):
+                header[key.lower()] = [float(word) for word in words[1:4]]
+            elif key == 'SCALARS':
+                header['name'] = words[1]
+                header['type'] = words[2]
+            elif key == 'LOOKUP_TABLE':
+                offset = file.tell()
+                break
+    dimensions = [int(size) for size in header['dimensions']]
+    dtype = _VTK_TYPES[header.get('type', 'float')]
+    return _memmap(path, dtype, tuple(dimensions[::-1]), offset), header
+
+
+def openExport(path, **kwargs):
+    """
+    Opens an export by its extension: .oct returns an OCTFile, the others
+    (array, metadata) from openRaw, openSRM, openVFF or openVTK.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.oct':
+        return OCTFile(path)
+    if extension == '.srm':
+        return openSRM(path, **kwargs)
+    if extension == '.vff':
+        return openVFF(path)
+    if extension == '.vtk':
+        return openVTK(path)
+    return openRaw(path, **kwargs)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Preallocated frame buffers for continuous acquisition.
+
+A FrameRing allocates all of its slots once, in one page-aligned block, and
+hands them out to copyRawDataContent / copyComplexDataContent. Consumers
+release slots back to the ring when they are done with a frame, so steady
+state acquisition does not allocate or page-fault.
+"""
+import mmap
+import threading
+from collections import deque
+import numpy as np
+
+import PySpectralRadar as SR
+
+PAGE_SIZE = mmap.PAGESIZE
+
+
+def alignedEmpty(shape, dtype, alignment=PAGE_SIZE):
+    """
+    Like numpy.empty, but the first element is aligned to alignment bytes.
+    """
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape))*dtype.itemsize
+    buffer = np.empty(nbytes + alignment, dtype=np.uint8)
+    offset = (-buffer.ctypes.data) % alignment
+    return buffer[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
+class FrameRing(object):
+    """
+    Fixed set of C-contiguous, page-aligned frame slots with a thread-safe
+    free list. acquire blocks while every slot is in use, which gives the
+    producer backpressure from slow consumers.
+    """
+
+    def __init__(self, shape, dtype, slots=8):
+        """
+        :param shape: shape of one frame, e.g. from getRawDataShape
+        :param dtype: numpy.uint16 for raw data, numpy.complex64 for complex
+            data, numpy.float32 for processed data
+        :param slots: number of frames that can be in flight at once
+        """
+        self.shape = tuple(int(size) for size in shape)
+        self.dtype = np.dtype(dtype)
+        frameBytes = int(np.prod(self.shape))*self.dtype.itemsize
+        self.stride = -(-frameBytes//PAGE_SIZE)*PAGE_SIZE
+        self._block = alignedEmpty((slots*self.stride,), np.uint8)
+        # Touch every page now instead of on the first frames
+        self._block.fill(0)
+        self.slots = [self._block[index*self.stride:index*self.stride + frameBytes]
+                      .view(self.dtype).reshape(self.shape) for index in range(slots)]
+        self._index = {id(slot): index for index, slot in enumerate(self.slots)}
+        self._free = deque(range(slots))
+        self._inUse = [False]*slots
+        self._condition = threading.Condition()
+
+    @classmethod
+    def forRawData(cls, RawData, slots=8):
+        """
+        Ring sized for the frames currently described by a RawDataHandle.
+        """
+        return cls(SR.getRawDataShape(RawData), np.uint16, slots)
+
+    @classmethod
+    def forComplexData(cls, ComplexData, slots=8):
+        """
+        Ring sized for the frames currently described by a ComplexDataHandle.
+        """
+        prop = SR.DataPropertyInt
+        shape = [SR.getComplexDataPropertyInt(ComplexData, size)
+                 for size in (prop.Data_Size1, prop.Data_Size2, prop.Data_Size3)]
+        return cls(shape, np.complex64, slots)
+
+    def __len__(self):
+        return len(self.slots)
+
+    @property
+    def available(self):
+        """
+        Number of free slots.
+        """
+        with self._condition:
+            return len(self._free)
+
+    def acquire(self, block=True, timeout=None):
+        """
+        :return: a free slot, or None if block is False or timeout expires
+            while every slot is in use
+        """
+        with self._condition:
+            if block and not self._free:
+                self._condition.wait_for(lambda: self._free, timeout)
+            if not self._free:
+                return None
+            index = self._free.popleft()
+            self._inUse[index] = True
+            return self.slots[index]
+
+    def release(self, slot):
+        """
+        Returns a slot obtained from acquire to the ring.
+        """
+        index = self._index.get(id(slot))
+        if index is None:
+            raise ValueError('PySpectralRadar: array does not belong to this FrameRing')
+        with self._condition:
+            if not self._inUse[index]:
+                raise ValueError('PySpectralRadar: FrameRing slot released twice')
+            self._inUse[index] = False
+            self._free.append(index)
+            self._condition.notify()
+
+    def copyRawData(self, RawData, block=True, timeout=None):
+        """
+        Copies the content of a RawDataHandle into a free slot.
+
+        :return: the filled slot, or None if no slot became free
+        """
+        slot = self.acquire(block, timeout)
+        if slot is not None:
+            try:
+                SR.copyRawDataContent(RawData, slot)
+            except BaseException:
+                # A failed copy must not cost the ring a slot
+                self.release(slot)
+                raise
+        return slot
+
+    def copyComplexData(self, ComplexData, block=True, timeout=None):
+        """
+        Copies the content of a ComplexDataHandle into a free slot.
+
+        :return: the filled slot, or None if no slot became free
+        """
+        slot = self.acquire(block, timeout)
+        if slot is not None:
+            try:
+                SR.copyComplexDataContent(ComplexData, slot)
+            except BaseException:
+                # A failed copy must not cost the ring a slot
+                self.release(slot)
+                raise
+        return slot
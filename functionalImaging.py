@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Phase-resolved Doppler and OCT angiography on complex volumes.
+
+Inputs are complex64 arrays in scan order (BScans, AScans, Depth), e.g.
+
+    copyComplexDataContent(ComplexData, content)
+    volume = scanOrderView(content)
+
+For angiography every position is scanned repeats times in a row, so the
+B-scans are grouped as (Positions, repeats). All kernels work on blocks of a
+few B-scans and write into a preallocated float32 output, so temporaries stay
+bounded by the block size and a 500 frame volume needs no more than its
+output in addition to the input.
+"""
+import numpy as np
+
+
+def _blocks(n, size):
+    for start in range(0, n, size):
+        yield slice(start, min(start + size, n))
+
+
+def _axialSum(a, window):
+    """
+    Moving sum over the last axis with a centred window of odd length,
+    truncated at the ends.
+    """
+    if window <= 1:
+        return a
+    # Accumulated in double precision, a float32 running sum over a long
+    # A-scan loses the small values next to the strong ones
+    cumulative = np.cumsum(a, axis=-1, dtype=np.complex128 if np.iscomplexobj(a) else np.float64)
+    half = window//2
+    depth = a.shape[-1]
+    upper = np.minimum(np.arange(depth) + half, depth - 1)
+    lower = np.arange(depth) - half - 1
+    result = cumulative[..., upper]
+    valid = lower >= 0
+    result[..., valid] -= cumulative[..., lower[valid]]
+    return result.astype(a.dtype)
+
+
+def _repeatGroups(volume, repeats):
+    if repeats < 2:
+        raise ValueError('PySpectralRadar: angiography needs at least 2 repeats')
+    if volume.shape[0] % repeats:
+        raise ValueError('PySpectralRadar: %d B-scans are not a multiple of %d repeats'
+                         % (volume.shape[0], repeats))
+    return volume.reshape((volume.shape[0]//repeats, repeats) + volume.shape[1:])
+
+
+def dopplerPhase(volume, axialWindow=1, out=None, blockSize=8):
+    """
+    Kasai phase shift between adjacent A-scans,
+    angle(sum over axialWindow of x[a + 1] * conj(x[a])).
+
+    :param volume: complex array (BScans, AScans, Depth)
+    :param axialWindow: odd number of depth pixels averaged in the
+        autocorrelation, which lowers phase noise at the cost of resolution
+    :param out: float32 array (BScans, AScans - 1, Depth) to write into
+    :param blockSize: B-scans processed at a time
+    :return: phase shift in radians, float32 (BScans, AScans - 1, Depth)
+    """
+    bScans, aScans, depth = volume.shape
+    if out is None:
+        out = np.empty((bScans, aScans - 1, depth), dtype=np.float32)
+    for block in _blocks(bScans, blockSize):
+        frames = volume[block]
+        product = frames[:, 1:]*np.conj(frames[:, :-1])
+        out[block] = np.angle(_axialSum(product, axialWindow))
+    return out
+
+
+def dopplerVelocity(phase, lineRate_Hz, centerWavelength_nm, refractiveIndex=1.33):
+    """
+    Axial velocity in mm/s from a Doppler phase shift, v = phase * lambda0 *
+    f / (4 pi n), in place if phase is a float32 array.
+    """
+    phase = np.asarray(phase, dtype=np.float32)
+    phase *= np.float32(centerWavelength_nm*1e-6*lineRate_Hz/(4*np.pi*refractiveIndex))
+    return phase
+
+
+def speckleVariance(volume, repeats, logIntensity=False, out=None, blockSize=4):
+    """
+    Inter-frame variance of the intensity |x|^2 across repeated B-scans.
+
+    :param volume: complex array (Positions * repeats, AScans, Depth)
+    :param logIntensity: use 10*log10 intensity, which weights weak and
+        strong scatterers more evenly
+    :param out: float32 array (Positions, AScans, Depth) to write into
+    :param blockSize: positions processed at a time
+    :return: float32 (Positions, AScans, Depth)
+    """
+    groups = _repeatGroups(volume, repeats)
+    if out is None:
+        out = np.empty((groups.shape[0],) + groups.shape[2:], dtype=np.float32)
+    for block in _blocks(groups.shape[0], blockSize):
+        frames = groups[block]
+        intensity = frames.real*frames.real
+        intensity += frames.imag*frames.imag
+        if logIntensity:
+            np.maximum(intensity, np.finfo(np.float32).tiny, out=intensity)
+            np.log10(intensity, out=intensity)
+            intensity *= 10
+        np.var(intensity, axis=1, out=out[block])
+    return out
+
+
+def complexDecorrelation(volume, repeats, axialWindow=3, out=None, blockSize=4):
+    """
+    Complex decorrelation across repeated B-scans, averaged over the
+    repeats - 1 adjacent pairs:
+
+        D = 1 - |sum x[r + 1] conj(x[r])| / (0.5 sum (|x[r]|^2 + |x[r + 1]|^2))
+
+    with the sums over axialWindow depth pixels. 0 for static tissue, towards
+    1 for flow.
+
+    :param volume: complex array (Positions * repeats, AScans, Depth)
+    :param out: float32 array (Positions, AScans, Depth) to write into
+    :param blockSize: positions processed at a time
+    :return: float32 (Positions, AScans, Depth)
+    """
+    groups = _repeatGroups(volume, repeats)
+    if out is None:
+        out = np.empty((groups.shape[0],) + groups.shape[2:], dtype=np.float32)
+    tiny = np.finfo(np.float32).tiny
+    for block in _blocks(groups.shape[0], blockSize):
+        frames = groups[block]
+        intensity = frames.real*frames.real
+        intensity += frames.imag*frames.imag
+        correlation = np.abs(_axialSum(frames[:, 1:]*np.conj(frames[:, :-1]), axialWindow))
+        power = _axialSum(intensity, axialWindow)
+        power = 0.5*(power[:, 1:] + power[:, :-1])
+        np.maximum(power, tiny, out=power)
+        correlation /= power
+        result = out[block]
+        np.mean(correlation, axis=1, out=result)
+        np.subtract(1, result, out=result)
+    return out
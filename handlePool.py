@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Pooled RawData / Data / ComplexData handles with deterministic release.
+
+    with HandlePool() as session:
+        with session.raw_data() as raw, session.data() as volume:
+            getRawData(Dev, raw)
+            setProcessedDataOutput(Proc, volume)
+            executeProcessing(Proc, raw)
+
+Handles leaving a with block go back to the pool instead of being cleared,
+so the next acquisition reuses the SDK object and its native buffers.
+Closing the pool clears every idle handle and any handle still in use as
+soon as it is returned.
+"""
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import PySpectralRadar as SR
+
+_RAW = 'raw'
+_DATA = 'data'
+_COMPLEX = 'complex'
+
+
+def _factories():
+    # Looked up at call time so the pool follows PySpectralRadar.setBackend
+    return {
+        _RAW: (SR.createRawData, SR.clearRawData),
+        _DATA: (SR.createData, SR.clearData),
+        _COMPLEX: (SR.createComplexData, SR.clearComplexData),
+    }
+
+
+class HandlePool(object):
+    """
+    Thread-safe pool of SDK data handles. Keeps at most maxIdle unused
+    handles of each kind; surplus handles are cleared on release.
+    """
+
+    def __init__(self, maxIdle=4):
+        self.maxIdle = maxIdle
+        self.hits = 0
+        self.misses = 0
+        self._idle = {_RAW: deque(), _DATA: deque(), _COMPLEX: deque()}
+        self._live = {_RAW: 0, _DATA: 0, _COMPLEX: 0}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def acquire(self, kind):
+        """
+        :param kind: 'raw', 'data' or 'complex'
+        :return: an idle handle of that kind, or a newly created one
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('PySpectralRadar: HandlePool is closed')
+            self._live[kind] += 1
+            if self._idle[kind]:
+                self.hits += 1
+                return self._idle[kind].pop()
+            self.misses += 1
+        try:
+            return _factories()[kind][0]()
+        except Exception:
+            with self._lock:
+                self._live[kind] -= 1
+            raise
+
+    def release(self, kind, handle):
+        """
+        Returns a handle obtained from acquire. It is kept for reuse unless
+        the pool is closed or already holds maxIdle idle handles of the kind.
+        """
+        with self._lock:
+            self._live[kind] -= 1
+            if not self._closed and len(self._idle[kind]) < self.maxIdle:
+                self._idle[kind].append(handle)
+                return
+        _factories()[kind][1](handle)
+
+    @contextmanager
+    def _handle(self, kind):
+        handle = self.acquire(kind)
+        try:
+            yield handle
+        finally:
+            self.release(kind, handle)
+
+    def raw_data(self):
+        """
+        Context manager yielding a RawDataHandle.
+        """
+        return self._handle(_RAW)
+
+    def data(self):
+        """
+        Context manager yielding a DataHandle.
+        """
+        return self._handle(_DATA)
+
+    def complex_data(self):
+        """
+        Context manager yielding a ComplexDataHandle.
+        """
+        return self._handle(_COMPLEX)
+
+    def stats(self):
+        """
+        :return: dict with pool hits, misses, hitRate, and per kind the
+            number of live (in use) and idle handles
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits/requests if requests else 0.0,
+                'live': dict(self._live),
+                'idle': {kind: len(idle) for kind, idle in self._idle.items()},
+            }
+
+    def close(self):
+        """
+        Clears all idle handles. Handles still in use are cleared when they
+        are released.
+        """
+        with self._lock:
+            self._closed = True
+            idle = [(kind, handle) for kind, handles in self._idle.items() for handle in handles]
+            for handles in self._idle.values():
+                handles.clear()
+        factories = _factories()
+        for kind, handle in idle:
+            factories[kind][1](handle)
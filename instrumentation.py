@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in timing of every SpectralRadar call.
+
+Instrumentation is a backend proxy: installed with PySpectralRadar.setBackend
+in front of the DLL (or the simulator), it times each function the wrappers
+call and counts the bytes the copy*Content functions write. When it is not
+installed the wrappers call the backend directly, so the disabled mode costs
+nothing.
+
+    with Instrumentation(trace=True) as calls:
+        result = getSurfaceFrom3DScan(128, 10.0, 25, 10.0)
+    print(calls.report())
+    calls.writeChromeTrace('surface.json')   # open in chrome://tracing or Perfetto
+
+span(name) adds a named interval, e.g. around one acquisition, to the trace
+and the statistics.
+"""
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+import PySpectralRadar as SR
+
+# Functions whose second argument is the array the SDK copies into
+_COPY_FUNCTIONS = frozenset(('copyRawDataContent', 'copyDataContent', 'copyComplexDataContent'))
+
+# Latency histogram: logarithmic bins 2 % wide from 100 ns to about 3 hours
+_BIN_MINIMUM_S = 1e-7
+_BIN_GROWTH = math.log(1.02)
+_BINS = 1300
+
+
+class _Statistics(object):
+    """
+    Call count, total, maximum and latency histogram of one function, so
+    memory use does not grow with the number of calls. Percentiles are
+    accurate to one bin, 2 %.
+    """
+    __slots__ = ('calls', 'total', 'maximum', 'bytes', 'counts')
+
+    def __init__(self, copies=False):
+        self.counts = [0]*_BINS
+        self.bytes = 0 if copies else None
+        self.clear()
+
+    def clear(self):
+        self.calls = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.counts[:] = [0]*_BINS
+        if self.bytes is not None:
+            self.bytes = 0
+
+    def add(self, duration, nbytes=0):
+        self.calls += 1
+        self.total += duration
+        if duration > self.maximum:
+            self.maximum = duration
+        if duration > _BIN_MINIMUM_S:
+            index = min(int(math.log(duration/_BIN_MINIMUM_S)/_BIN_GROWTH), _BINS - 1)
+        else:
+            index = 0
+        self.counts[index] += 1
+        if nbytes:
+            self.bytes += nbytes
+
+    def percentile(self, q):
+        """
+        Upper edge of the bin the percentile falls in, at most the maximum.
+        """
+        cumulative = np.cumsum(self.counts)
+        index = int(np.searchsorted(cumulative, q/100.0*self.calls, side='left'))
+        return min(_BIN_MINIMUM_S*math.exp((index + 1)*_BIN_GROWTH), self.maximum)
+
+
+class Instrumentation(object):
+    """
+    Records per-function call counts, latencies and copied bytes, and with
+    trace=True every call as a Chrome trace event.
+    """
+
+    def __init__(self, backend=None, trace=False, maxTraceEvents=1000000):
+        """
+        :param backend: backend to forward calls to, the current
+            PySpectralRadar backend when installed if None
+        :param trace: keep one event per call for writeChromeTrace
+        :param maxTraceEvents: events kept at most; later calls are only
+            counted in the statistics
+        """
+        self._backend = backend
+        self._previous = None
+        self.trace = trace
+        self.maxTraceEvents = maxTraceEvents
+        self._origin = time.perf_counter()
+        self._statistics = {}
+        self._events = []
+        # Calls arrive from acquisition and worker threads at once
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Forgets all recorded calls.
+        """
+        # Cleared in place, the bound wrappers hold on to the statistics
+        with self._lock:
+            for statistics in self._statistics.values():
+                statistics.clear()
+            del self._events[:]
+
+    # Backend proxy -----------------------------------------------------------
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        function = getattr(self._backend, name)
+        if not callable(function):
+            return function
+        wrapper = self._wrap(name, function)
+        setattr(self, name, wrapper)
+        return wrapper
+
+    def _statisticsFor(self, name, copies=False):
+        with self._lock:
+            statistics = self._statistics.get(name)
+            if statistics is None:
+                statistics = self._statistics[name] = _Statistics(copies)
+            return statistics
+
+    def _wrap(self, name, function):
+        copies = name in _COPY_FUNCTIONS
+        statistics = self._statisticsFor(name, copies)
+
+        def call(*args):
+            start = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                stop = time.perf_counter()
+                self._add(statistics, name, start, stop, args[1].nbytes if copies else 0)
+        call.__name__ = name
+        return call
+
+    def _add(self, statistics, name, start, stop, nbytes=0):
+        with self._lock:
+            statistics.add(stop - start, nbytes)
+            if self.trace and len(self._events) < self.maxTraceEvents:
+                self._events.append((name, start, stop, threading.get_ident(), nbytes))
+
+    # Installation ------------------------------------------------------------
+
+    def install(self):
+        """
+        Puts this proxy in front of the current PySpectralRadar backend.
+        """
+        if self._previous is not None:
+            return self
+        if self._backend is None:
+            self._backend = SR.getBackend()
+        self._previous = SR.setBackend(self)
+        return self
+
+    def uninstall(self):
+        """
+        Restores the backend that was active before install.
+        """
+        if self._previous is not None:
+            SR.setBackend(self._previous)
+            self._previous = None
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+    @contextmanager
+    def span(self, name):
+        """
+        Times the with block as name, e.g. 'acquireVolume', alongside the SDK
+        calls made inside it.
+        """
+        statistics = self._statisticsFor(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(statistics, name, start, time.perf_counter())
+
+    # Results -------------------------------------------------------------------
+
+    def summary(self):
+        """
+        :return: dict mapping each called function to calls, total_s, mean_s,
+            p50_s, p99_s, max_s and, for the copy functions, bytes and
+            bytesPerSecond. Percentiles are accurate to 2 %
+        """
+        summary = {}
+        with self._lock:
+            for name, statistics in self._statistics.items():
+                if not statistics.calls:
+                    continue
+                stats = {
+                    'calls': statistics.calls,
+                    'total_s': statistics.total,
+                    'mean_s': statistics.total/statistics.calls,
+                    'p50_s': statistics.percentile(50),
+                    'p99_s': statistics.percentile(99),
+                    'max_s': statistics.maximum,
+                }
+                if statistics.bytes is not None:
+                    stats['bytes'] = statistics.bytes
+                    stats['bytesPerSecond'] = statistics.bytes/statistics.total if statistics.total > 0 else 0.0
+                summary[name] = stats
+        return summary
+
+    def toJSON(self, path=None):
+        """
+        :return: summary as a JSON string, also written to path if given
+        """
+        text = json.dumps(self.summary(), indent=2, sort_keys=True)
+        if path is not None:
+            with open(path, 'w') as file:
+                file.write(text)
+        return text
+
+    def report(self):
+        """
+        :return: text table of the summary, most expensive function first
+        """
+        lines = ['%-28s %8s %11s %10s %10s %10s' % ('function', 'calls', 'total [ms]', 'p50 [ms]',
+                                                     'p99 [ms]', 'MB copied')]
+        summary = self.summary()
+        for name in sorted(summary, key=lambda key: -summary[key]['total_s']):
+            stats = summary[name]
+            copied = '%10.1f' % (stats['bytes']/1e6) if 'bytes' in stats else '%10s' % '-'
+            lines.append('%-28s %8d %11.2f %10.3f %10.3f %s' % (name, stats['calls'], 1e3*stats['total_s'],
+                                                               1e3*stats['p50_s'], 1e3*stats['p99_s'], copied))
+        return '\n'.join(lines)
+
+    def writeChromeTrace(self, path):
+        """
+        Writes the recorded calls as complete ('X') events in the Chrome trace
+        event format. Needs trace=True.
+        """
+        pid = os.getpid()
+        events = []
+        # Snapshot, calls on other threads may still be appending
+        with self._lock:
+            recorded = list(self._events)
+        for name, start, stop, thread, nbytes in recorded:
+            event = {
+                'name': name,
+                'ph': 'X',
+                'ts': 1e6*(start - self._origin),
+                'dur': 1e6*(stop - start),
+                'pid': pid,
+                'tid': thread,
+            }
+            if nbytes:
+                event['args'] = {'bytes': nbytes}
+            events.append(event)
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
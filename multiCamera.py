@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Synchronized acquisition from several cameras, e.g. balanced or
+polarization-sensitive detection.
+
+MultiCameraStream reads every camera with getRawDataEx on its own thread and
+copies the frames of one trigger into one preallocated slot of shape
+(Cameras, Size1, Size2, Size3). Each camera's part of the slot is a
+C-contiguous SDK-shaped array that copyRawDataContent fills directly, so the
+combined array and the per-camera arrays are views of the same memory and no
+frame is copied twice:
+
+    with MultiCameraStream(Dev, Pattern, cameras=2) as stream:
+        for frame in stream:
+            balanced = frame.camera(0).astype(numpy.int32) - frame.camera(1)
+            frame.release()
+
+Frames are matched by their position in each camera's frame sequence,
+counting RawData_LostFrames. When one camera loses frames the others do not,
+the cameras that fell behind read ahead until all agree again (or the frame
+is flagged or an error raised, see misaligned).
+"""
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import PySpectralRadar as SR
+from acquisitionStream import AcquisitionStream
+from dataLayout import LayoutCache
+from frameRing import FrameRing
+
+_END = None
+
+
+class MultiCameraFrame(object):
+    """
+    The frames of all cameras for one trigger. data is a FrameRing slot
+    (Cameras, Size1, Size2, Size3) and is only valid until release is
+    called. lostFrames counts, per camera, the frames since the previous
+    one that were lost on the device or skipped to resync.
+    """
+    __slots__ = ('index', 'data', 'deviceFrames', 'lostFrames', 'aligned', 'timestamp', '_ring')
+
+    def __init__(self, index, data, deviceFrames, lostFrames, timestamp, ring):
+        self.index = index
+        self.data = data
+        self.deviceFrames = deviceFrames
+        self.lostFrames = lostFrames
+        self.aligned = len(set(deviceFrames)) == 1
+        self.timestamp = timestamp
+        self._ring = ring
+
+    def camera(self, index):
+        """
+        Frame of one camera, shaped like the array copyRawDataContent fills.
+        """
+        return self.data[index]
+
+    def release(self):
+        if self._ring is not None:
+            self._ring.release(self.data)
+            self._ring = None
+            self.data = None
+
+
+class MultiCameraStream(object):
+    """
+    Producer running startMeasurement and, per trigger, getRawDataEx /
+    copyRawDataContent for every camera in parallel until stop is called.
+    Waits for a free slot like AcquisitionStream, so frames that cannot be
+    buffered are lost on the device side.
+    """
+
+    def __init__(self, Dev, Pattern, cameras=2, slots=8, misaligned='resync', maxResync=16,
+                 Type=SR.AcquisitionType.Acquisition_AsyncContinuous, layouts=None):
+        """
+        :param Dev: OCTDeviceHandle
+        :param Pattern: ScanPatternHandle to acquire continuously
+        :param cameras: camera indices 0 .. cameras - 1 read with getRawDataEx
+        :param slots: frames buffered between producer and consumers
+        :param misaligned: what happens when the cameras' lost-frame counters
+            disagree: 'resync' reads ahead on the cameras that are behind,
+            'flag' delivers the frame with aligned False, 'raise' stops the
+            stream with a RuntimeError
+        :param maxResync: extra frames read per camera before resync gives up
+            and raises
+        :param layouts: LayoutCache shared with other streams on the pattern
+        """
+        if misaligned not in ('resync', 'flag', 'raise'):
+            raise ValueError("PySpectralRadar: misaligned must be 'resync', 'flag' or 'raise'")
+        self.Dev = Dev
+        self.Pattern = Pattern
+        self.cameras = cameras
+        self.slots = slots
+        self.misaligned = misaligned
+        self.maxResync = maxResync
+        self.Type = Type
+        self.layouts = layouts if layouts is not None else LayoutCache()
+        self.ring = None
+        self.framesAcquired = 0
+        self.lostFrames = [0]*cameras
+        self.resyncedFrames = [0]*cameras
+        self.misalignedFrames = 0
+        # Position of the last frame read in each camera's sequence
+        self._deviceFrames = [-1]*cameras
+        self._queue = queue.Queue(maxsize=slots + 1)
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self._error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __iter__(self):
+        while True:
+            frame = self.get()
+            if frame is None:
+                return
+            yield frame
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError('PySpectralRadar: MultiCameraStream already started')
+        self._thread = threading.Thread(target=self._run, name='MultiCameraStream', daemon=True)
+        self._thread.start()
+
+    def _read(self, camera, RawData, slot):
+        """
+        getRawDataEx for one camera and, if slot is given, the copy into its
+        part of the slot. Runs on the camera's thread.
+        """
+        SR.getRawDataEx(self.Dev, RawData, camera)
+        lost = SR.getRawDataPropertyInt(RawData, SR.RawDataPropertyInt.RawData_LostFrames)
+        if SR.getRawDataPropertyInt(RawData, SR.RawDataPropertyInt.RawData_Size1) == 0:
+            raise RuntimeError('PySpectralRadar: camera %d delivered no data' % camera)
+        self.lostFrames[camera] += lost
+        self._deviceFrames[camera] += lost + 1
+        if slot is not None:
+            SR.copyRawDataContent(RawData, slot[camera])
+        return lost
+
+    def _readAll(self, executor, handles, slot):
+        futures = [executor.submit(self._read, camera, handles[camera], slot) for camera in range(self.cameras)]
+        return tuple(future.result() for future in futures)
+
+    def _resync(self, handles, slot):
+        """
+        Reads ahead on the cameras that are behind until every camera is at
+        the same position in its frame sequence.
+        """
+        for _ in range(self.maxResync):
+            newest = max(self._deviceFrames)
+            behind = [camera for camera in range(self.cameras) if self._deviceFrames[camera] < newest]
+            if not behind:
+                return True
+            for camera in behind:
+                self._read(camera, handles[camera], slot)
+                self.resyncedFrames[camera] += 1
+        return len(set(self._deviceFrames)) == 1
+
+    def _acquireSlot(self):
+        while not self._stopEvent.is_set():
+            slot = self.ring.acquire(timeout=0.1)
+            if slot is not None:
+                return slot
+        return None
+
+    def _run(self):
+        handles = [SR.createRawData() for _ in range(self.cameras)]
+        executor = ThreadPoolExecutor(self.cameras, thread_name_prefix='Camera')
+        try:
+            SR.startMeasurement(self.Dev, self.Pattern, self.Type)
+            # The first frame fixes the layout before there is a ring to copy into
+            previous = list(self._deviceFrames)
+            self._readAll(executor, handles, None)
+            layout = self.layouts.raw(self.Pattern, handles[0])
+            self.ring = FrameRing((self.cameras,) + tuple(layout.shape), layout.dtype, self.slots)
+            slot = self._acquireSlot()
+            if slot is not None:
+                list(executor.map(lambda camera: SR.copyRawDataContent(handles[camera], slot[camera]),
+                                  range(self.cameras)))
+            while slot is not None:
+                timestamp = time.perf_counter()
+                if len(set(self._deviceFrames)) != 1:
+                    self.misalignedFrames += 1
+                    if self.misaligned == 'raise' or (self.misaligned == 'resync' and not self._resync(handles, slot)):
+                        raise RuntimeError('PySpectralRadar: cameras out of step, frame positions %s'
+                                           % (self._deviceFrames,))
+                # After the positions _resync has advanced
+                lost = tuple(current - last - 1 for current, last in zip(self._deviceFrames, previous))
+                previous = list(self._deviceFrames)
+                self._queue.put(MultiCameraFrame(self._deviceFrames[0], slot, tuple(self._deviceFrames), lost,
+                                                 timestamp, self.ring))
+                self.framesAcquired += 1
+                if self._stopEvent.is_set():
+                    break
+                slot = self._acquireSlot()
+                if slot is not None:
+                    self._readAll(executor, handles, slot)
+        except Exception as error:
+            self._error = error
+        finally:
+            executor.shutdown()
+            try:
+                SR.stopMeasurement(self.Dev)
+            finally:
+                for RawData in handles:
+                    SR.clearRawData(RawData)
+                self._queue.put(_END)
+
+    def get(self, timeout=None):
+        """
+        :return: the next MultiCameraFrame, or None once the stream has
+            stopped and every queued frame has been taken
+        :raises queue.Empty: if timeout expires first
+        """
+        frame = self._queue.get(timeout=timeout)
+        if frame is _END:
+            self._queue.put(_END)
+            if self._error is not None:
+                raise self._error
+        return frame
+
+    def stop(self, timeout=None):
+        """
+        Stops the producer, which calls stopMeasurement. Frames still queued
+        can be taken with get afterwards.
+        """
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def _consume(stream, frames):
+    start = None
+    taken = 0
+    for frame in stream:
+        if start is None:
+            start = time.perf_counter()
+        else:
+            taken += 1
+        frame.release()
+        if taken == frames:
+            break
+    if start is None:
+        # Failed or stopped before the first frame, so there is no ring either
+        stream.stop()
+        if stream._error is not None:
+            raise stream._error
+        raise RuntimeError('PySpectralRadar: the stream delivered no frames')
+    elapsed = time.perf_counter() - start
+    stream.stop()
+    # Drain so the producer can finish
+    for frame in stream:
+        frame.release()
+    return taken/elapsed if elapsed > 0 else 0.0
+
+
+def benchmarkMultiCamera(Dev, Pattern, cameraCounts=(2,), frames=64, slots=8):
+    """
+    Frame rate of the single camera path (AcquisitionStream, getRawData)
+    and of MultiCameraStream with each number of cameras.
+
+    :return: list of dicts with cameras (0 for the single camera path),
+        framesPerSecond, megabytesPerSecond, lostFrames and, for several
+        cameras, misalignedFrames
+    """
+    results = []
+    with AcquisitionStream(Dev, Pattern, slots=slots) as stream:
+        rate = _consume(stream, frames)
+    frameBytes = stream.ring.slots[0].nbytes
+    results.append({'cameras': 0, 'framesPerSecond': rate, 'megabytesPerSecond': rate*frameBytes/1e6,
+                    'lostFrames': stream.lostFrames})
+    for cameras in cameraCounts:
+        with MultiCameraStream(Dev, Pattern, cameras=cameras, slots=slots) as stream:
+            rate = _consume(stream, frames)
+        results.append({'cameras': cameras, 'framesPerSecond': rate,
+                        'megabytesPerSecond': rate*stream.ring.slots[0].nbytes/1e6,
+                        'lostFrames': sum(stream.lostFrames), 'misalignedFrames': stream.misalignedFrames})
+    return results
+
+
+def main():
+    from simulatedDevice import useSimulatedBackend
+
+    for realTime in (True, False):
+        useSimulatedBackend(cameras=4, realTime=realTime)
+        Dev = SR.initDevice()
+        Probe = SR.initProbe(Dev, 'Probe')
+        Pattern = SR.createBScanPattern(Probe, 2.0, 1024, True)
+        print('realTime=%s' % realTime)
+        print('cameras   frames/s      MB/s   lost')
+        for result in benchmarkMultiCamera(Dev, Pattern, cameraCounts=(1, 2, 4)):
+            print('%7s %10.1f %9.1f %6d' % (result['cameras'] or 'single', result['framesPerSecond'],
+                                            result['megabytesPerSecond'], result['lostFrames']))
+        SR.clearScanPattern(Pattern)
+        SR.closeProbe(Probe)
+        SR.closeDevice(Dev)
+
+
+if __name__ == "__main__":
+    main()
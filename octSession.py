@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Long-lived device session.
+
+Opening the device, probe and processing and applying presets takes seconds,
+an acquisition tens of milliseconds. OCTSession does the former once and
+keeps scan patterns, data handles and layouts for reuse:
+
+    with OCTSession(preset=PRESET, presetCategory=CATEGORY) as session:
+        while running:
+            surface = session.acquire_surface(10.0, 128, 10.0, 25)
+
+If the device stops delivering data, the acquisition raises DeviceError, the
+session reopens the device (reconnect) and the acquisition is retried.
+"""
+import time
+
+import PySpectralRadar as SR
+from dataLayout import LayoutCache, handleKey
+from handlePool import HandlePool
+from scanPatterns import ScanPatternCache
+from softwareProcessing import scanOrderView
+from surfaceDetection import detectSurface
+
+
+class DeviceError(RuntimeError):
+    """
+    The device reported an error or delivered no data, e.g. after a trigger
+    timeout.
+    """
+
+
+class OCTSession(object):
+    """
+    Device, probe and processing kept open between acquisitions.
+
+    lastAcquisition holds actualTime (startMeasurement to data received, s),
+    expectedTime (expectedAcquisitionTime_s) and lostFrames of the most
+    recent acquisition.
+    """
+
+    def __init__(self, probeFile="Probe_Standard_OCTG_LSM04.ini", presetCategory=None, preset=None,
+                 aScanAveraging=1, retries=1, maxPatterns=8, maxIdleHandles=2):
+        """
+        :param presetCategory: Category argument of setDevicePreset
+        :param preset: Preset argument of setDevicePreset, None to keep the
+            device defaults
+        :param aScanAveraging: probe oversampling and processing A-scan
+            averaging
+        :param retries: reconnect and retry this many times when an
+            acquisition fails with DeviceError
+        """
+        self.probeFile = probeFile
+        self.presetCategory = presetCategory
+        self.preset = preset
+        self.aScanAveraging = aScanAveraging
+        self.retries = retries
+        self.Dev = self.Probe = self.Proc = None
+        self.zSpacing = None
+        self.reconnects = 0
+        self.lastAcquisition = None
+        self.layouts = LayoutCache()
+        self.patterns = ScanPatternCache(maxPatterns, onEvict=self._forgetPattern)
+        self.pool = HandlePool(maxIdleHandles)
+        self._expectedTimes = {}
+        self._volumes = {}
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def isOpen(self):
+        return self.Dev is not None
+
+    def open(self):
+        """
+        Opens the device, probe and processing and applies the presets.
+        """
+        if self.isOpen:
+            return
+        try:
+            self.Dev = SR.initDevice()
+            self.Probe = SR.initProbe(self.Dev, self.probeFile)
+            self.Proc = SR.createProcessingForDevice(self.Dev)
+            if self.preset is not None:
+                SR.setDevicePreset(self.Dev, self.presetCategory, self.Probe, self.Proc, self.preset)
+            if self.aScanAveraging > 1:
+                SR.setProbeParameterInt(self.Probe, SR.ProbeParameterInt.Probe_Oversampling, self.aScanAveraging)
+                SR.setProcessingParameterInt(self.Proc, SR.ProcessingParameterInt.Processing_AScanAveraging,
+                                             self.aScanAveraging)
+            self.zSpacing = SR.getDevicePropertyFloat(self.Dev, SR.DevicePropertyFloat.Device_zSpacing)
+        except Exception:
+            self._teardown()
+            raise
+
+    def _teardown(self):
+        # Best effort: after a device fault any of these may fail as well.
+        # clear drops each pattern before clearing it, so retrying moves on
+        while len(self.patterns):
+            try:
+                self.patterns.clear()
+            except Exception:
+                pass
+        try:
+            self.layouts.invalidate()
+        except Exception:
+            pass
+        self._volumes.clear()
+        for close, handle in ((SR.clearProcessing, self.Proc), (SR.closeProbe, self.Probe),
+                              (SR.closeDevice, self.Dev)):
+            if handle is not None:
+                try:
+                    close(handle)
+                except Exception:
+                    pass
+        self.Dev = self.Probe = self.Proc = None
+
+    def close(self):
+        """
+        Clears the patterns and handles and closes the device.
+        """
+        self._teardown()
+        self.pool.close()
+
+    def reconnect(self):
+        """
+        Closes and reopens the device, probe and processing. Patterns and
+        layouts are recreated on next use; pooled data handles are kept.
+        """
+        self._teardown()
+        self.reconnects += 1
+        self.open()
+
+    def checkHealth(self):
+        """
+        :return: True if the session is open and the SDK reports no error.
+            Reading the error clears it.
+        """
+        if not self.isOpen:
+            return False
+        errorCode, _ = SR.getError()
+        return errorCode == 0
+
+    def _forgetPattern(self, Pattern):
+        self.layouts.invalidate(Pattern=Pattern)
+        self._expectedTimes.pop(handleKey(Pattern), None)
+        # The volume buffer is as large as the acquisition, drop it with the pattern
+        self._volumes.pop(handleKey(Pattern), None)
+
+    def _withReconnect(self, acquire):
+        self.open()
+        for attempt in range(self.retries + 1):
+            try:
+                return acquire()
+            except DeviceError:
+                if attempt == self.retries:
+                    raise
+                self.reconnect()
+
+    def _volumePattern(self, RangeX, SizeX, RangeY, SizeY):
+        return self.patterns.get(self.Probe, 'volume', RangeX=RangeX, SizeX=SizeX, RangeY=RangeY, SizeY=SizeY,
+                                 AcqOrder=SR.ScanPatternAcquisitionOrder.ScanPattern_AcqOrderAll)
+
+    def _acquire(self, Pattern, RawData):
+        """
+        One complete frame of Pattern into RawData, with timing in
+        lastAcquisition.
+        """
+        start = time.perf_counter()
+        SR.startMeasurement(self.Dev, Pattern, SR.AcquisitionType.Acquisition_AsyncContinuous)
+        try:
+            SR.getRawData(self.Dev, RawData)
+        finally:
+            SR.stopMeasurement(self.Dev)
+        actualTime = time.perf_counter() - start
+        errorCode, message = SR.getError()
+        if errorCode != 0 or SR.getRawDataPropertyInt(RawData, SR.RawDataPropertyInt.RawData_NumberOfElements) == 0:
+            raise DeviceError('PySpectralRadar: no data from device (%d: %s)' % (errorCode, message))
+        expectedTime = self._expectedTimes.get(handleKey(Pattern))
+        if expectedTime is None:
+            expectedTime = self._expectedTimes[handleKey(Pattern)] = SR.expectedAcquisitionTime_s(Pattern, self.Dev)
+        self.lastAcquisition = {
+            'actualTime': actualTime,
+            'expectedTime': expectedTime,
+            'lostFrames': SR.getRawDataPropertyInt(RawData, SR.RawDataPropertyInt.RawData_LostFrames),
+        }
+
+    def _acquireVolume(self, geometry, out):
+        Pattern = self._volumePattern(*geometry)
+        with self.pool.raw_data() as RawData, self.pool.data() as Volume:
+            self._acquire(Pattern, RawData)
+            SR.setProcessedDataOutput(self.Proc, Volume)
+            SR.executeProcessing(self.Proc, RawData)
+            layout = self.layouts.data(Pattern, self.Proc, Volume)
+            if out is None:
+                out = self._volumes.get(handleKey(Pattern))
+                if out is None or out.shape != layout.shape:
+                    out = self._volumes[handleKey(Pattern)] = layout.empty()
+            SR.copyDataContent(Volume, out)
+        return scanOrderView(out)
+
+    def acquire_volume(self, RangeX, SizeX, RangeY, SizeY, out=None):
+        """
+        Acquires and processes one volume.
+
+        :param out: float32 array in the SDK shape (Depth, AScans, BScans) to
+            copy the volume into. If None a buffer owned by the session is
+            used, which the next acquisition on the same geometry overwrites
+        :return: dB volume in scan order (BScans, AScans, Depth)
+        """
+        return self._withReconnect(lambda: self._acquireVolume((RangeX, SizeX, RangeY, SizeY), out))
+
+    def acquire_surface(self, RangeX, SizeX, RangeY, SizeY, medianSize=3, **detectOptions):
+        """
+        Acquires one volume and detects its surface, see
+        surfaceDetection.detectSurface for detectOptions.
+
+        :return: float32 depth map in mm, (SizeY, SizeX)
+        """
+        volume = self.acquire_volume(RangeX, SizeX, RangeY, SizeY)
+        return detectSurface(volume, self.zSpacing, medianSize=medianSize, **detectOptions)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Display-ready uint8 B-scans for live preview.
+
+BScanPreview turns one frame of dB values (copyDataContent), magnitudes or
+complex data into an 8 bit image without float temporaries: the frame is
+block-averaged down to the display size, and every value is mapped to a grey
+level with one table lookup indexed by the upper bits of its float32 bit
+pattern. The log compression, contrast window and gamma are all folded into
+the table, which is rebuilt only when they change.
+
+    preview = BScanPreview((AScans, Depth), downsample=(2, 2), scale='dB', dBRange=(40, 100))
+    for frame in stream:
+        image = preview.render(scanOrderView(frame.data)[0])   # (Depth / 2, AScans / 2) uint8
+
+render writes into the same output buffer every time; copy the image if it
+has to outlive the next call.
+"""
+import time
+import numpy as np
+
+# Bits of the float32 pattern dropped before the lookup for each scale. 16
+# leaves 7 mantissa bits, 0.03 dB for magnitudes; dB values themselves need 3
+# more for the same resolution at 100 dB.
+_SHIFTS = {'magnitude': 16, 'intensity': 16, 'dB': 12}
+_DECIBELS = {'magnitude': 20.0, 'intensity': 10.0}
+
+
+class BScanPreview(object):
+    """
+    Lookup-table conversion of B-scans to uint8 grey levels with integer
+    downsampling and reused buffers.
+    """
+
+    def __init__(self, frameShape, downsample=(1, 1), scale='dB', dBRange=(40.0, 100.0), gamma=1.0,
+                 transpose=True):
+        """
+        :param frameShape: (AScans, Depth) of the frames passed to render
+        :param downsample: integer (AScans, Depth) factors; blocks of that
+            size are averaged into one display pixel
+        :param scale: what the frames hold, 'dB' (20*log10 magnitude as in
+            Data), 'magnitude' or 'intensity' (squared magnitude). Complex
+            frames are accepted with 'intensity'
+        :param dBRange: dB values shown as black and white
+        :param gamma: exponent applied to the normalized grey level
+        :param transpose: return images as (Depth, AScans), depth running
+            down the screen
+        """
+        if scale not in _SHIFTS:
+            raise ValueError("PySpectralRadar: preview scale must be 'dB', 'magnitude' or 'intensity'")
+        self.frameShape = tuple(frameShape)
+        self.downsample = tuple(int(factor) for factor in downsample)
+        if min(self.downsample) < 1:
+            raise ValueError('PySpectralRadar: downsampling factors must be positive integers')
+        self.scale = scale
+        self.transpose = transpose
+        self._shift = _SHIFTS[scale]
+        self.imageShape = tuple(n//factor for n, factor in zip(self.frameShape, self.downsample))
+        self._blocked = self.downsample != (1, 1)
+        self._sum = np.empty(self.imageShape, dtype=np.float32)
+        self._intensity = None
+        self._index = np.empty(self.imageShape, dtype=np.uint32)
+        self._image = np.empty(self.imageShape, dtype=np.uint8)
+        self._output = np.empty(self.imageShape[::-1], dtype=np.uint8) if transpose else self._image
+        self.setContrast(dBRange[0], dBRange[1], gamma)
+
+    @classmethod
+    def fitTo(cls, frameShape, displayShape, **kwargs):
+        """
+        Smallest integer downsampling that fits a frame into displayShape,
+        both (AScans, Depth).
+        """
+        downsample = tuple(max(1, -(-n//d)) for n, d in zip(frameShape, displayShape))
+        return cls(frameShape, downsample=downsample, **kwargs)
+
+    def setContrast(self, low, high, gamma=None):
+        """
+        Rebuilds the lookup table for a new dB window and gamma.
+        """
+        if high <= low:
+            raise ValueError('PySpectralRadar: dB range must be increasing')
+        self.dBRange = (float(low), float(high))
+        if gamma is not None:
+            self.gamma = float(gamma)
+        size = 1 << (32 - self._shift)
+        # Every table entry stands for the centre of the float32 values that
+        # share its upper bits
+        patterns = (np.arange(size, dtype=np.uint32) << self._shift) | np.uint32(1 << (self._shift - 1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = patterns.view(np.float32).astype(np.float64)
+            # Blocks are summed, not averaged, the division happens here
+            values /= self.downsample[0]*self.downsample[1]
+            if self.scale == 'dB':
+                decibels = values
+            else:
+                decibels = _DECIBELS[self.scale]*np.log10(values)
+            level = np.clip((decibels - low)/(high - low), 0.0, 1.0)
+        level = np.nan_to_num(level, nan=0.0)
+        if self.gamma != 1.0:
+            level **= self.gamma
+        self._lut = np.round(255*level).astype(np.uint8)
+
+    def _downsampled(self, frame):
+        a, z = self.imageShape
+        fa, fz = self.downsample
+        blocks = frame[:a*fa, :z*fz].reshape(a, fa, z, fz)
+        # Strided adds are much faster than a reduction over two axes
+        np.copyto(self._sum, blocks[:, 0, :, 0], casting='same_kind')
+        for i in range(fa):
+            for j in range(fz):
+                if i or j:
+                    np.add(self._sum, blocks[:, i, :, j], out=self._sum, casting='same_kind')
+        return self._sum
+
+    def render(self, frame, out=None):
+        """
+        :param frame: one B-scan (AScans, Depth) in the configured scale, e.g.
+            scanOrderView(data)[bscan]
+        :param out: uint8 array of the image shape to write into
+        :return: uint8 image, (Depth, AScans) after downsampling if transpose,
+            the internal buffer unless out is given
+        """
+        frame = np.asarray(frame)
+        if frame.shape != self.frameShape:
+            raise ValueError('PySpectralRadar: frame shape %s does not match %s' % (frame.shape, self.frameShape))
+        if np.iscomplexobj(frame):
+            if self.scale != 'intensity':
+                raise ValueError("PySpectralRadar: complex frames need scale='intensity'")
+            if self._intensity is None:
+                self._intensity = np.empty(self.frameShape, dtype=np.float32)
+            np.multiply(frame.real, frame.real, out=self._intensity)
+            self._intensity += frame.imag*frame.imag
+            frame = self._intensity
+        if self._blocked:
+            frame = self._downsampled(frame)
+        elif frame.dtype != np.float32 or not frame.flags.c_contiguous:
+            np.copyto(self._sum, frame, casting='same_kind')
+            frame = self._sum
+        np.right_shift(frame.view(np.uint32), self._shift, out=self._index)
+        if out is None:
+            out = self._output
+        if self.transpose:
+            np.take(self._lut, self._index, out=self._image)
+            # Gathering straight into the transposed layout is several times
+            # slower than one transposed copy
+            np.copyto(out, self._image.T)
+        else:
+            np.take(self._lut, self._index, out=out)
+        return out
+
+
+def benchmarkPreview(frameShape=(1024, 1024), downsample=(1, 1), frames=200, scale='dB', **options):
+    """
+    Renders the same synthetic frame repeatedly.
+
+    :return: dict with framesPerSecond and time_ms per frame
+    """
+    random = np.random.default_rng(0)
+    if scale == 'dB':
+        frame = random.uniform(30.0, 110.0, size=frameShape).astype(np.float32)
+    else:
+        frame = random.rayleigh(1e3, size=frameShape).astype(np.float32)
+    preview = BScanPreview(frameShape, downsample=downsample, scale=scale, **options)
+    preview.render(frame)
+    start = time.perf_counter()
+    for _ in range(frames):
+        preview.render(frame)
+    elapsed = time.perf_counter() - start
+    return {'framesPerSecond': frames/elapsed, 'time_ms': 1e3*elapsed/frames}
+
+
+def main():
+    print('scale       downsample   frames/s   time [ms]')
+    for scale in ('dB', 'magnitude'):
+        for downsample in ((1, 1), (2, 2)):
+            result = benchmarkPreview(downsample=downsample, scale=scale)
+            print('%-10s %11s %10.1f %11.2f' % (scale, '%dx%d' % downsample, result['framesPerSecond'],
+                                                result['time_ms']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-process software processing over shared memory.
+
+Raw frames are copied straight into slots of a multiprocessing.shared_memory
+block (copyRawDataContent writes into the slot), worker processes run
+SoftwareProcessing and optionally detectSurface on their slot and write the
+result into a second shared block. Only slot numbers travel through the
+queues, frames are never pickled. Results are handed out in submission
+order:
+
+    with ProcessingPool(wavelengths, (2048, 512, 1), workers=8) as pool:
+        for RawData in acquisition:
+            while not pool.free or pool.ready:
+                result = pool.get()
+                use(result.data)
+                result.release()
+            pool.submit(RawData)
+
+Workers only import NumPy and the processing modules, never the DLL, so the
+pool also works with the spawn start method (Windows); create it under
+if __name__ == "__main__" there.
+"""
+import multiprocessing as mp
+import queue
+import time
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+
+import PySpectralRadar as SR
+from softwareProcessing import SoftwareProcessing, scanOrderView
+from surfaceDetection import detectSurface
+
+_OUTPUTS = ('dB', 'complex', 'surface')
+
+
+def _outputLayout(frameShape, output):
+    pixels, aScans, bScans = frameShape
+    if output == 'dB':
+        return (pixels//2, aScans, bScans), np.float32
+    if output == 'complex':
+        return (pixels//2, aScans, bScans), np.complex64
+    return (bScans, aScans), np.float32
+
+
+def _attach(name, shape, dtype, slots):
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray((slots,) + tuple(shape), dtype=dtype, buffer=block.buf)
+
+
+def _worker(config, tasks, results):
+    inputBlock, inputs = _attach(config['inputName'], config['frameShape'], np.uint16, config['slots'])
+    outputShape, outputDtype = _outputLayout(config['frameShape'], config['output'])
+    outputBlock, outputs = _attach(config['outputName'], outputShape, outputDtype, config['slots'])
+    engine = SoftwareProcessing(config['wavelengths'], window=config['window'], background=config['background'])
+    volume = None
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            sequence, slot = task
+            try:
+                if config['output'] == 'dB':
+                    engine.processData(inputs[slot], out=outputs[slot])
+                elif config['output'] == 'complex':
+                    engine.processComplex(inputs[slot], out=outputs[slot])
+                else:
+                    volume = engine.processData(inputs[slot], out=volume)
+                    outputs[slot] = detectSurface(scanOrderView(volume), config['zSpacing_mm'],
+                                                  **config['surfaceOptions'])
+                results.put((sequence, slot, None))
+            except Exception as error:
+                results.put((sequence, slot, '%s: %s' % (type(error).__name__, error)))
+    finally:
+        del inputs, outputs
+        inputBlock.close()
+        outputBlock.close()
+
+
+class ProcessedFrame(object):
+    """
+    Result of one submitted frame. data is a view into shared memory and is
+    only valid until release is called.
+    """
+    __slots__ = ('index', 'data', '_pool', '_slot')
+
+    def __init__(self, index, data, pool, slot):
+        self.index = index
+        self.data = data
+        self._pool = pool
+        self._slot = slot
+
+    def release(self):
+        if self._pool is not None:
+            self._pool._free.append(self._slot)
+            self._pool = None
+            self.data = None
+
+
+class ProcessingPool(object):
+    """
+    Worker processes running SoftwareProcessing on raw frames of one shape.
+    """
+
+    def __init__(self, wavelengths, frameShape, workers=None, slots=None, output='dB',
+                 window=None, background=None, zSpacing_mm=None, surfaceOptions=None, context=None):
+        """
+        :param wavelengths: wavelength in nm of each spectrometer pixel
+        :param frameShape: SDK shape (Pixels, AScans, BScans) of the raw frames,
+            e.g. DataLayout.shape from LayoutCache.raw
+        :param workers: number of processes, os.cpu_count() if None
+        :param slots: frames in flight, twice the number of workers if None
+        :param output: 'dB' and 'complex' give arrays shaped like
+            copyDataContent / copyComplexDataContent fill, 'surface' a depth
+            map (BScans, AScans) in mm from detectSurface
+        :param zSpacing_mm: pixel depth, required for 'surface'
+        :param surfaceOptions: keyword arguments for detectSurface
+        :param context: multiprocessing context, the default one if None
+        """
+        if output not in _OUTPUTS:
+            raise ValueError('PySpectralRadar: output must be one of %s' % (_OUTPUTS,))
+        if output == 'surface' and zSpacing_mm is None:
+            raise ValueError('PySpectralRadar: surface output needs zSpacing_mm')
+        context = context or mp.get_context()
+        self.workers = workers or mp.cpu_count()
+        self.slots = slots or 2*self.workers
+        self.frameShape = tuple(int(size) for size in frameShape)
+        self.output = output
+        outputShape, outputDtype = _outputLayout(self.frameShape, output)
+
+        inputBytes = self.slots*int(np.prod(self.frameShape))*2
+        outputBytes = self.slots*int(np.prod(outputShape))*np.dtype(outputDtype).itemsize
+        self._inputBlock = shared_memory.SharedMemory(create=True, size=inputBytes)
+        self._outputBlock = shared_memory.SharedMemory(create=True, size=outputBytes)
+        self.inputs = np.ndarray((self.slots,) + self.frameShape, dtype=np.uint16, buffer=self._inputBlock.buf)
+        self.outputs = np.ndarray((self.slots,) + outputShape, dtype=outputDtype, buffer=self._outputBlock.buf)
+
+        self._free = deque(range(self.slots))
+        self._submitted = 0
+        self._next = 0
+        self._finished = {}
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        config = {
+            'inputName': self._inputBlock.name,
+            'outputName': self._outputBlock.name,
+            'frameShape': self.frameShape,
+            'slots': self.slots,
+            'output': output,
+            'wavelengths': np.asarray(wavelengths, dtype=np.float64),
+            'window': window,
+            'background': background,
+            'zSpacing_mm': zSpacing_mm,
+            'surfaceOptions': surfaceOptions or {},
+        }
+        self._processes = [context.Process(target=_worker, args=(config, self._tasks, self._results),
+                                           name='ProcessingPool-%d' % index, daemon=True)
+                           for index in range(self.workers)]
+        for process in self._processes:
+            process.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def pending(self):
+        """
+        Submitted frames whose result has not been taken with get yet.
+        """
+        return self._submitted - self._next
+
+    @property
+    def free(self):
+        """
+        Number of slots available to submit.
+        """
+        return len(self._free)
+
+    @property
+    def ready(self):
+        """
+        True if get can return the next result in order without waiting.
+        """
+        self._collect(block=False)
+        return self._next in self._finished
+
+    def submit(self, RawData=None, frame=None):
+        """
+        Copies one raw frame into a free slot and queues it. Either RawData
+        (copied with copyRawDataContent) or frame (a uint16 array of
+        frameShape) must be given.
+
+        :return: the frame's sequence number
+        :raises RuntimeError: if no slot is free; slots are freed by
+            releasing the results of get
+        """
+        if not self._free:
+            raise RuntimeError('PySpectralRadar: no free ProcessingPool slot, get and release results first')
+        slot = self._free.popleft()
+        if RawData is not None:
+            SR.copyRawDataContent(RawData, self.inputs[slot])
+        else:
+            np.copyto(self.inputs[slot], frame)
+        sequence = self._submitted
+        self._submitted += 1
+        self._tasks.put((sequence, slot))
+        return sequence
+
+    def _collect(self, block, deadline=None):
+        """
+        Moves finished results from the queue into the reorder buffer.
+
+        :return: number of results collected
+        """
+        collected = 0
+        while True:
+            try:
+                if block and collected == 0:
+                    timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+                    sequence, slot, error = self._results.get(timeout=timeout)
+                else:
+                    sequence, slot, error = self._results.get_nowait()
+            except queue.Empty:
+                return collected
+            self._finished[sequence] = (slot, error)
+            collected += 1
+
+    def get(self, timeout=None):
+        """
+        :return: ProcessedFrame of the oldest submitted frame, waiting for it
+            if necessary
+        :raises queue.Empty: if timeout expires first
+        :raises RuntimeError: if the worker failed on this frame
+        """
+        if self.pending == 0:
+            raise RuntimeError('PySpectralRadar: no frames submitted to ProcessingPool')
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self._next not in self._finished:
+            if self._collect(block=True, deadline=deadline) == 0:
+                raise queue.Empty
+        slot, error = self._finished.pop(self._next)
+        index = self._next
+        self._next += 1
+        if error is not None:
+            self._free.append(slot)
+            raise RuntimeError('PySpectralRadar: processing worker failed on frame %d: %s' % (index, error))
+        return ProcessedFrame(index, self.outputs[slot], self, slot)
+
+    def close(self):
+        """
+        Stops the workers and frees the shared memory. Views of results not
+        yet released become invalid.
+        """
+        if self._processes is None:
+            return
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join()
+        self._processes = None
+        self.inputs = self.outputs = None
+        for block in (self._inputBlock, self._outputBlock):
+            block.close()
+            block.unlink()
+
+
+def benchmarkProcessingPool(wavelengths, frameShape, workerCounts=(1, 2, 4), frames=64, output='dB', **options):
+    """
+    Processes the same synthetic frame repeatedly with each number of
+    workers.
+
+    :return: list of dicts with workers and framesPerSecond
+    """
+    frame = np.random.default_rng(0).integers(0, 4096, size=frameShape, dtype=np.uint16)
+    results = []
+    for workers in workerCounts:
+        with ProcessingPool(wavelengths, frameShape, workers=workers, output=output, **options) as pool:
+            # Warm up every worker before timing
+            for _ in range(workers):
+                pool.submit(frame=frame)
+            for _ in range(workers):
+                pool.get().release()
+            start = time.perf_counter()
+            for _ in range(frames):
+                while not pool.free or pool.ready:
+                    pool.get().release()
+                pool.submit(frame=frame)
+            while pool.pending:
+                pool.get().release()
+            elapsed = time.perf_counter() - start
+        results.append({'workers': workers, 'framesPerSecond': frames/elapsed})
+    return results
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized freeform scan pattern generation and a cache of created
+ScanPatternHandles.
+
+Every generator returns a FreeformPattern whose positions are already in the
+layout createFreeformScanPattern expects: a 1D float32 array of interleaved
+x, y pairs in mm, of length 2 * sizeX * sizeY, where sizeX is the number of
+A-scans per B-scan and sizeY the number of B-scans.
+
+    pattern = figureEightPositions(0.1, 200)
+    Handle = createFreeformScanPattern(Probe, pattern.positions, pattern.sizeX, pattern.sizeY, FALSE)
+"""
+from collections import OrderedDict, namedtuple
+import numpy as np
+
+import PySpectralRadar as SR
+from dataLayout import handleKey
+
+FreeformPattern = namedtuple('FreeformPattern', ('positions', 'sizeX', 'sizeY'))
+
+
+def interleave(x, y):
+    """
+    :param x: x positions in mm, array (BScans, AScans)
+    :param y: y positions in mm, same shape as x
+    :return: FreeformPattern with x, y interleaved as float32
+    """
+    x = np.atleast_2d(x)
+    positions = np.empty(2*x.size, dtype=np.float32)
+    positions[0::2] = x.ravel()
+    positions[1::2] = np.broadcast_to(y, x.shape).ravel()
+    return FreeformPattern(positions, x.shape[1], x.shape[0])
+
+
+def rasterPositions(rangeX, sizeX, rangeY, sizeY, bidirectional=False):
+    """
+    Volume raster centred on the origin, one B-scan per row. With
+    bidirectional every other B-scan runs backwards, which removes the
+    flyback between B-scans.
+    """
+    x = np.linspace(-rangeX/2, rangeX/2, sizeX)
+    y = np.linspace(-rangeY/2, rangeY/2, sizeY)
+    x = np.tile(x, (sizeY, 1))
+    if bidirectional:
+        x[1::2] = x[1::2, ::-1]
+    return interleave(x, y[:, np.newaxis])
+
+
+def figureEightPositions(size, aScansPer8, repeats=1):
+    """
+    Figure-8 of dimensions size x size/2 mm, repeated as repeats B-scans.
+    """
+    t = np.linspace(0, 2*np.pi, aScansPer8, endpoint=False)
+    x = size*np.cos(t)
+    y = (size/2)*np.sin(2*t)
+    return interleave(np.tile(x, (repeats, 1)), np.tile(y, (repeats, 1)))
+
+
+def spiralPositions(radius, aScans, turns, repeats=1):
+    """
+    Outward spiral with radius growing as the square root of time, which
+    samples the disc with roughly uniform density.
+    """
+    s = np.sqrt(np.linspace(0, 1, aScans))
+    r = radius*s
+    theta = 2*np.pi*turns*s
+    return interleave(np.tile(r*np.cos(theta), (repeats, 1)), np.tile(r*np.sin(theta), (repeats, 1)))
+
+
+def lissajousPositions(rangeX, rangeY, aScans, frequencyX, frequencyY, phase=np.pi/2, repeats=1):
+    """
+    Lissajous figure over one period, frequencies as integer cycles per
+    B-scan.
+    """
+    t = np.linspace(0, 2*np.pi, aScans, endpoint=False)
+    x = (rangeX/2)*np.sin(frequencyX*t + phase)
+    y = (rangeY/2)*np.sin(frequencyY*t)
+    return interleave(np.tile(x, (repeats, 1)), np.tile(y, (repeats, 1)))
+
+
+def radialPositions(rangeR, aScansPerLine, numberOfLines):
+    """
+    numberOfLines B-scans of length rangeR through the origin, evenly spaced
+    in angle over 180 degrees.
+    """
+    r = np.linspace(-rangeR/2, rangeR/2, aScansPerLine)
+    angle = np.pi*np.arange(numberOfLines)/numberOfLines
+    return interleave(np.cos(angle)[:, np.newaxis]*r, np.sin(angle)[:, np.newaxis]*r)
+
+
+_GENERATORS = {
+    'raster': rasterPositions,
+    'figureEight': figureEightPositions,
+    'spiral': spiralPositions,
+    'lissajous': lissajousPositions,
+    'radial': radialPositions,
+}
+
+
+class ScanPatternCache(object):
+    """
+    LRU cache of ScanPatternHandles keyed by probe, pattern kind and
+    geometry. Evicted patterns are cleared with clearScanPattern, after
+    calling onEvict(Pattern) so e.g. a LayoutCache can be invalidated.
+
+        patterns = ScanPatternCache()
+        Pattern = patterns.get(Probe, 'spiral', radius=1.0, aScans=2048, turns=8)
+    """
+
+    def __init__(self, maxSize=8, apodization=SR.FALSE, onEvict=None):
+        self.maxSize = maxSize
+        self.apodization = apodization
+        self.onEvict = onEvict
+        self.hits = 0
+        self.misses = 0
+        self._patterns = OrderedDict()
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def get(self, Probe, kind, **geometry):
+        """
+        :param kind: 'raster', 'figureEight', 'spiral', 'lissajous' or
+            'radial' for freeform patterns, 'volume' or 'bscan' for the
+            SDK's own createVolumePattern / createBScanPattern
+        :param geometry: keyword arguments of the generator or SDK function,
+            including ApoType and AcqOrder for 'volume'
+        :return: ScanPatternHandle, created on first use
+        """
+        key = (handleKey(Probe), kind, tuple(sorted(geometry.items())))
+        Pattern = self._patterns.get(key)
+        if Pattern is not None:
+            self._patterns.move_to_end(key)
+            self.hits += 1
+            return Pattern
+        self.misses += 1
+        Pattern = self._create(Probe, kind, geometry)
+        self._patterns[key] = Pattern
+        while len(self._patterns) > self.maxSize:
+            self._evict(self._patterns.popitem(last=False)[1])
+        return Pattern
+
+    def _create(self, Probe, kind, geometry):
+        if kind == 'volume':
+            order = {key: geometry[key] for key in ('ApoType', 'AcqOrder') if key in geometry}
+            return SR.createVolumePattern(Probe, geometry['RangeX'], geometry['SizeX'],
+                                          geometry['RangeY'], geometry['SizeY'], **order)
+        if kind == 'bscan':
+            return SR.createBScanPattern(Probe, geometry['Range'], geometry['AScans'], self.apodization)
+        pattern = _GENERATORS[kind](**geometry)
+        return SR.createFreeformScanPattern(Probe, pattern.positions, pattern.sizeX, pattern.sizeY,
+                                            self.apodization)
+
+    def _evict(self, Pattern):
+        if self.onEvict is not None:
+            self.onEvict(Pattern)
+        SR.clearScanPattern(Pattern)
+
+    def clear(self):
+        """
+        Clears every cached pattern.
+        """
+        while self._patterns:
+            self._evict(self._patterns.popitem(last=False)[1])
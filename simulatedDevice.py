@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated SpectralRadar backend. Implements the DLL functions used by the
+PySpectralRadar wrappers in pure Python/NumPy, so the full acquisition path
+can be run and profiled on machines without Thorlabs hardware or software:
+
+    import PySpectralRadar as SR
+    from simulatedDevice import useSimulatedBackend
+    useSimulatedBackend(lineRate_Hz=LINE_RATE_146kHz)
+    Dev = SR.initDevice()
+
+Frames are delivered at the configured A-line rate. The device keeps a buffer
+of bufferFrames frames; when the caller falls further behind than that, the
+oldest frames are dropped and reported through RawData_LostFrames, as with
+the real camera.
+"""
+import threading
+import time
+import numpy as np
+
+import PySpectralRadar as SR
+from softwareProcessing import SoftwareProcessing, scanOrderView
+
+LINE_RATE_146kHz = 146000.0
+LINE_RATE_76kHz = 76000.0
+LINE_RATE_28kHz = 28000.0
+LINE_RATE_5_5kHz = 5500.0
+
+
+class _Device(object):
+    def __init__(self):
+        self.pattern = None
+        self.acquisitionType = None
+        self.startTime = 0.0
+        # Frames handed out so far, per camera
+        self.delivered = [0]
+        self.triggerMode = SR.Device_TriggerType.Trigger_FreeRunning
+        self.lock = threading.Lock()
+
+
+class _Probe(object):
+    def __init__(self, name):
+        self.name = name
+        self.oversampling = 1
+        self.oversamplingSlowAxis = 1
+
+
+class _Processing(object):
+    def __init__(self, engine):
+        self.engine = engine
+        self.aScanAveraging = 1
+        self.dataOutput = None
+        self.complexOutput = None
+
+
+class _ScanPattern(object):
+    def __init__(self, probe, xPositions, yPositions, acquireAll=False):
+        """
+        :param xPositions: positions in mm of the A-scans of each B-scan,
+            array (BScans, AScans)
+        """
+        self.probe = probe
+        self.xPositions = np.asarray(xPositions, dtype=np.float64)
+        self.yPositions = np.asarray(yPositions, dtype=np.float64)
+        self.acquireAll = acquireAll
+
+    @property
+    def aScans(self):
+        return self.xPositions.shape[1]*self.probe.oversampling
+
+    @property
+    def bScans(self):
+        return self.xPositions.shape[0]
+
+    @property
+    def bScansPerFrame(self):
+        return self.bScans if self.acquireAll else 1
+
+    @property
+    def linesPerFrame(self):
+        return self.aScans*self.bScansPerFrame
+
+
+class _RawData(object):
+    def __init__(self):
+        self.shape = (0, 0, 0)
+        self.pattern = None
+        self.frame = 0
+        self.lostFrames = 0
+        self.camera = 0
+        self.device = None
+
+
+class _Data(object):
+    def __init__(self):
+        self.content = None
+
+
+class SimulatedSpectralRadar(object):
+    """
+    Backend object for PySpectralRadar.setBackend. Methods share the names
+    and argument order of the DLL functions they replace.
+    """
+
+    def __init__(self, lineRate_Hz=LINE_RATE_146kHz, numberOfPixels=2048,
+                 centerWavelength_nm=930.0, spectralWidth_nm=100.0,
+                 bufferFrames=16, realTime=True, maxSyntheticBScans=64,
+                 presetLineRates=None, triggerTimeout_s=1.0, dispersion=(0.0, 0.0), cameras=1, seed=0):
+        """
+        :param lineRate_Hz: A-line rate frames are delivered at
+        :param numberOfPixels: spectrometer pixels per spectrum
+        :param bufferFrames: frames the device can hold before dropping
+        :param realTime: if False frames are always ready immediately, which
+            measures the wrapper overhead alone
+        :param maxSyntheticBScans: distinct B-scans synthesized per pattern,
+            larger patterns repeat them
+        :param presetLineRates: dict mapping the Preset argument of
+            setDevicePreset to a line rate
+        :param triggerTimeout_s: how long getRawData waits on a disconnected
+            device before reporting a timeout, see simulateDisconnect
+        :param dispersion: (a2, a3) second and third order dispersion mismatch
+            in radians at the band edge, as compensated by
+            dispersion.DispersionCompensation
+        :param cameras: cameras read with getRawDataEx. Every further camera
+            sees the balanced complement of camera 0, 2 * reference - spectrum
+        """
+        self.lineRate_Hz = float(lineRate_Hz)
+        self.numberOfPixels = numberOfPixels
+        self.centerWavelength_nm = centerWavelength_nm
+        self.spectralWidth_nm = spectralWidth_nm
+        self.bufferFrames = bufferFrames
+        self.realTime = realTime
+        self.maxSyntheticBScans = maxSyntheticBScans
+        self.presetLineRates = presetLineRates or {}
+        self.triggerTimeout_s = triggerTimeout_s
+        self.dispersion = dispersion
+        self.cameras = cameras
+        self.connected = True
+        self._error = (0, '')
+        self._random = np.random.default_rng(seed)
+        pixel = np.arange(numberOfPixels, dtype=np.float64)
+        # Spectrometers are close to linear in wavelength, not in k
+        self.wavelengths = (centerWavelength_nm - spectralWidth_nm/2
+                            + spectralWidth_nm*pixel/(numberOfPixels - 1))
+        self.reference = 200.0 + 2500.0*np.exp(-((pixel - numberOfPixels/2)/(numberOfPixels/4))**2)
+        self._synthetic = {}
+
+    # Geometry of the simulated sample ----------------------------------------
+
+    @property
+    def zSpacing_mm(self):
+        pixelWidth = self.spectralWidth_nm/(self.numberOfPixels - 1)
+        zRange = self.centerWavelength_nm**2/(4*pixelWidth)*1e-6
+        return zRange/(self.numberOfPixels//2)
+
+    def surfaceDepth_mm(self, x, y):
+        """
+        Depth of the simulated sample surface below the zero delay at lateral
+        position (x, y) in mm.
+        """
+        zRange = self.zSpacing_mm*(self.numberOfPixels//2)
+        return zRange*(0.25 + 0.05*np.sin(1.3*x) + 0.04*np.cos(0.9*y) + 0.01*x)
+
+    def _synthesize(self, pattern, bScan):
+        """
+        Spectra of one B-scan as (AScans, Pixels) uint16, i.e. the memory
+        layout of RawData.
+        """
+        x = np.repeat(pattern.xPositions[bScan], pattern.probe.oversampling)
+        y = np.full_like(x, pattern.yPositions[bScan])
+        surface = self.surfaceDepth_mm(x, y)
+        layers = surface[:, np.newaxis] + np.array([0.0, 0.15, 0.4])
+        reflectivity = np.array([0.3, 0.1, 0.05], dtype=np.float32)
+        k = (2*np.pi/(self.wavelengths*1e-6)).astype(np.float32)
+        # Wavenumber normalized to [-1, 1] over the band for the dispersion
+        kNormalized = 2*(k - k.min())/(k.max() - k.min()) - 1
+        a2, a3 = self.dispersion
+        dispersion = (a2*kNormalized**2 + a3*kNormalized**3).astype(np.float32)
+        fringes = np.ones((x.size, self.numberOfPixels), dtype=np.float32)
+        phase = np.empty_like(fringes)
+        for layer in range(layers.shape[1]):
+            np.multiply(2*k, layers[:, layer:layer + 1].astype(np.float32), out=phase)
+            phase += dispersion
+            np.cos(phase, out=phase)
+            phase *= reflectivity[layer]
+            fringes += phase
+        fringes *= self.reference.astype(np.float32)
+        fringes += self._random.standard_normal(fringes.shape, dtype=np.float32)*4.0
+        return np.clip(fringes, 0, 4095).astype(np.uint16)
+
+    def _bScanSpectra(self, pattern, bScan, camera=0):
+        bank = self._synthetic.setdefault(id(pattern), {})
+        key = (bScan % self.maxSyntheticBScans, camera)
+        spectra = bank.get(key)
+        if spectra is None:
+            if camera:
+                complement = 2*self.reference.astype(np.float32) - self._bScanSpectra(pattern, bScan)
+                spectra = np.clip(complement, 0, 4095).astype(np.uint16)
+            else:
+                spectra = self._synthesize(pattern, key[0])
+            bank[key] = spectra
+        return spectra
+
+    # Errors and fault injection -------------------------------------------------
+
+    def simulateDisconnect(self):
+        """
+        From now on getRawData times out and reports an error, until the
+        device is opened again with initDevice.
+        """
+        self.connected = False
+
+    def getError(self, Message, StringSize):
+        code, message = self._error
+        self._error = (0, '')
+        Message.value = message.encode('utf-8')[:StringSize - 1]
+        return code
+
+    # Device, probe and processing ----------------------------------------------
+
+    def initDevice(self):
+        self.connected = True
+        return _Device()
+
+    def closeDevice(self, Dev):
+        Dev.pattern = None
+
+    def initProbe(self, Dev, ProbeFile):
+        name = ProbeFile.value if hasattr(ProbeFile, 'value') else ProbeFile
+        return _Probe(name)
+
+    def closeProbe(self, Probe):
+        pass
+
+    def setProbeParameterInt(self, Probe, Selection, Value):
+        if Selection == SR.ProbeParameterInt.Probe_Oversampling:
+            Probe.oversampling = max(int(Value), 1)
+        elif Selection == SR.ProbeParameterInt.Probe_Oversampling_SlowAxis:
+            Probe.oversamplingSlowAxis = max(int(Value), 1)
+
+    def createProcessingForDevice(self, Dev):
+        engine = SoftwareProcessing(self.wavelengths, background=self.reference)
+        return _Processing(engine)
+
+    def clearProcessing(self, Proc):
+        pass
+
+    def setDevicePreset(self, Dev, Category, Probe, Proc, Preset):
+        if int(Preset) in self.presetLineRates:
+            self.lineRate_Hz = float(self.presetLineRates[int(Preset)])
+
+    def setTriggerMode(self, Dev, TriggerMode):
+        Dev.triggerMode = TriggerMode
+
+    def setProcessingFlag(self, Proc, Flag, Value):
+        pass
+
+    def setProcessingParameterInt(self, Proc, Selection, Value):
+        if Selection == SR.ProcessingParameterInt.Processing_AScanAveraging:
+            Proc.aScanAveraging = max(int(Value), 1)
+
+    def getWavelengthAtPixel(self, Dev, Pixel):
+        return float(self.wavelengths[Pixel])
+
+    def getDevicePropertyFloat(self, Dev, Selection):
+        prop = SR.DevicePropertyFloat
+        values = {
+            prop.Device_zSpacing: self.zSpacing_mm,
+            prop.Device_zRange: self.zSpacing_mm*(self.numberOfPixels//2),
+            prop.Device_CenterWavelength_nm: self.centerWavelength_nm,
+            prop.Device_SpectralWidth_nm: self.spectralWidth_nm,
+            prop.Device_MaxTriggerFrequency_Hz: self.lineRate_Hz,
+        }
+        return float(values.get(Selection, 0.0))
+
+    # Scan patterns ---------------------------------------------------------------
+
+    def createNoScanPattern(self, Probe, Scans, NumberOfScans):
+        return _ScanPattern(Probe, np.zeros((NumberOfScans, Scans)), np.zeros(NumberOfScans))
+
+    def createBScanPattern(self, Probe, Range, AScans, apodization):
+        x = np.linspace(-Range/2, Range/2, AScans)
+        return _ScanPattern(Probe, x[np.newaxis], np.zeros(1))
+
+    def createVolumePattern(self, Probe, RangeX, SizeX, RangeY, SizeY,
+                            ApoType=None, AcqOrder=None):
+        x = np.linspace(-RangeX/2, RangeX/2, SizeX)
+        y = np.linspace(-RangeY/2, RangeY/2, SizeY)
+        acquireAll = AcqOrder == SR.ScanPatternAcquisitionOrder.ScanPattern_AcqOrderAll
+        return _ScanPattern(Probe, np.tile(x, (SizeY, 1)), y, acquireAll)
+
+    def createFreeformScanPattern(self, Probe, positions, size_x, size_y, apodization):
+        positions = np.asarray(positions, dtype=np.float64).reshape(size_y, size_x, 2)
+        # y of a freeform pattern varies along the B-scan, the mean is close enough
+        return _ScanPattern(Probe, positions[..., 0], positions[..., 1].mean(axis=1))
+
+    def rotateScanPattern(self, Pattern, Angle):
+        pass
+
+    def clearScanPattern(self, Pattern):
+        self._synthetic.pop(id(Pattern), None)
+
+    def expectedAcquisitionTime_s(self, ScanPattern, Dev):
+        lines = ScanPattern.aScans*ScanPattern.bScans*ScanPattern.probe.oversamplingSlowAxis
+        return lines/self.lineRate_Hz
+
+    # Acquisition -------------------------------------------------------------------
+
+    def startMeasurement(self, Dev, Pattern, Type):
+        # Synthesize up front so the first frames are not delayed
+        for bScan in range(min(Pattern.bScans, self.maxSyntheticBScans)):
+            for camera in range(self.cameras):
+                self._bScanSpectra(Pattern, bScan, camera)
+        with Dev.lock:
+            Dev.pattern = Pattern
+            Dev.acquisitionType = Type
+            Dev.delivered = [0]*self.cameras
+            Dev.startTime = time.perf_counter()
+
+    def stopMeasurement(self, Dev):
+        with Dev.lock:
+            Dev.pattern = None
+
+    def _frameTime(self, pattern):
+        return pattern.linesPerFrame/self.lineRate_Hz
+
+    def getRawData(self, Dev, RawData):
+        self._deliver(Dev, RawData, 0)
+
+    def getRawDataEx(self, Dev, RawData, CameraIdx):
+        if not 0 <= CameraIdx < self.cameras:
+            RawData.shape = (0, 0, 0)
+            RawData.pattern = None
+            self._error = (1, 'Camera %d does not exist' % CameraIdx)
+            return RawData
+        self._deliver(Dev, RawData, CameraIdx)
+        return RawData
+
+    def _deliver(self, Dev, RawData, camera):
+        # Every camera has its own buffer and frame counter on the same clock
+        if not self.connected:
+            if self.realTime:
+                time.sleep(self.triggerTimeout_s)
+            RawData.shape = (0, 0, 0)
+            RawData.pattern = None
+            self._error = (1, 'Timeout while waiting for data from the camera')
+            return
+        with Dev.lock:
+            pattern = Dev.pattern
+            if pattern is None:
+                return
+            frame = Dev.delivered[camera]
+            lost = 0
+            if self.realTime:
+                frameTime = self._frameTime(pattern)
+                elapsed = time.perf_counter() - Dev.startTime
+                ready = int(elapsed/frameTime)
+                if ready - frame > self.bufferFrames:
+                    lost = ready - frame - self.bufferFrames
+                    frame += lost
+                wait = Dev.startTime + (frame + 1)*frameTime - time.perf_counter()
+            Dev.delivered[camera] = frame + 1
+        if self.realTime and wait > 0:
+            time.sleep(wait)
+        RawData.shape = (self.numberOfPixels, pattern.aScans, pattern.bScansPerFrame)
+        RawData.pattern = pattern
+        RawData.frame = frame
+        RawData.lostFrames = lost
+        RawData.camera = camera
+        RawData.device = Dev
+
+    def createRawData(self):
+        return _RawData()
+
+    def clearRawData(self, RawData):
+        RawData.pattern = None
+
+    def getRawDataPropertyInt(self, RawData, Selection):
+        prop = SR.RawDataPropertyInt
+        size1, size2, size3 = RawData.shape
+        values = {
+            prop.RawData_Size1: size1,
+            prop.RawData_Size2: size2,
+            prop.RawData_Size3: size3,
+            prop.RawData_NumberOfElements: size1*size2*size3,
+            prop.RawData_SizeInBytes: 2*size1*size2*size3,
+            prop.RawData_BytesPerElement: 2,
+            prop.RawData_LostFrames: RawData.lostFrames,
+        }
+        return values[Selection]
+
+    def copyRawDataContent(self, RawDataSource, DataContent):
+        pattern = RawDataSource.pattern
+        if tuple(DataContent.shape) != RawDataSource.shape:
+            raise ValueError('PySpectralRadar: DataContent shape %s does not match RawData %s'
+                             % (DataContent.shape, RawDataSource.shape))
+        frames = scanOrderView(DataContent)
+        first = RawDataSource.frame*pattern.bScansPerFrame % pattern.bScans
+        for index in range(frames.shape[0]):
+            np.copyto(frames[index], self._bScanSpectra(pattern, (first + index) % pattern.bScans,
+                                                        RawDataSource.camera))
+
+    def _rawContent(self, RawData):
+        content = np.empty(RawData.shape, dtype=np.uint16)
+        self.copyRawDataContent(RawData, content)
+        return content
+
+    # Processing ----------------------------------------------------------------------
+
+    def createData(self):
+        return _Data()
+
+    def createComplexData(self):
+        return _Data()
+
+    def clearData(self, Data):
+        Data.content = None
+
+    def clearComplexData(self, ComplexData):
+        ComplexData.content = None
+
+    def setProcessedDataOutput(self, Proc, Scan):
+        Proc.dataOutput = Scan
+
+    def setComplexDataOutput(self, Proc, Complex):
+        Proc.complexOutput = Complex
+
+    def executeProcessing(self, Proc, RawData):
+        raw = self._rawContent(RawData)
+        if Proc.aScanAveraging > 1:
+            # Average each group of oversampled spectra into one A-scan
+            spectra = scanOrderView(raw)
+            spectra = spectra.reshape(spectra.shape[0], -1, Proc.aScanAveraging, spectra.shape[2]).mean(axis=2)
+            raw = spectra.reshape(spectra.shape[::-1])
+        if Proc.dataOutput is not None:
+            Proc.dataOutput.content = Proc.engine.processData(raw)
+        if Proc.complexOutput is not None:
+            Proc.complexOutput.content = Proc.engine.processComplex(raw)
+
+    def getDataPropertyInt(self, Data, Selection):
+        prop = SR.DataPropertyInt
+        content = Data.content
+        shape = content.shape if content is not None else (0, 0, 0)
+        itemsize = content.itemsize if content is not None else 0
+        values = {
+            prop.Data_Dimensions: sum(1 for size in shape if size > 1),
+            prop.Data_Size1: shape[0],
+            prop.Data_Size2: shape[1],
+            prop.Data_Size3: shape[2],
+            prop.Data_NumberOfElements: int(np.prod(shape)),
+            prop.Data_SizeInBytes: int(np.prod(shape))*itemsize,
+            prop.Data_BytesPerElement: itemsize,
+        }
+        return values[Selection]
+
+    def getComplexDataPropertyInt(self, Data, Selection):
+        return self.getDataPropertyInt(Data, Selection)
+
+    def copyComplexDataContent(self, ComplexDataSource, DataContent):
+        np.copyto(DataContent, ComplexDataSource.content)
+
+    def copyDataContent(self, DataSource, DataContent):
+        np.copyto(DataContent, DataSource.content)
+
+
+def useSimulatedBackend(**kwargs):
+    """
+    Creates a SimulatedSpectralRadar with the given keyword arguments and
+    routes all PySpectralRadar wrapper functions to it.
+
+    :return: the simulated backend
+    """
+    backend = SimulatedSpectralRadar(**kwargs)
+    SR.setBackend(backend)
+    return backend
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Pure NumPy SD-OCT processing, an alternative to the SpectralRadar
+executeProcessing call.
+
+Arrays follow the SDK convention used by copyRawDataContent and
+copyComplexDataContent: they are allocated with shape (Size1, Size2, Size3)
+and the SDK fills them with Size1 (spectral pixel / depth) running fastest.
+Outputs of SoftwareProcessing are laid out the same way, so they can be
+compared byte for byte with what the SDK copies out of a ComplexData or Data
+object. Use scanOrderView to index such an array as [BScan, AScan, Pixel].
+"""
+import copy
+import numpy as np
+
+
+def scanOrderView(data):
+    """
+    :param data: array filled by one of the SDK copy*Content functions, shape
+        (Size1, Size2, Size3)
+    :return: view of the same memory with shape (Size3, Size2, Size1), so that
+        view[bscan, ascan] is one spectrum or one A-scan
+    """
+    return data.reshape(data.shape[::-1])
+
+
+def hannWindow(n):
+    """
+    Periodic Hann window of length n as float32.
+    """
+    return (0.5 - 0.5*np.cos(2*np.pi*np.arange(n)/n)).astype(np.float32)
+
+
+class _Plan(object):
+    """
+    Everything that only depends on the number of spectral pixels and lines.
+    """
+    def __init__(self, numberOfLines, spectrum):
+        self.spectra = np.empty((numberOfLines, spectrum), dtype=np.float32)
+        self.linearized = np.empty((numberOfLines, spectrum), dtype=np.float32)
+        self.upper = np.empty((numberOfLines, spectrum), dtype=np.float32)
+        self.magnitude = np.empty((numberOfLines, spectrum//2), dtype=np.float32)
+        # Only allocated once dispersion compensation is used
+        self.compensated = None
+
+
+class SoftwareProcessing(object):
+    """
+    Batched background subtraction, k-linearization, apodization, FFT and
+    dB conversion of raw uint16 spectra.
+
+    Resampling indices and weights are built once from the per-pixel
+    wavelengths; work buffers are built once per raw data shape and reused
+    for every following frame of that shape.
+    """
+
+    def __init__(self, wavelengths, window=None, background=None, dispersion=None):
+        """
+        :param wavelengths: wavelength in nm of each spectrometer pixel, e.g.
+            from getWavelengthAtPixel
+        :param window: apodization window with one value per pixel, Hann if
+            None
+        :param background: spectrum subtracted from every line. If None the
+            mean spectrum of each processed frame is used, as with
+            Processing_RemoveDCSpectrum
+        :param dispersion: dispersion.DispersionCompensation applied to the
+            k-linear spectra before the FFT, or None
+        """
+        wavelengths = np.asarray(wavelengths, dtype=np.float64)
+        self.numberOfPixels = wavelengths.size
+        if window is None:
+            window = hannWindow(self.numberOfPixels)
+        self.window = np.asarray(window, dtype=np.float32)
+        self._buildResampling(wavelengths)
+        self.setBackground(background)
+        self.dispersion = dispersion
+        self._plans = {}
+
+    @classmethod
+    def fromDevice(cls, Dev, NumberOfPixels, **kwargs):
+        """
+        Builds the k-linearization from the spectrometer calibration of an
+        initialized device handle.
+        """
+        import PySpectralRadar as SR
+        wavelengths = [SR.getWavelengthAtPixel(Dev, pixel) for pixel in range(NumberOfPixels)]
+        return cls(wavelengths, **kwargs)
+
+    def clone(self):
+        """
+        Engine with the same resampling, window, background and dispersion
+        but its own work buffers, for processing on another thread.
+        """
+        engine = copy.copy(self)
+        engine._plans = {}
+        return engine
+
+    def _buildResampling(self, wavelengths):
+        n = self.numberOfPixels
+        k = 2*np.pi/wavelengths
+        order = np.argsort(k)
+        kSorted = k[order]
+        kLinear = np.linspace(kSorted[0], kSorted[-1], n)
+        position = np.interp(kLinear, kSorted, np.arange(n, dtype=np.float64))
+        lower = np.clip(np.floor(position).astype(np.intp), 0, n - 2)
+        fraction = position - lower
+        # Indices point into the pixel order of the camera
+        self._lower = order[lower]
+        self._upper = order[lower + 1]
+        self._weightLower = ((1 - fraction)*self.window).astype(np.float32)
+        self._weightUpper = (fraction*self.window).astype(np.float32)
+
+    def setBackground(self, background):
+        """
+        :param background: spectrum with one value per pixel, or None to
+            subtract the mean spectrum of each frame
+        """
+        if background is None:
+            self._background = None
+        else:
+            self._background = self._resample(np.asarray(background, dtype=np.float32)[np.newaxis])[0]
+
+    @property
+    def hasBackground(self):
+        """
+        False if the mean spectrum of each frame is subtracted.
+        """
+        return self._background is not None
+
+    def _resample(self, spectra, out=None, scratch=None):
+        """
+        Linear interpolation onto the uniform k grid, windowed.
+        """
+        out = np.take(spectra, self._lower, axis=1, out=out)
+        out *= self._weightLower
+        scratch = np.take(spectra, self._upper, axis=1, out=scratch)
+        scratch *= self._weightUpper
+        out += scratch
+        return out
+
+    def _plan(self, numberOfLines):
+        plan = self._plans.get(numberOfLines)
+        if plan is None:
+            plan = self._plans[numberOfLines] = _Plan(numberOfLines, self.numberOfPixels)
+        return plan
+
+    def _spectra(self, raw):
+        if raw.shape[0] != self.numberOfPixels:
+            raise ValueError('PySpectralRadar: raw data has %d pixels per spectrum, expected %d'
+                             % (raw.shape[0], self.numberOfPixels))
+        if not raw.flags.c_contiguous:
+            raw = np.ascontiguousarray(raw)
+        return raw.reshape(-1, self.numberOfPixels)
+
+    def linearize(self, raw):
+        """
+        :param raw: uint16 array filled by copyRawDataContent
+        :return: float32 array (lines, pixels) of background-subtracted,
+            k-linear, apodized spectra. The buffer is reused by the next call
+            with the same number of lines.
+        """
+        spectra = self._spectra(raw)
+        plan = self._plan(spectra.shape[0])
+        # The resampling is linear, so the background can be removed after it
+        np.copyto(plan.spectra, spectra)
+        linearized = self._resample(plan.spectra, out=plan.linearized, scratch=plan.upper)
+        if self._background is None:
+            linearized -= linearized.mean(axis=0)
+        else:
+            linearized -= self._background
+        return linearized
+
+    def tuneDispersion(self, raw, **options):
+        """
+        Finds the dispersion coefficients that give the sharpest image of raw
+        and compensates them from now on.
+
+        :param raw: uint16 array filled by copyRawDataContent, a B-scan of a
+            sample with structure
+        :param options: passed to dispersion.tuneDispersion
+        :return: the dispersion.DispersionCompensation in use
+        """
+        from dispersion import DispersionCompensation, tuneDispersion
+        a2, a3, _ = tuneDispersion(self.linearize(raw), **options)
+        self.dispersion = DispersionCompensation(self.numberOfPixels, a2, a3)
+        return self.dispersion
+
+    def _transform(self, raw):
+        linearized = self.linearize(raw)
+        if self.dispersion is None:
+            return np.fft.rfft(linearized, axis=1)[:, :self.numberOfPixels//2]
+        plan = self._plan(linearized.shape[0])
+        if plan.compensated is None:
+            plan.compensated = np.empty(linearized.shape, dtype=np.complex64)
+        compensated = self.dispersion.apply(linearized, out=plan.compensated)
+        return np.fft.fft(compensated, axis=1)[:, :self.numberOfPixels//2]
+
+    def _outputShape(self, raw):
+        return (self.numberOfPixels//2,) + raw.shape[1:]
+
+    def processComplex(self, raw, out=None):
+        """
+        Equivalent of executeProcessing with setComplexDataOutput.
+
+        :param raw: uint16 array filled by copyRawDataContent
+        :param out: optional complex64 array to write into
+        :return: complex64 array shaped like the one copyComplexDataContent
+            fills, (Size1 / 2, Size2, Size3)
+        """
+        spectrum = self._transform(raw)
+        if out is None:
+            out = np.empty(self._outputShape(raw), dtype=np.complex64)
+        np.copyto(scanOrderView(out).reshape(spectrum.shape), spectrum, casting='same_kind')
+        return out
+
+    def processData(self, raw, out=None):
+        """
+        Equivalent of executeProcessing with setProcessedDataOutput.
+
+        :param raw: uint16 array filled by copyRawDataContent
+        :param out: optional float32 array to write into
+        :return: float32 array of 20*log10 magnitudes in dB, shaped
+            (Size1 / 2, Size2, Size3)
+        """
+        spectrum = self._transform(raw)
+        plan = self._plan(spectrum.shape[0])
+        magnitude = np.abs(spectrum, out=plan.magnitude, casting='same_kind')
+        if out is None:
+            out = np.empty(self._outputShape(raw), dtype=np.float32)
+        dB = scanOrderView(out).reshape(magnitude.shape)
+        np.maximum(magnitude, np.finfo(np.float32).tiny, out=magnitude)
+        np.log10(magnitude, out=dB)
+        dB *= 20
+        return out
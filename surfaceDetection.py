@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized surface detection on processed OCT volumes, a NumPy replacement
+for the SDK's determineSurface that returns a depth map instead of a
+DataHandle.
+
+The volume is the float32 dB data copied out with copyDataContent, viewed in
+scan order (BScans, AScans, Depth), e.g. with
+softwareProcessing.scanOrderView.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _detectLines(lines, threshold_dB, thresholdBelowPeak_dB, peakWindow):
+    """
+    Subpixel surface position in pixels for a block of A-scans (lines,
+    depth), NaN where nothing exceeds the threshold.
+    """
+    depth = lines.shape[-1]
+    if thresholdBelowPeak_dB is not None:
+        threshold = lines.max(axis=-1, keepdims=True)
+        threshold -= thresholdBelowPeak_dB
+        np.maximum(threshold, threshold_dB, out=threshold)
+    else:
+        threshold = threshold_dB
+    above = lines > threshold
+    first = above.argmax(axis=-1)
+    found = above[np.arange(lines.shape[0]), first]
+
+    window = np.minimum(first[:, np.newaxis] + np.arange(peakWindow), depth - 1)
+    peak = first + np.take_along_axis(lines, window, axis=-1).argmax(axis=-1)
+
+    neighbours = np.clip(peak[:, np.newaxis] + np.arange(-1, 2), 0, depth - 1)
+    below, centre, after = np.take_along_axis(lines, neighbours, axis=-1).T
+    curvature = below - 2*centre + after
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(curvature < 0, 0.5*(below - after)/curvature, 0.0)
+    position = peak + np.clip(offset, -0.5, 0.5)
+    position[~found] = np.nan
+    return position
+
+
+def detectSurface(volume, zSpacing_mm, threshold_dB=None, thresholdAboveNoise_dB=15.0,
+                  thresholdBelowPeak_dB=30.0, startPixel=10, peakWindow=8, medianSize=0,
+                  workers=1, linesPerBlock=1024):
+    """
+    Per A-scan first-peak detection. The surface is the first maximum within
+    peakWindow pixels after the signal first rises above the threshold,
+    refined to subpixel precision by a parabola through the peak and its
+    neighbours.
+
+    A-scans are processed in blocks of linesPerBlock so temporaries stay in
+    cache; with workers > 1 the blocks are spread over a thread pool (NumPy
+    releases the GIL in these kernels).
+
+    :param volume: float32 dB array (..., Depth), e.g. (BScans, AScans, Depth)
+    :param zSpacing_mm: depth of one pixel in mm (Device_zSpacing)
+    :param threshold_dB: absolute threshold; if None the median of the
+        volume plus thresholdAboveNoise_dB is used
+    :param thresholdBelowPeak_dB: each A-scan's threshold is raised to at
+        least its maximum minus this, so sidelobes and the skirt of a strong
+        reflection are not taken for the surface. None to disable
+    :param startPixel: pixels near zero delay that are ignored (DC and
+        autocorrelation terms)
+    :param peakWindow: pixels searched for the peak after the first crossing
+    :param medianSize: size of the median filter applied to the depth map,
+        0 for none
+    :return: float32 depth map in mm with shape volume.shape[:-1], NaN where
+        no A-scan sample exceeds the threshold
+    """
+    volume = volume[..., startPixel:]
+    if threshold_dB is None:
+        # A sparse subsample estimates the noise floor well enough
+        sample = volume.reshape(-1, volume.shape[-1])[::7, ::13]
+        threshold_dB = float(np.median(sample)) + thresholdAboveNoise_dB
+    lines = volume.reshape(-1, volume.shape[-1])
+    surface = np.empty(lines.shape[0], dtype=np.float32)
+
+    def detect(start):
+        stop = start + linesPerBlock
+        surface[start:stop] = _detectLines(lines[start:stop], threshold_dB, thresholdBelowPeak_dB, peakWindow)
+
+    starts = range(0, lines.shape[0], linesPerBlock)
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(detect, starts))
+    else:
+        for start in starts:
+            detect(start)
+
+    surface += startPixel
+    surface *= zSpacing_mm
+    surface = surface.reshape(volume.shape[:-1])
+    if medianSize > 1:
+        surface = medianFilter(surface, medianSize)
+    return surface
+
+
+def medianFilter(depthMap, size=3):
+    """
+    size x size median over the last two axes of a depth map, ignoring NaN.
+    Edges are padded by replication.
+    """
+    pad = size//2
+    padded = np.pad(depthMap, [(0, 0)]*(depthMap.ndim - 2) + [(pad, size - 1 - pad)]*2, mode='edge')
+    windows = sliding_window_view(padded, (size, size), axis=(-2, -1))
+    windows = windows.reshape(windows.shape[:-2] + (size*size,))
+    if np.isnan(depthMap).any():
+        with np.errstate(invalid='ignore'):
+            return np.nanmedian(windows, axis=-1).astype(np.float32)
+    return np.median(windows, axis=-1).astype(np.float32)
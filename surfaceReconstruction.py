@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Dense surface reconstruction from sparse (compressive) surface scans.
+
+A sparse scan acquires a coarse grid, e.g. 128 x 25 A-scans instead of
+256 x 100, over the same area. reconstructSurface turns the sparse depth map
+(BScans, AScans) into a dense one, either by fast interpolation or by
+regularized recovery:
+
+    'bilinear'  separable bilinear interpolation
+    'rbf'       smoothing thin-plate spline through all valid samples
+    'tv'        total-variation regularized least squares
+    'dct'       l1-sparse, band-limited DCT coefficients (FISTA)
+
+Geometries are ScanGeometry tuples with the arguments of createVolumePattern.
+NaN samples (no surface found) are ignored by every method.
+"""
+from collections import namedtuple
+import time
+import numpy as np
+
+ScanGeometry = namedtuple('ScanGeometry', ('RangeX', 'SizeX', 'RangeY', 'SizeY'))
+
+
+def gridCoordinates(geometry):
+    """
+    :return: (x, y) positions in mm of the A-scans and B-scans of a volume
+        pattern, centred on the origin
+    """
+    x = np.linspace(-geometry.RangeX/2, geometry.RangeX/2, geometry.SizeX)
+    y = np.linspace(-geometry.RangeY/2, geometry.RangeY/2, geometry.SizeY)
+    return x, y
+
+
+def interpolationMatrix(source, target):
+    """
+    Matrix W with W @ f(source) = linear interpolation of f at target, for
+    sorted 1D source coordinates. Targets outside the source range take the
+    edge value.
+    """
+    matrix = np.zeros((target.size, source.size))
+    if source.size == 1:
+        matrix[:] = 1
+        return matrix
+    position = np.interp(target, source, np.arange(source.size))
+    lower = np.minimum(np.floor(position).astype(int), source.size - 2)
+    fraction = position - lower
+    rows = np.arange(target.size)
+    matrix[rows, lower] = 1 - fraction
+    matrix[rows, lower + 1] += fraction
+    return matrix
+
+
+class _SeparableSampling(object):
+    """
+    Bilinear sampling of a dense grid at the nodes of a sparse grid, and its
+    adjoint.
+    """
+    def __init__(self, sparseGeometry, denseGeometry):
+        sparseX, sparseY = gridCoordinates(sparseGeometry)
+        denseX, denseY = gridCoordinates(denseGeometry)
+        self.Ax = interpolationMatrix(denseX, sparseX)
+        self.Ay = interpolationMatrix(denseY, sparseY)
+        self.lipschitz = np.linalg.norm(self.Ax, 2)**2*np.linalg.norm(self.Ay, 2)**2
+
+    def forward(self, dense):
+        return self.Ay @ dense @ self.Ax.T
+
+    def adjoint(self, sparse):
+        return self.Ay.T @ sparse @ self.Ax
+
+
+def _bilinear(sparse, sparseGeometry, denseGeometry):
+    # Normalized interpolation: NaN samples get zero weight
+    valid = np.isfinite(sparse)
+    sparseX, sparseY = gridCoordinates(sparseGeometry)
+    denseX, denseY = gridCoordinates(denseGeometry)
+    Wx = interpolationMatrix(sparseX, denseX)
+    Wy = interpolationMatrix(sparseY, denseY)
+    values = Wy @ np.where(valid, sparse, 0) @ Wx.T
+    weights = Wy @ valid.astype(np.float64) @ Wx.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return values/weights
+
+
+def _thinPlate(a, b):
+    """
+    Thin-plate kernel r^2 log r between point sets a (n, 2) and b (m, 2).
+    """
+    r2 = (a*a).sum(axis=1)[:, np.newaxis] + (b*b).sum(axis=1)
+    r2 -= 2*(a @ b.T)
+    # r^2 log r -> 0 for r -> 0, clamping avoids log(0)
+    np.maximum(r2, 1e-30, out=r2)
+    kernel = np.log(r2)
+    kernel *= r2
+    kernel *= 0.5
+    return kernel
+
+
+def _rbf(sparse, sparseGeometry, denseGeometry, smoothing=1e-3, chunk=4096):
+    """
+    Smoothing thin-plate spline. Solving the dense (n + 3) x (n + 3) system
+    costs O(n^3) in the number of valid samples n, so this is the slowest
+    mode for grids beyond a few thousand samples.
+    """
+    sparseX, sparseY = gridCoordinates(sparseGeometry)
+    X, Y = np.meshgrid(sparseX, sparseY)
+    valid = np.isfinite(sparse)
+    points = np.column_stack((X[valid], Y[valid]))
+    values = sparse[valid]
+    n = points.shape[0]
+    polynomial = np.column_stack((np.ones(n), points))
+    system = np.zeros((n + 3, n + 3))
+    system[:n, :n] = _thinPlate(points, points) + smoothing*np.eye(n)
+    system[:n, n:] = polynomial
+    system[n:, :n] = polynomial.T
+    coefficients = np.linalg.solve(system, np.concatenate((values, np.zeros(3))))
+    weights, affine = coefficients[:n], coefficients[n:]
+
+    denseX, denseY = gridCoordinates(denseGeometry)
+    DX, DY = np.meshgrid(denseX, denseY)
+    targets = np.column_stack((DX.ravel(), DY.ravel()))
+    dense = np.empty(targets.shape[0])
+    # Evaluate in chunks, the full kernel matrix would be dense x sparse
+    for start in range(0, targets.shape[0], chunk):
+        block = targets[start:start + chunk]
+        dense[start:start + chunk] = _thinPlate(block, points) @ weights + affine[0] + block @ affine[1:]
+    return dense.reshape(DX.shape)
+
+
+def _gradient(u):
+    gx = np.zeros_like(u)
+    gy = np.zeros_like(u)
+    gx[:, :-1] = u[:, 1:] - u[:, :-1]
+    gy[:-1] = u[1:] - u[:-1]
+    return gx, gy
+
+
+def _divergence(px, py):
+    # Negative adjoint of _gradient
+    div = np.zeros_like(px)
+    div[:, :-1] += px[:, :-1]
+    div[:, 1:] -= px[:, :-1]
+    div[:-1] += py[:-1]
+    div[1:] -= py[:-1]
+    return div
+
+
+def _tv(sparse, sparseGeometry, denseGeometry, weight=1e-4, iterations=300):
+    """
+    min_u 0.5 ||A u - f||^2 + weight * TV(u), solved with the primal-dual
+    method of Condat and Vu starting from the bilinear interpolation.
+    """
+    sampling = _SeparableSampling(sparseGeometry, denseGeometry)
+    valid = np.isfinite(sparse)
+    target = np.where(valid, sparse, 0)
+    u = _filledBilinear(sparse, sparseGeometry, denseGeometry)
+    px = np.zeros_like(u)
+    py = np.zeros_like(u)
+    sigma = 1.0
+    tau = 0.99/(sampling.lipschitz/2 + 8*sigma)
+    for _ in range(iterations):
+        residual = np.where(valid, sampling.forward(u) - target, 0)
+        previous = u
+        u = u - tau*(sampling.adjoint(residual) - _divergence(px, py))
+        gx, gy = _gradient(2*u - previous)
+        px += sigma*gx
+        py += sigma*gy
+        # Project the dual variable onto the pointwise weight-ball
+        scale = np.maximum(1, np.hypot(px, py)/weight)
+        px /= scale
+        py /= scale
+    return u
+
+
+def _dctBasis(n, k):
+    """
+    (n, k) matrix whose columns are the first k orthonormal DCT-II basis
+    vectors of length n.
+    """
+    basis = np.cos(np.pi*np.arange(k)*(2*np.arange(n)[:, np.newaxis] + 1)/(2*n))*np.sqrt(2.0/n)
+    basis[:, 0] /= np.sqrt(2)
+    return basis
+
+
+def _dctSparse(sparse, sparseGeometry, denseGeometry, weight=1e-4, iterations=50):
+    """
+    Band-limited sparse recovery in the DCT domain:
+
+        min_c 0.5 ||A(By c Bx^T) - f||^2 + weight * m * ||c||_1
+
+    over the lowest SparseSizeY x SparseSizeX DCT coefficients c, with By and
+    Bx the DCT basis vectors of the dense grid, solved with
+    FISTA. m is the largest AC coefficient of the starting point, the DC
+    coefficient is not penalized. A regular grid is coherent with the DCT,
+    so coefficients beyond the sparse grid's own band would only be aliases
+    and are kept at zero.
+
+    The sampled band is separable, A(By c Bx^T) = (Ay By) c (Ax Bx)^T with
+    small matrices, so the iterations need no FFTs.
+    """
+    sampling = _SeparableSampling(sparseGeometry, denseGeometry)
+    valid = np.isfinite(sparse)
+    target = np.where(valid, sparse, 0)
+    By = _dctBasis(denseGeometry.SizeY, min(sparseGeometry.SizeY, denseGeometry.SizeY))
+    Bx = _dctBasis(denseGeometry.SizeX, min(sparseGeometry.SizeX, denseGeometry.SizeX))
+    My = sampling.Ay @ By
+    Mx = sampling.Ax @ Bx
+    step = 1.0/(np.linalg.norm(My, 2)**2*np.linalg.norm(Mx, 2)**2)
+
+    coefficients = By.T @ _filledBilinear(sparse, sparseGeometry, denseGeometry) @ Bx
+    magnitude = np.abs(coefficients)
+    magnitude[0, 0] = 0
+    threshold = step*weight*magnitude.max()
+    momentum = coefficients.copy()
+    t = 1.0
+    for _ in range(iterations):
+        residual = np.where(valid, My @ momentum @ Mx.T - target, 0)
+        update = momentum - step*(My.T @ residual @ Mx)
+        dc = update[0, 0]
+        update = np.sign(update)*np.maximum(np.abs(update) - threshold, 0)
+        update[0, 0] = dc
+        tNext = (1 + np.sqrt(1 + 4*t*t))/2
+        momentum = update + ((t - 1)/tNext)*(update - coefficients)
+        coefficients, t = update, tNext
+    return By @ coefficients @ Bx.T
+
+
+def _filledBilinear(sparse, sparseGeometry, denseGeometry):
+    dense = _bilinear(sparse, sparseGeometry, denseGeometry)
+    if np.isnan(dense).any():
+        dense = np.where(np.isnan(dense), np.nanmean(dense), dense)
+    return dense
+
+
+_METHODS = {
+    'bilinear': _bilinear,
+    'rbf': _rbf,
+    'tv': _tv,
+    'dct': _dctSparse,
+}
+
+
+def reconstructSurface(sparse, sparseGeometry, denseGeometry, method='bilinear', **options):
+    """
+    :param sparse: depth map (SparseSizeY, SparseSizeX) in mm, e.g. from
+        surfaceDetection.detectSurface
+    :param sparseGeometry: ScanGeometry the sparse map was acquired with
+    :param denseGeometry: ScanGeometry of the output grid
+    :param method: 'bilinear', 'rbf', 'tv' or 'dct'
+    :param options: method parameters, e.g. weight and iterations for 'tv'
+        and 'dct', smoothing for 'rbf'
+    :return: float32 depth map (DenseSizeY, DenseSizeX) in mm
+    """
+    sparse = np.asarray(sparse, dtype=np.float64)
+    if sparse.shape != (sparseGeometry.SizeY, sparseGeometry.SizeX):
+        raise ValueError('PySpectralRadar: sparse surface shape %s does not match geometry %s'
+                         % (sparse.shape, (sparseGeometry.SizeY, sparseGeometry.SizeX)))
+    return _METHODS[method](sparse, sparseGeometry, denseGeometry, **options).astype(np.float32)
+
+
+def sampleSurface(dense, denseGeometry, sparseGeometry):
+    """
+    Bilinearly samples a dense depth map at the nodes of a sparse geometry,
+    i.e. simulates a sparse scan of a known surface.
+    """
+    return _SeparableSampling(sparseGeometry, denseGeometry).forward(np.asarray(dense, dtype=np.float64))
+
+
+def benchmarkReconstruction(reference, denseGeometry, sparseGeometry,
+                            methods=('bilinear', 'rbf', 'tv', 'dct'), repeats=3):
+    """
+    Samples the reference surface on the sparse geometry, reconstructs it
+    with each method and compares against the reference.
+
+    :return: list of dicts with method, rmse_mm, maxError_mm and time_s (best
+        of repeats)
+    """
+    sparse = sampleSurface(reference, denseGeometry, sparseGeometry)
+    results = []
+    for method in methods:
+        best = np.inf
+        for _ in range(repeats):
+            start = time.perf_counter()
+            dense = reconstructSurface(sparse, sparseGeometry, denseGeometry, method)
+            best = min(best, time.perf_counter() - start)
+        error = dense - reference
+        results.append({
+            'method': method,
+            'rmse_mm': float(np.sqrt(np.nanmean(error**2))),
+            'maxError_mm': float(np.nanmax(np.abs(error))),
+            'time_s': best,
+        })
+    return results
+
+
+def main():
+    from simulatedDevice import SimulatedSpectralRadar
+
+    denseGeometry = ScanGeometry(10.0, 256, 10.0, 100)
+    sparseGeometry = ScanGeometry(10.0, 128, 10.0, 25)
+    x, y = gridCoordinates(denseGeometry)
+    reference = SimulatedSpectralRadar().surfaceDepth_mm(x[np.newaxis], y[:, np.newaxis])
+
+    print('method      rmse [um]   max [um]   time [ms]')
+    for result in benchmarkReconstruction(reference, denseGeometry, sparseGeometry):
+        print('%-10s %10.3f %10.3f %11.2f' % (result['method'], 1e3*result['rmse_mm'],
+                                              1e3*result['maxError_mm'], 1e3*result['time_s']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from averaging import FrameAverager
+
+
+def test_switch_from_cumulative_to_window():
+    averager = FrameAverager((3, 8), depth=None, maxDepth=4)
+    for _ in range(3):
+        averager.add(np.full((3, 8), 100.0))
+    averager.setDepth(2)
+    for _ in range(5):
+        averager.add(np.ones((3, 8)))
+    assert averager.count == 2
+    np.testing.assert_allclose(averager.mean(), 1.0)
+    np.testing.assert_allclose(averager.median(), 1.0)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Live throughput and frame-loss monitoring for continuous acquisition.
+
+ThroughputMonitor is updated once per getRawData with the frame's
+RawData_LostFrames. It keeps a rolling window of frame times, compares the
+achieved frame and A-line rate with what expectedAcquisitionTime_s promises
+for the pattern, and calls back when the deficit crosses a threshold (and
+again when it recovers), which shows USB or camera starvation while it
+happens:
+
+    monitor = ThroughputMonitor.fromPattern(Pattern, Dev, onDeficit=warn)
+    while running:
+        getRawData(Dev, RawData)
+        monitor.update(getRawDataPropertyInt(RawData, RawDataPropertyInt.RawData_LostFrames))
+
+AcquisitionStream takes a monitor and updates it from its producer thread.
+"""
+import time
+import numpy as np
+
+import PySpectralRadar as SR
+
+
+class ThroughputMonitor(object):
+    """
+    Rolling-window frame rate, A-line rate and frame loss. update is O(1)
+    and does not allocate.
+
+    A window is in deficit when the delivered frame rate is more than
+    deficitThreshold below the expected one, or when more than
+    lossThreshold of the frames the device produced in the window were lost.
+    """
+
+    def __init__(self, expectedFrameTime_s, linesPerFrame=None, window=256, deficitThreshold=0.1,
+                 lossThreshold=0.0, minFrames=16, onDeficit=None, onRecovered=None):
+        """
+        :param expectedFrameTime_s: time one getRawData frame should take
+        :param linesPerFrame: A-scans per frame for the A-line rate, can also
+            be passed to update
+        :param window: frames in the rolling window
+        :param deficitThreshold: tolerated relative shortfall of the frame rate
+        :param lossThreshold: tolerated fraction of lost frames in the window
+        :param minFrames: frames needed in the window before it is evaluated
+        :param onDeficit: called with stats() when the window enters deficit
+        :param onRecovered: called with stats() when it leaves deficit
+        """
+        self.expectedFrameTime_s = float(expectedFrameTime_s)
+        self.linesPerFrame = linesPerFrame
+        self.window = window
+        self.deficitThreshold = deficitThreshold
+        self.lossThreshold = lossThreshold
+        self.minFrames = max(minFrames, 2)
+        self.onDeficit = onDeficit
+        self.onRecovered = onRecovered
+        self._times = np.zeros(window)
+        self._lost = np.zeros(window, dtype=np.int64)
+        self.reset()
+
+    @classmethod
+    def fromPattern(cls, Pattern, Dev, framesPerPattern=1, **kwargs):
+        """
+        Expected frame time from expectedAcquisitionTime_s of the active
+        pattern and device preset.
+
+        :param framesPerPattern: getRawData frames per pass of the pattern,
+            e.g. the number of B-scans when acquiring frame by frame
+        """
+        return cls(SR.expectedAcquisitionTime_s(Pattern, Dev)/framesPerPattern, **kwargs)
+
+    def reset(self):
+        """
+        Clears the window and the totals.
+        """
+        self._times[:] = 0
+        self._lost[:] = 0
+        self._count = 0
+        self._windowLost = 0
+        self.totalFrames = 0
+        self.totalLost = 0
+        self.startTime = None
+        self.inDeficit = False
+        self.deficitEvents = 0
+
+    def update(self, lostFrames=0, timestamp=None, linesPerFrame=None):
+        """
+        Records one delivered frame.
+
+        :param lostFrames: RawData_LostFrames of the frame
+        :param timestamp: time.perf_counter() when the frame arrived, now if
+            None
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        if linesPerFrame is not None:
+            self.linesPerFrame = linesPerFrame
+        if self.startTime is None:
+            self.startTime = timestamp
+        slot = self._count % self.window
+        self._windowLost += lostFrames - self._lost[slot]
+        self._times[slot] = timestamp
+        self._lost[slot] = lostFrames
+        self._count += 1
+        self.totalFrames += 1
+        self.totalLost += int(lostFrames)
+        if self._count >= self.minFrames:
+            self._evaluate()
+
+    def _windowRate(self):
+        frames = min(self._count, self.window)
+        if frames < 2:
+            return 0.0, frames
+        newest = self._times[(self._count - 1) % self.window]
+        oldest = self._times[(self._count - frames) % self.window]
+        elapsed = float(newest - oldest)
+        return ((frames - 1)/elapsed if elapsed > 0 else 0.0), frames
+
+    def _windowLossRate(self, frames):
+        # Lost frames reported with the oldest frame happened before the window
+        lost = int(self._windowLost - self._lost[(self._count - frames) % self.window])
+        produced = frames - 1 + lost
+        return lost/produced if produced > 0 else 0.0
+
+    def _deficit(self):
+        rate, frames = self._windowRate()
+        expected = 1.0/self.expectedFrameTime_s
+        return 1.0 - rate/expected, self._windowLossRate(frames)
+
+    def _evaluate(self):
+        deficit, lossRate = self._deficit()
+        starving = deficit > self.deficitThreshold or lossRate > self.lossThreshold
+        if starving and not self.inDeficit:
+            self.inDeficit = True
+            self.deficitEvents += 1
+            if self.onDeficit is not None:
+                self.onDeficit(self.stats())
+        elif not starving and self.inDeficit:
+            self.inDeficit = False
+            if self.onRecovered is not None:
+                self.onRecovered(self.stats())
+
+    def stats(self):
+        """
+        :return: dict with the rolling-window framesPerSecond, aLineRate_Hz,
+            deficit (relative shortfall of the frame rate) and lossRate,
+            their expected values, and the run totals
+        """
+        rate, frames = self._windowRate()
+        expectedRate = 1.0/self.expectedFrameTime_s
+        lines = self.linesPerFrame
+        return {
+            'framesPerSecond': rate,
+            'expectedFramesPerSecond': expectedRate,
+            'aLineRate_Hz': rate*lines if lines else None,
+            'expectedALineRate_Hz': expectedRate*lines if lines else None,
+            'deficit': 1.0 - rate/expectedRate,
+            'lossRate': self._windowLossRate(frames) if frames else 0.0,
+            'windowFrames': frames,
+            'totalFrames': self.totalFrames,
+            'totalLost': self.totalLost,
+            'elapsed_s': 0.0 if self.startTime is None else
+            float(self._times[(self._count - 1) % self.window] - self.startTime),
+            'inDeficit': self.inDeficit,
+            'deficitEvents': self.deficitEvents,
+        }
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Streams frames straight into a preallocated memory-mapped file, so long
+recordings never hold more than the frames in flight in memory.
+
+Recordings are stored in scan order, shape (Frames, BScans, AScans, Pixels)
+for the frames returned by getRawData / copyRawDataContent, which is the
+memory layout the SDK copies out; no reordering happens on write. Two
+formats are supported:
+
+    'npy'   a .npy file, readable with numpy.load(path, mmap_mode='r')
+    'raw'   headerless binary file
+
+Either way a JSON sidecar (path + '.json') records shape, dtype, the number of
+frames written so far and any user metadata. The file can be opened with
+openRecording while it is still being written.
+"""
+import json
+import os
+import numpy as np
+
+import PySpectralRadar as SR
+from softwareProcessing import scanOrderView
+
+
+def _sidecarPath(path):
+    return path + '.json'
+
+
+class VolumeRecorder(object):
+    """
+    Preallocates numberOfFrames frames of frameShape on disk and copies
+    frames into consecutive slices as they arrive.
+    """
+
+    def __init__(self, path, frameShape, dtype, numberOfFrames, format='npy',
+                 metadata=None, flushEvery=16):
+        """
+        :param path: file to create
+        :param frameShape: SDK shape of one frame, (Size1, Size2, Size3)
+        :param dtype: numpy.uint16 for raw data, numpy.complex64 for complex
+            data, numpy.float32 for processed data
+        :param numberOfFrames: frames to preallocate
+        :param format: 'npy' or 'raw'
+        :param metadata: dict stored in the sidecar, e.g. scan geometry
+        :param flushEvery: frames between updates of the sidecar frame count
+        """
+        self.path = path
+        self.frameShape = tuple(int(size) for size in frameShape)
+        self.dtype = np.dtype(dtype)
+        self.shape = (int(numberOfFrames),) + self.frameShape[::-1]
+        self.format = format
+        self.metadata = dict(metadata or {})
+        self.flushEvery = flushEvery
+        self.framesWritten = 0
+        if format == 'npy':
+            self._array = np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype, shape=self.shape)
+        elif format == 'raw':
+            self._array = np.memmap(path, mode='w+', dtype=self.dtype, shape=self.shape)
+        else:
+            raise ValueError("PySpectralRadar: unknown recording format '%s'" % format)
+        self._writeSidecar()
+
+    @classmethod
+    def forRawData(cls, path, RawData, numberOfFrames, **kwargs):
+        """
+        Recorder sized for the frames currently described by a RawDataHandle.
+        """
+        return cls(path, SR.getRawDataShape(RawData), np.uint16, numberOfFrames, **kwargs)
+
+    @classmethod
+    def forComplexData(cls, path, ComplexData, numberOfFrames, **kwargs):
+        """
+        Recorder sized for the frames currently described by a
+        ComplexDataHandle.
+        """
+        prop = SR.DataPropertyInt
+        shape = [SR.getComplexDataPropertyInt(ComplexData, size)
+                 for size in (prop.Data_Size1, prop.Data_Size2, prop.Data_Size3)]
+        return cls(path, shape, np.complex64, numberOfFrames, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def full(self):
+        return self.framesWritten >= self.shape[0]
+
+    def _nextSlice(self):
+        if self._array is None:
+            raise ValueError('PySpectralRadar: recording is closed')
+        if self.full:
+            raise IndexError('PySpectralRadar: recording holds only %d frames' % self.shape[0])
+        return self._array[self.framesWritten]
+
+    def _advance(self):
+        self.framesWritten += 1
+        if self.flushEvery and self.framesWritten % self.flushEvery == 0:
+            self.flush()
+
+    def write(self, frame):
+        """
+        Copies one frame, as filled by a copy*Content function, into the next
+        slice of the file.
+        """
+        np.copyto(self._nextSlice(), scanOrderView(frame).reshape(self.shape[1:]), casting='same_kind')
+        self._advance()
+
+    def copyRawData(self, RawData):
+        """
+        Copies the content of a RawDataHandle directly into the next slice of
+        the file.
+        """
+        SR.copyRawDataContent(RawData, self._nextSlice().reshape(self.frameShape))
+        self._advance()
+
+    def copyComplexData(self, ComplexData):
+        """
+        Copies the content of a ComplexDataHandle directly into the next slice
+        of the file.
+        """
+        SR.copyComplexDataContent(ComplexData, self._nextSlice().reshape(self.frameShape))
+        self._advance()
+
+    def _writeSidecar(self):
+        sidecar = {
+            'format': self.format,
+            'dtype': self.dtype.str,
+            'shape': list(self.shape),
+            'frameShape': list(self.frameShape),
+            'framesWritten': self.framesWritten,
+            'metadata': self.metadata,
+        }
+        temporary = _sidecarPath(self.path) + '.tmp'
+        with open(temporary, 'w') as sidecarFile:
+            json.dump(sidecar, sidecarFile, indent=1)
+        os.replace(temporary, _sidecarPath(self.path))
+
+    def flush(self):
+        """
+        Writes dirty pages to disk and publishes the frame count.
+        """
+        if self._array is not None:
+            self._array.flush()
+            self._writeSidecar()
+
+    def close(self):
+        if self._array is not None:
+            self.flush()
+            # The mapping is released with the last reference to it
+            self._array = None
+
+
+def openRecording(path, writtenOnly=True):
+    """
+    Memory-maps a recording read-only. Nothing is read until it is sliced.
+
+    :param writtenOnly: return only the frames written so far according to
+        the sidecar
+    :return: (array, sidecar dict)
+    """
+    with open(_sidecarPath(path)) as sidecarFile:
+        sidecar = json.load(sidecarFile)
+    if sidecar['format'] == 'npy':
+        array = np.load(path, mmap_mode='r')
+    else:
+        array = np.memmap(path, mode='r', dtype=np.dtype(sidecar['dtype']), shape=tuple(sidecar['shape']))
+    if writtenOnly:
+        array = array[:sidecar['framesWritten']]
+    return array, sidecar